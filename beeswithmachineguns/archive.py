@@ -0,0 +1,412 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import json
+import math
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import time
+import zlib
+
+import histogram
+import search as capacity
+
+ARCHIVE_DIR = os.path.expanduser('~/.bees-runs')
+MAGIC = 'BEESRUN1'
+
+# A run is saved as MAGIC, a 4-byte big-endian header length, a JSON header
+# and then one zlib-compressed array of little-endian doubles per column.
+# The header holds the run's parameters, metadata and summary, and where
+# each column starts, so listing hundreds of runs only reads their headers.
+
+BEE_COLUMNS = ('bee', 'status', 'complete_requests', 'failed_requests', 'non_2xx_responses', 'requests_per_second', 'ms_per_request', 'concurrent_requests')
+BEE_STATUSES = ('complete', 'timeout', 'exception')
+TELEMETRY_COLUMNS = ('cpu_busy', 'cpu_steal', 'net_mbps', 'tcp_inuse_max', 'tcp_tw_max')
+
+# Two-sided critical values for the tests compare() runs, at 1% significance
+KS_CRITICAL = 1.628
+Z_CRITICAL = 2.576
+
+# Student's t at 1% significance, two-sided, by degrees of freedom; it
+# tends to Z_CRITICAL as they grow
+T_CRITICAL = (
+    (1, 63.657), (2, 9.925), (3, 5.841), (4, 4.604), (5, 4.032), (6, 3.707), (7, 3.499), (8, 3.355), (9, 3.250), (10, 3.169),
+    (11, 3.106), (12, 3.055), (13, 3.012), (14, 2.977), (15, 2.947), (16, 2.921), (17, 2.898), (18, 2.878), (19, 2.861), (20, 2.845),
+    (21, 2.831), (22, 2.819), (23, 2.807), (24, 2.797), (25, 2.787), (26, 2.779), (27, 2.771), (28, 2.763), (29, 2.756), (30, 2.750),
+    (40, 2.704), (60, 2.660), (120, 2.617),
+)
+
+def _git_metadata():
+    metadata = {}
+
+    for key, command in (('git_commit', ['git', 'rev-parse', 'HEAD']), ('git_describe', ['git', 'describe', '--always', '--dirty'])):
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            output = process.communicate()[0].strip()
+        except OSError:
+            continue
+
+        if process.returncode == 0:
+            metadata[key] = output
+
+    return metadata
+
+def _pack(values):
+    column = array('d', values)
+
+    if sys.byteorder == 'big':
+        column.byteswap()
+
+    return zlib.compress(column.tostring())
+
+def _unpack(data):
+    column = array('d')
+    column.fromstring(zlib.decompress(data))
+
+    if sys.byteorder == 'big':
+        column.byteswap()
+
+    return column
+
+def _bee_columns(results):
+    columns = dict((name, []) for name in BEE_COLUMNS)
+    columns.update(histogram_bee=[], histogram_bucket=[], histogram_count=[])
+    columns.update(('telemetry_' + name, []) for name in TELEMETRY_COLUMNS)
+
+    for i, result in enumerate(results):
+        if result is None:
+            status, result = 'timeout', {}
+        elif isinstance(result, socket.error):
+            status, result = 'exception', {}
+        else:
+            status = 'complete'
+
+        columns['bee'].append(i)
+        columns['status'].append(BEE_STATUSES.index(status))
+
+        for name in BEE_COLUMNS[2:]:
+            columns[name].append(result.get(name, 0))
+
+        for name in TELEMETRY_COLUMNS:
+            columns['telemetry_' + name].append(result.get('telemetry', {}).get(name, 0))
+
+        for bucket, count in sorted(result.get('latency_histogram', {}).items()):
+            columns['histogram_bee'].append(i)
+            columns['histogram_bucket'].append(bucket)
+            columns['histogram_count'].append(count)
+
+    return columns
+
+def save(results, parameters, summary, series=None, directory=ARCHIVE_DIR, timeline=None):
+    """
+    Archive an attack's raw per-bee results, its live per-second series and
+    its swarm-wide timeline (dicts of columns, if there are any), its
+    parameters and summary, and where and from what code it was run.
+    Returns the path of the archive.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    created_at = time.time()
+    run_id = '%s-%04x' % (time.strftime('%Y%m%d-%H%M%S', time.localtime(created_at)), random.getrandbits(16))
+
+    columns = _bee_columns(results)
+
+    for name, values in (series or {}).items():
+        columns['series_' + name] = values
+
+    for name, values in (timeline or {}).items():
+        columns['timeline_' + name] = values
+
+    data = []
+    directory_entries = {}
+    offset = 0
+
+    for name in sorted(columns):
+        packed = _pack(columns[name])
+        directory_entries[name] = [offset, len(packed)]
+        data.append(packed)
+        offset += len(packed)
+
+    latency_histogram = summary['latency_histogram']
+
+    header = {
+        'run_id': run_id,
+        'created_at': created_at,
+        'hostname': socket.gethostname(),
+        'parameters': parameters,
+        'summary': dict((key, value) for key, value in summary.items() if key != 'latency_histogram'),
+        'percentiles': dict(('%s' % percent, histogram.percentile(latency_histogram, percent)) for percent in histogram.PERCENTILES),
+        'columns': directory_entries,
+    }
+    header.update(_git_metadata())
+
+    encoded = json.dumps(header)
+    path = os.path.join(directory, '%s.bees' % run_id)
+
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('>I', len(encoded)))
+        f.write(encoded)
+
+        for packed in data:
+            f.write(packed)
+
+    os.rename(path + '.tmp', path)
+
+    return path
+
+def load(path, columns=()):
+    """
+    Read a run's header and whichever of its columns are asked for.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a bees run archive.' % path)
+
+        length = struct.unpack('>I', f.read(4))[0]
+        header = json.loads(f.read(length))
+        start = len(MAGIC) + 4 + length
+
+        loaded = {}
+
+        for name in columns:
+            if name not in header['columns']:
+                continue
+
+            offset, size = header['columns'][name]
+            f.seek(start + offset)
+            loaded[name] = _unpack(f.read(size))
+
+    return header, loaded
+
+def runs(directory=ARCHIVE_DIR):
+    """
+    Return (path, header) for every archived run, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+
+    found = []
+
+    for name in os.listdir(directory):
+        if name.endswith('.bees'):
+            path = os.path.join(directory, name)
+            found.append((path, load(path)[0]))
+
+    return sorted(found, key=lambda run: run[1]['created_at'])
+
+def find(name, directory=ARCHIVE_DIR):
+    """
+    Return the path of a run given its path or its run ID.
+    """
+    if os.path.isfile(name):
+        return name
+
+    path = os.path.join(directory, '%s.bees' % name)
+
+    if os.path.isfile(path):
+        return path
+
+    return None
+
+def capacities(instance_ids, directory=ARCHIVE_DIR):
+    """
+    Return the requests per second per connection each bee managed in the
+    latest run it completed, by instance ID, for those that have one.
+    """
+    wanted = set(instance_ids)
+    found = {}
+
+    for path, header in reversed(runs(directory)):
+        run_ids = header['parameters'].get('instance_ids', [])
+
+        if not wanted.intersection(run_ids):
+            continue
+
+        header, columns = load(path, ('bee', 'status', 'requests_per_second', 'concurrent_requests'))
+        concurrent_requests = columns.get('concurrent_requests')
+
+        for j, bee in enumerate(columns.get('bee', [])):
+            instance_id = run_ids[int(bee)]
+
+            if instance_id not in wanted or instance_id in found or BEE_STATUSES[int(columns['status'][j])] != 'complete':
+                continue
+
+            rate = columns['requests_per_second'][j]
+
+            # Runs archived before bees' connections were recorded
+            if concurrent_requests and concurrent_requests[j]:
+                rate /= concurrent_requests[j]
+
+            found[instance_id] = rate
+
+        if len(found) == len(wanted):
+            break
+
+    return found
+
+def latency_histogram(path):
+    """
+    Return the merged latency histogram of every bee in a run.
+    """
+    header, columns = load(path, ('histogram_bucket', 'histogram_count'))
+    merged = {}
+
+    for bucket, count in zip(columns.get('histogram_bucket', []), columns.get('histogram_count', [])):
+        merged[int(bucket)] = merged.get(int(bucket), 0) + int(count)
+
+    return merged
+
+def _ks_statistic(a, b):
+    """
+    Return the largest gap between the cumulative distributions of two
+    histograms.
+    """
+    total_a, total_b = float(histogram.count(a)), float(histogram.count(b))
+    seen_a, seen_b = 0, 0
+    largest = 0.0
+
+    for bucket in sorted(set(a) | set(b)):
+        seen_a += a.get(bucket, 0)
+        seen_b += b.get(bucket, 0)
+        largest = max(largest, abs(seen_a / total_a - seen_b / total_b))
+
+    return largest
+
+def _welch(a, b):
+    """
+    Return Welch's t statistic for the difference in the means of a and b,
+    and its degrees of freedom by the Welch-Satterthwaite equation.
+    """
+    mean_a, mean_b = sum(a) / len(a), sum(b) / len(b)
+    error_a = sum([(x - mean_a) ** 2 for x in a]) / (len(a) - 1) / len(a)
+    error_b = sum([(x - mean_b) ** 2 for x in b]) / (len(b) - 1) / len(b)
+
+    if not error_a + error_b:
+        return 0.0, len(a) + len(b) - 2
+
+    freedom = (error_a + error_b) ** 2 / (error_a ** 2 / (len(a) - 1) + error_b ** 2 / (len(b) - 1))
+
+    return (mean_a - mean_b) / math.sqrt(error_a + error_b), freedom
+
+def _t_critical(freedom):
+    """
+    Return the critical value of Student's t for freedom degrees of freedom,
+    taken at the nearest tabulated number below, which errs on the side of
+    finding nothing.
+    """
+    critical = T_CRITICAL[0][1]
+
+    for tabulated, value in T_CRITICAL:
+        if tabulated <= freedom:
+            critical = value
+
+    return critical
+
+def _completed_rates(path):
+    header, columns = load(path, ('status', 'requests_per_second'))
+
+    return [rate for status, rate in zip(columns['status'], columns['requests_per_second']) if status == 0]
+
+def compare(candidate, baseline, tolerance=0.1):
+    """
+    Compare two archived runs and return the rows of the comparison, the
+    regressions found, and the changes too big to tolerate that couldn't be
+    tested either way.
+
+    Latency regresses when the two latency distributions differ significantly
+    (a Kolmogorov-Smirnov test) and a percentile got more than tolerance
+    worse. Throughput regresses when it drops by more than tolerance and the
+    per-bee rates differ significantly (a Welch t-test); with fewer than two
+    completed bees in either run the drop is inconclusive. The error rate
+    regresses when it rises significantly (a two-proportion z-test) by more
+    than tolerance of the baseline rate, or a tenth of a percent.
+    """
+    candidate_header = load(candidate)[0]
+    baseline_header = load(baseline)[0]
+    candidate_histogram = latency_histogram(candidate)
+    baseline_histogram = latency_histogram(baseline)
+
+    rows = []
+    regressions = []
+    inconclusive = []
+
+    def row(label, old, new, higher_is_worse):
+        change = None
+
+        if old:
+            change = (new - old) / float(old)
+
+        rows.append((label, old, new, change))
+
+        if change is None:
+            return False
+
+        return change > tolerance if higher_is_worse else change < -tolerance
+
+    if row('Requests per second', baseline_header['summary']['requests_per_second'], candidate_header['summary']['requests_per_second'], False):
+        candidate_rates, baseline_rates = _completed_rates(candidate), _completed_rates(baseline)
+
+        if len(candidate_rates) < 2 or len(baseline_rates) < 2:
+            inconclusive.append('Throughput dropped by more than %i%%, but too few bees completed to tell if it was chance.' % (tolerance * 100))
+        else:
+            statistic, freedom = _welch(candidate_rates, baseline_rates)
+
+            if statistic < -_t_critical(freedom):
+                regressions.append('Throughput dropped by more than %i%% (Welch t-test, p < 0.01).' % (tolerance * 100))
+
+    n, m = histogram.count(candidate_histogram), histogram.count(baseline_histogram)
+
+    if n and m:
+        distance = _ks_statistic(candidate_histogram, baseline_histogram)
+        significant = distance > KS_CRITICAL * math.sqrt(float(n + m) / (n * m))
+
+        for percent in histogram.PERCENTILES:
+            label = '%s%% response time' % percent
+            worse = row(label, histogram.percentile(baseline_histogram, percent), histogram.percentile(candidate_histogram, percent), True)
+
+            if worse and significant:
+                regressions.append('%s is more than %i%% worse (KS distance %.3f, p < 0.01).' % (label, tolerance * 100, distance))
+
+    old_errors, new_errors = capacity.error_rate(baseline_header['summary']), capacity.error_rate(candidate_header['summary'])
+    rows.append(('Error rate', old_errors, new_errors, new_errors - old_errors))
+
+    old_total, new_total = baseline_header['summary']['complete_requests'], candidate_header['summary']['complete_requests']
+
+    if old_total and new_total:
+        pooled = (old_errors * old_total + new_errors * new_total) / (old_total + new_total)
+        spread = math.sqrt(pooled * (1 - pooled) * (1.0 / old_total + 1.0 / new_total))
+
+        if spread and (new_errors - old_errors) / spread > Z_CRITICAL and new_errors > max(old_errors * (1 + tolerance), old_errors + 0.001):
+            regressions.append('The error rate rose from %.2f%% to %.2f%% (p < 0.01).' % (old_errors * 100, new_errors * 100))
+
+    return rows, regressions, inconclusive
@@ -24,396 +24,2305 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from multiprocessing import Pool
+import getpass
+import gzip
+import hashlib
+import inspect
+import json
+import math
 import os
-import re
+import Queue
+import select
 import socket
 import sys
+import threading
 import time
 import urllib2
 
 import boto
+import boto.exception
 import paramiko
 
+import archive
+import breaker
+import guns
+import histogram
+import hive
+import live
+import relay
+import search as capacity
+import telemetry
+import timeline
+import tracing
+
 EC2_INSTANCE_TYPE = 't1.micro'
 STATE_FILENAME = os.path.expanduser('~/.bees')
-WAIT_COUNT = 60
+WAIT_TIMEOUT = 300
+POLL_INTERVAL = 2
+SSH_PORT = 22
+MAX_HANDSHAKES = 50
+STATE_VERSION = 1
+STATE_TTL = 15 * 60
+REPLAY_CHUNK_SIZE = 64 * 1024
+START_DELAY = 3
+ARM_TIMEOUT = 30
+CLOCK_SAMPLES = 3
+CHUNKS_PER_BEE = 4
+SPARE_FRACTION = 0.25
+ABORT_ERROR_RATE = 0.5
+DEFAULT_SWARM = 'bees'
+LAUNCH_BATCH = 50
+SHELL_CHUNK = 32 * 1024
+MAX_LINE = 64 * 1024
+MUX_TIMEOUT = 0.25
+PUSH_CHUNK_SIZE = 8 * 1024 * 1024
+PUSH_SEEDS = 2
+PUSH_FANOUT = 3
+RELAY_PORT = 8471
+RELAY_PATH = '/tmp/bees-relay.py'
+
+# The EC2 tags a swarm is known by, so any host can find it again
+SWARM_TAG = 'bees:swarm'
+OWNER_TAG = 'bees:owner'
+CREATED_TAG = 'bees:created_at'
+LOGIN_TAG = 'bees:login'
+TTL_TAG = 'bees:ttl'
+EXPIRES_TAG = 'bees:expires_at'
+
+# EC2 compute units of each instance type, for sharing an attack out by type
+INSTANCE_CAPACITY = {
+    't1.micro': 0.5,
+    'm1.small': 1,
+    'm1.medium': 2,
+    'm1.large': 4,
+    'm1.xlarge': 8,
+    'c1.medium': 5,
+    'c1.xlarge': 20,
+    'm2.xlarge': 6.5,
+    'm2.2xlarge': 13,
+    'm2.4xlarge': 26,
+    'cc1.4xlarge': 33.5,
+}
+
+SPLITS = {
+    'even': 'evenly',
+    'type': 'by instance type',
+    'measured': 'by measured capacity',
+}
+
+# Utilities
+
+def _read_server_list(state_file):
+    """
+    Read the roster of bees, or return None if there isn't one.
+
+    Plain-text rosters written by older versions of bees hold only instance
+    IDs, so they are read as if their addresses have never been looked up.
+    """
+    if not os.path.isfile(state_file):
+        return None
+
+    with open(state_file, 'r') as f:
+        text = f.read()
+
+    if text.startswith('{'):
+        state = json.loads(text)
+    else:
+        lines = text.split('\n') + ['', '']
+        state = {
+            'version': STATE_VERSION,
+            'username': lines[0].strip(),
+            'key_name': lines[1].strip(),
+            'refreshed_at': 0,
+            'instances': [{'id': line.strip()} for line in lines[2:] if line.strip()],
+        }
+
+    print 'Read %i bees from the roster.' % len(state['instances'])
+
+    return state
+
+def _write_server_list(state, state_file):
+    state['version'] = STATE_VERSION
+
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+
+    os.rename(state_file + '.tmp', state_file)
+
+def _describe(instance):
+    """
+    Return what the roster caches about an EC2 instance.
+    """
+    return {
+        'id': instance.id,
+        'state': instance.state,
+        'public_dns_name': instance.public_dns_name,
+        'ip_address': instance.ip_address,
+        'instance_type': instance.instance_type,
+        'placement': instance.placement,
+        'launch_time': instance.launch_time,
+        'private_ip_address': instance.private_ip_address,
+    }
+
+def _get_instances(state, state_file, refresh=False):
+    """
+    Return the bees in the roster.
+
+    EC2 is only asked about them if refresh is set or the cached details are
+    older than STATE_TTL, in which case the roster is updated too.
+    """
+    if not refresh and time.time() - state['refreshed_at'] < STATE_TTL:
+        return state['instances']
+
+    print 'Connecting to the hive.'
+
+    with tracing.span('ec2.describe'):
+        ec2_connection = _connect_ec2()
+
+        reservations = ec2_connection.get_all_instances(instance_ids=[instance['id'] for instance in state['instances']])
+
+    instances = []
+
+    for reservation in reservations:
+        instances.extend([_describe(instance) for instance in reservation.instances])
+
+    state['instances'] = instances
+    state['refreshed_at'] = time.time()
+
+    _write_server_list(state, state_file)
+
+    return instances
+
+def _delete_server_list(state_file):
+    os.remove(state_file)
+
+def _get_pem_path(key):
+    return os.path.expanduser('~/.ssh/%s.pem' % key)
+
+# Whether a session is keeping one EC2 connection open between commands,
+# and the connection, once one has been needed. Otherwise every command
+# connects afresh.
+_keep_ec2 = False
+_ec2 = None
+
+def _connect_ec2():
+    """
+    Connect to EC2, or reuse the session's open connection.
+    """
+    global _ec2
+
+    if not _keep_ec2:
+        return boto.connect_ec2()
+
+    if _ec2 is None:
+        _ec2 = boto.connect_ec2()
+
+    return _ec2
+
+_handshakes = threading.BoundedSemaphore(MAX_HANDSHAKES)
+
+# Open SSH clients by bee address, when the hive agent is keeping them alive
+# between commands. None means every command connects afresh.
+_sessions = None
+_sessions_lock = threading.Lock()
+
+def _connect(params):
+    """
+    Open an SSH connection to a bee, or reuse the hive's open one.
+
+    No more than MAX_HANDSHAKES key exchanges run at once, so a large swarm
+    doesn't starve the orchestrator's CPU while it connects.
+    """
+    if _sessions is not None:
+        with _sessions_lock:
+            client = _sessions.get(params['instance_name'])
+
+        if client is not None and client.get_transport() is not None and client.get_transport().is_active():
+            return client
+
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    # The time spent waiting for a turn to shake hands is in ssh.connect
+    with tracing.span('ssh.connect', params.get('i')):
+        with _handshakes:
+            with tracing.span('ssh.handshake', params.get('i')):
+                client.connect(
+                    params['instance_name'],
+                    port=SSH_PORT,
+                    username=params['username'],
+                    key_filename=_get_pem_path(params['key_name']))
+
+    if _sessions is not None:
+        client.get_transport().set_keepalive(30)
+
+        with _sessions_lock:
+            _sessions[params['instance_name']] = client
+
+    return client
+
+def _release(client):
+    """
+    Close an SSH connection unless the hive is keeping it alive.
+    """
+    if _sessions is None:
+        client.close()
+
+def _print(params, message):
+    """
+    Print a message on behalf of a bee, to params['out'] if something (like
+    the hive) is relaying the bee's output elsewhere.
+    """
+    params.get('out', sys.stdout).write('%s\n' % message)
+
+def _upload(client, remote_path, data):
+    """
+    Copy data to a file on a bee.
+    """
+    sftp = client.open_sftp()
+    f = sftp.open(remote_path, 'w')
+    f.write(data)
+    f.close()
+    sftp.close()
+
+def _clock_offset(client):
+    """
+    Estimate how many seconds a bee's clock is ahead of ours, from the
+    quickest of CLOCK_SAMPLES round trips, or 0 if the bee can't say.
+    """
+    samples = []
+
+    for i in range(CLOCK_SAMPLES):
+        channel = client.get_transport().open_session()
+
+        sent = time.time()
+        channel.exec_command('date +%s.%N')
+        output = channel.makefile('r').read()
+        received = time.time()
+
+        channel.close()
+
+        try:
+            remote = float(output)
+        except ValueError:
+            return 0.0
+
+        samples.append((received - sent, remote - (sent + received) / 2))
+
+    return min(samples)[1]
+
+class _Barrier(object):
+    """
+    Hold every bee until the whole swarm is armed, then give them all the
+    same start time, START_DELAY after the last one arrives.
+
+    Bees that fail to arm abandon the barrier instead of waiting at it. If
+    no bee arrives for ARM_TIMEOUT, the ones waiting go ahead without the
+    stragglers.
+    """
+
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = set()
+        self.start_at = None
+        self.deadline = time.time() + ARM_TIMEOUT
+        self.condition = threading.Condition()
+
+    def _arrive(self, bee):
+        self.arrived.add(bee)
+        self.deadline = time.time() + ARM_TIMEOUT
+
+        if len(self.arrived) >= self.parties:
+            self._release()
+
+    def _release(self):
+        if self.start_at is None:
+            self.start_at = time.time() + START_DELAY
+            self.condition.notify_all()
+
+    def wait(self, bee):
+        """
+        Arrive and return the time (by our clock) to open fire at.
+        """
+        with self.condition:
+            self._arrive(bee)
+
+            while self.start_at is None:
+                if time.time() >= self.deadline:
+                    self._release()
+                else:
+                    self.condition.wait(1)
+
+            return self.start_at
+
+    def abandon(self, bee):
+        """
+        Stop the swarm waiting for a bee, unless it has already arrived.
+        """
+        with self.condition:
+            if bee not in self.arrived:
+                self._arrive(bee)
+
+def _split(total, weights):
+    """
+    Share a whole number out in proportion to weights, exactly: every share
+    is rounded down, and what's left goes one each to the shares that lost
+    the most by it.
+    """
+    scale = float(sum(weights))
+    exact = [total * weight / scale for weight in weights]
+    shares = [int(share) for share in exact]
+
+    for i in sorted(range(len(weights)), key=lambda i: shares[i] - exact[i])[:total - sum(shares)]:
+        shares[i] += 1
+
+    return shares
+
+def _weights(instances, split, archive_dir):
+    """
+    Return how big a share of an attack each bee should get: the same for
+    all, by its instance type's compute units, or by the requests per second
+    per connection it managed in the last archived run it was in.
+    """
+    if split == 'type':
+        return [INSTANCE_CAPACITY.get(instance.get('instance_type'), 1) for instance in instances]
+
+    if split == 'measured':
+        measured = archive.capacities([instance['id'] for instance in instances], archive_dir)
+
+        if measured:
+            average = sum(measured.values()) / len(measured)
+
+            print '%i of %i bees have been measured before; the rest are taken to be average.' % (len(measured), len(instances))
+
+            return [measured.get(instance['id']) or average for instance in instances]
+
+        print 'None of the bees have been measured before, so they will share the attack evenly.'
+
+    return [1] * len(instances)
+
+def _plan(instances, url, n, c, gun, rate, rate_end, duration, workload_file, replay_file, split, spare, archive_dir, target = None):
+    """
+    Share one attack on url out between instances, saying how, and return
+    each bee's params, short of what the swarm as a whole shares. If there
+    are fewer than c connections to go round, only c bees are given any.
+
+    In a scenario, target is the name of the target these bees attack.
+    """
+    weights = _weights(instances, split, archive_dir)
+    connections = _split(int(c), weights)
+
+    # A bee needs a connection of its own to fire at all
+    if not all(connections):
+        firing = [i for i, share in enumerate(connections) if share]
+
+        print 'Only %i of the %i bees are needed for %s connections; the rest will sit this attack out.' % (len(firing), len(instances), c)
+
+        instances = [instances[i] for i in firing]
+        weights = [weights[i] for i in firing]
+        connections = [connections[i] for i in firing]
+
+    instance_count = len(instances)
+
+    # Open-loop attacks and replays can't be handed out a chunk at a time
+    closed = not rate and not replay_file
+    spare_requests = 0
+
+    if closed:
+        # ab won't open more connections than it has requests, so only what
+        # the bees' own connections leave over can be held back
+        spare_requests = min(int(int(n) * spare), max(0, int(n) - int(c)))
+
+    requests = _split(int(n) - spare_requests, weights)
+
+    # Rounding can still leave a bee a request or so short of its connections
+    if closed:
+        connections = [min(share, requests[i] or share) for i, share in enumerate(connections)]
+    chunk_size = max(1, int(math.ceil(spare_requests / float(instance_count * CHUNKS_PER_BEE))), int(math.ceil(float(c) / instance_count)))
+
+    if target is None:
+        who = 'The swarm of %i bees' % instance_count
+    else:
+        who = 'The %i bees attacking %s' % (instance_count, target)
+
+    if rate:
+        print '%s will fire %.1f rounds per second, ramping to %.1f, for %s seconds, up to %s at a time, shared out %s.' % (who, rate, rate_end or rate, duration, c, SPLITS[split])
+    else:
+        print '%s will fire %s rounds, %s at a time, shared out %s.' % (who, n, c, SPLITS[split])
+
+    if spare_requests:
+        print '%i of those rounds are held back in chunks of %i for whichever bees finish first.' % (spare_requests, chunk_size)
+
+    workload = None
+
+    if workload_file:
+        with open(workload_file) as f:
+            workload = json.load(f)
+
+        print 'Bees will pick from %i kinds of request in the workload.' % len(workload['requests'])
+
+    params = []
+
+    for i, instance in enumerate(instances):
+        params.append({
+            'instance_id': instance['id'],
+            'instance_name': instance['public_dns_name'],
+            'instance_type': instance.get('instance_type'),
+            'target': target,
+            'url': url,
+            'concurrent_requests': connections[i],
+            'num_requests': requests[i],
+            'spare_requests': spare_requests,
+            'chunk_size': chunk_size,
+            'rate': rate and float(rate) * weights[i] / sum(weights),
+            'rate_end': rate and float(rate_end or rate) * weights[i] / sum(weights),
+            'duration': duration,
+            'workload': workload,
+            'replay': bool(replay_file),
+            'gun': gun,
+        })
+
+    return params
+
+def _arm(params):
+    """
+    Give every bee attacking together the same start barrier, the same pool
+    of spare chunks of requests for whichever finish their own shares first
+    (one pool per target, in a scenario), and the same breaker if any abort
+    thresholds are set.
+    """
+    barrier = _Barrier(len(params))
+    pools = {}
+    circuit = None
+
+    if params and any([params[0].get(key) is not None for key in ('abort_error_rate', 'abort_p99', 'abort_lost_bees')]):
+        circuit = breaker.Breaker(len(params), params[0].get('abort_error_rate'), params[0].get('abort_p99'), params[0].get('abort_lost_bees'), params[0].get('out'))
+
+    for p in params:
+        target = p.get('target')
+
+        if target not in pools:
+            pools[target] = Queue.Queue()
+            spare, chunk_size = p.get('spare_requests', 0), p.get('chunk_size', 1)
+
+            for i in range(0, spare, chunk_size):
+                pools[target].put(min(chunk_size, spare - i))
+
+        p['barrier'] = barrier
+        p['pool'] = pools[target]
+        p['breaker'] = circuit
+
+def _ship_replay(params, replay_file, remote_path):
+    """
+    Deal the lines of an access log out to the bees in turn, so the log is
+    sharded the same way every time, and stream each bee's share to
+    remote_path in REPLAY_CHUNK_SIZE chunks as it fills.
+
+    Only a few chunks per bee are held in memory however big the log is.
+    Returns the bees that couldn't be loaded, by number.
+    """
+    queues = [Queue.Queue(maxsize=4) for p in params]
+    failed = []
+
+    def upload(i):
+        emptied = False
+
+        try:
+            client = _connect(params[i])
+            sftp = client.open_sftp()
+            f = sftp.open(remote_path, 'w')
+            f.set_pipelined(True)
+
+            for chunk in iter(queues[i].get, None):
+                f.write(chunk)
+
+            emptied = True
+
+            f.close()
+            sftp.close()
+            _release(client)
+        except (socket.error, paramiko.SSHException, IOError, EOFError):
+            failed.append(i)
+
+            # Keep taking chunks so the reader never waits on this bee
+            if not emptied:
+                for chunk in iter(queues[i].get, None):
+                    pass
+
+    uploaders = [threading.Thread(target=upload, args=(i,)) for i in range(len(params))]
+
+    for uploader in uploaders:
+        uploader.daemon = True
+        uploader.start()
+
+    if replay_file.endswith('.gz'):
+        log = gzip.open(replay_file)
+    else:
+        log = open(replay_file)
+
+    buffers = [[] for p in params]
+    sizes = [0] * len(params)
+
+    for number, line in enumerate(log):
+        i = number % len(params)
+
+        buffers[i].append(line)
+        sizes[i] += len(line)
+
+        if sizes[i] >= REPLAY_CHUNK_SIZE:
+            queues[i].put(''.join(buffers[i]))
+            buffers[i] = []
+            sizes[i] = 0
+
+    log.close()
+
+    for i, buffer in enumerate(buffers):
+        queues[i].put(''.join(buffer))
+        queues[i].put(None)
+
+    for uploader in uploaders:
+        while uploader.is_alive():
+            uploader.join(1)
+
+    return sorted(failed)
+
+def _swarm(command, params):
+    """
+    Run _attack or _shell on every bee, through the hive agent if one is
+    running.
+    """
+    if hive.is_running():
+        return hive.request(command, params)
+
+    return _fan_out(COMMANDS[command], params)
+
+def _fan_out(func, params):
+    """
+    Call func with each set of params on its own thread, all from this one
+    process, and return the results in the same order.
+    """
+    results = [None] * len(params)
+
+    def run(i):
+        results[i] = func(params[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(params))]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    # Join with a timeout so Ctrl-C still reaches the main thread
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+
+    return results
+
+def _ssh_reachable(instance):
+    """
+    Check that a bee's SSH daemon is answering.
+    """
+    try:
+        sock = socket.create_connection((instance.public_dns_name, SSH_PORT), timeout=5)
+    except socket.error:
+        return False
+
+    try:
+        return sock.recv(4).startswith('SSH-')
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+def _wait_for_bees(ec2_connection, instances, check_ssh=False):
+    """
+    Poll the whole fleet with one describe call per tick until every instance
+    is running (and, if check_ssh, answering SSH) or has used up its own
+    WAIT_TIMEOUT.
+
+    Returns the ready instances and the IDs of the lost ones.
+    """
+    deadlines = dict((instance.id, time.time() + WAIT_TIMEOUT) for instance in instances)
+    ready = []
+    lost = []
+
+    while deadlines:
+        try:
+            reservations = ec2_connection.get_all_instances(instance_ids=deadlines.keys())
+        except boto.exception.EC2ResponseError:
+            # Freshly launched instances can take a moment to be describable
+            reservations = []
+
+        running = []
+
+        for reservation in reservations:
+            running.extend([instance for instance in reservation.instances if instance.state == 'running'])
+
+        if check_ssh:
+            running = [instance for instance, reachable in zip(running, _fan_out(_ssh_reachable, running)) if reachable]
+
+        for instance in running:
+            del deadlines[instance.id]
+            ready.append(instance)
+            print 'Bee %s is ready for the attack.' % instance.id
+
+        now = time.time()
+
+        for instance_id, deadline in deadlines.items():
+            if now >= deadline:
+                del deadlines[instance_id]
+                lost.append(instance_id)
+                print 'Bee %s seems to be lost!' % instance_id
+
+        if deadlines:
+            print '.'
+            time.sleep(POLL_INTERVAL)
+
+    return ready, lost
+
+def _owner():
+    return '%s@%s' % (getpass.getuser(), socket.gethostname())
+
+def _discover(ec2_connection, filters=None, instance_ids=None):
+    """
+    Return the pending and running instances matching filters, oldest first.
+    """
+    filters = dict(filters or {})
+    filters['instance-state-name'] = ['pending', 'running']
+
+    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids, filters=filters)
+
+    instances = []
+
+    for reservation in reservations:
+        instances.extend(reservation.instances)
+
+    return sorted(instances, key=lambda instance: instance.launch_time)
+
+def _tag(ec2_connection, instance_ids, tags):
+    """
+    Tag instances, retrying for up to WAIT_TIMEOUT while EC2 catches up with
+    ones that were only just launched.
+    """
+    deadline = time.time() + WAIT_TIMEOUT
+
+    while True:
+        try:
+            return ec2_connection.create_tags(instance_ids, tags)
+        except boto.exception.EC2ResponseError:
+            if time.time() >= deadline:
+                raise
+
+            time.sleep(POLL_INTERVAL)
+
+def _launch(count, zones, tags, **kwargs):
+    """
+    Launch count instances spread evenly over zones, in batches of at most
+    LAUNCH_BATCH that are all requested at once, and tag each batch as soon
+    as it is launched.
+
+    A zone that runs out of capacity gives what it can; the shortfall is
+    reported, not made up in the other zones.
+    """
+    batches = []
+
+    for zone, share in zip(zones, _split(count, [1] * len(zones))):
+        for i in range(0, share, LAUNCH_BATCH):
+            batches.append((zone, min(LAUNCH_BATCH, share - i)))
+
+    def launch(batch):
+        zone, size = batch
+
+        # boto's connections can't be shared between threads
+        ec2_connection = boto.connect_ec2()
+
+        try:
+            with tracing.span('ec2.run_instances'):
+                reservation = ec2_connection.run_instances(min_count=1, max_count=size, placement=zone, **kwargs)
+        except boto.exception.EC2ResponseError, e:
+            print 'Could not call up %i bees in %s: %s' % (size, zone, e.error_message or e.reason)
+            return []
+
+        with tracing.span('ec2.tag'):
+            _tag(ec2_connection, [instance.id for instance in reservation.instances], tags)
+
+        return reservation.instances
+
+    launched = []
+
+    for instances in _fan_out(launch, batches):
+        launched.extend(instances)
+
+    if len(launched) < count:
+        print 'EC2 could only call up %i of the %i bees.' % (len(launched), count)
+
+    return launched
+
+def _expiry(ttl):
+    return str(int(time.time() + ttl))
+
+def _keep_alive(state, state_file):
+    """
+    Put off reaping the bees in the roster for another TTL, unless less than
+    half of it has gone by since it was last put off.
+    """
+    ttl = state.get('ttl')
+
+    if not ttl or state.get('expires_at', 0) - time.time() > ttl / 2.0:
+        return
+
+    expires_at = _expiry(ttl)
+
+    _tag(_connect_ec2(), [instance['id'] for instance in state['instances']], {EXPIRES_TAG: expires_at})
+
+    state['expires_at'] = int(expires_at)
+
+    _write_server_list(state, state_file)
+
+def _reap(ec2_connection, filters=None):
+    """
+    Terminate the bees matching filters that have outlived their TTL, and
+    return their IDs.
+    """
+    expiring = {'tag-key': EXPIRES_TAG}
+    expiring.update(filters or {})
+
+    now = time.time()
+    expired = [instance.id for instance in _discover(ec2_connection, expiring) if float(instance.tags[EXPIRES_TAG]) <= now]
+
+    if expired:
+        ec2_connection.terminate_instances(instance_ids=expired)
+
+    return expired
+
+def _forget(instance_ids, state_file):
+    """
+    Strike bees off the roster, and delete it if none are left.
+    """
+    state = _read_server_list(state_file)
+
+    if not state:
+        return
+
+    state['instances'] = [instance for instance in state['instances'] if instance['id'] not in instance_ids]
+
+    if state['instances']:
+        _write_server_list(state, state_file)
+    else:
+        _delete_server_list(state_file)
+
+# Methods
+
+def up(count, group, zone, image_id, username, key_name, state_file = STATE_FILENAME, wait_for_ssh = False, instance_type = EC2_INSTANCE_TYPE,
+       swarm = DEFAULT_SWARM, ttl = None):
+    """
+    Grow or shrink a swarm to count bees.
+
+    The swarm is the one in the roster, or if there isn't one, whichever bees
+    in EC2 are tagged with its name. New bees are spread over zone, which may
+    be several zones separated by commas. If ttl is given, bees idle for
+    that many seconds are reaped.
+
+    If wait_for_ssh is set, bees only count as ready once SSH answers.
+    """
+    count = int(count)
+
+    print 'Connecting to the hive.'
+
+    ec2_connection = _connect_ec2()
+
+    with tracing.span('ec2.reap'):
+        reaped = _reap(ec2_connection, {'tag:' + SWARM_TAG: swarm})
+
+    if reaped:
+        print 'Reaped %i bees that had been idle too long.' % len(reaped)
+
+    state = _read_server_list(state_file)
+
+    if state and state['instances']:
+        if state.get('swarm', swarm) != swarm:
+            print 'The roster holds the %s swarm; bring it down or use -f to keep another roster.' % state['swarm']
+            return
+
+        instance_ids = [instance['id'] for instance in state['instances'] if instance['id'] not in reaped]
+
+        with tracing.span('ec2.describe'):
+            members = _discover(ec2_connection, instance_ids=instance_ids) if instance_ids else []
+    else:
+        with tracing.span('ec2.discover'):
+            members = _discover(ec2_connection, {'tag:' + SWARM_TAG: swarm})
+        state = {'username': username, 'key_name': key_name}
+
+        if members:
+            print 'Found %i bees of the %s swarm already flying.' % (len(members), swarm)
+
+            state['username'] = members[0].tags.get(LOGIN_TAG, username)
+            state['key_name'] = members[0].key_name
+
+            if members[0].tags.get(TTL_TAG):
+                state['ttl'] = int(members[0].tags[TTL_TAG])
+
+    pem_path = _get_pem_path(state['key_name'])
+
+    if not os.path.isfile(pem_path):
+        print 'No key file found at %s' % pem_path
+        return
+
+    if ttl is not None:
+        state['ttl'] = ttl
+
+    state['swarm'] = swarm
+
+    if count == len(members):
+        print 'The %s swarm already has %i bees awaiting orders.' % (swarm, count)
+    elif count < len(members):
+        print 'Standing down %i bees.' % (len(members) - count)
+
+        ec2_connection.terminate_instances(instance_ids=[instance.id for instance in members[count:]])
+
+        members = members[:count]
+    else:
+        print 'Attempting to call up %i %s bees.' % (count - len(members), instance_type)
+
+        tags = {
+            'Name': 'a bee!',
+            SWARM_TAG: swarm,
+            OWNER_TAG: _owner(),
+            CREATED_TAG: time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            LOGIN_TAG: state['username'],
+        }
+
+        if state.get('ttl'):
+            tags[TTL_TAG] = str(state['ttl'])
+            tags[EXPIRES_TAG] = _expiry(state['ttl'])
+
+        launched = _launch(count - len(members), zone.split(','), tags,
+            image_id=image_id,
+            key_name=state['key_name'],
+            security_groups=[group],
+            instance_type=instance_type)
+
+        print 'Waiting for bees to load their machine guns...'
+
+        pending = [instance for instance in members if instance.state != 'running']
+        with tracing.span('ec2.wait'):
+            ready, lost = _wait_for_bees(ec2_connection, launched + pending, wait_for_ssh)
+
+        members = [instance for instance in members if instance.state == 'running'] + ready
+
+    state['refreshed_at'] = time.time()
+    state['instances'] = [_describe(instance) for instance in members]
+    state['expires_at'] = 0
+
+    if members:
+        _write_server_list(state, state_file)
+        _keep_alive(state, state_file)
+    elif os.path.isfile(state_file):
+        _delete_server_list(state_file)
+
+    print 'The swarm has assembled %i bees.' % len(members)
+
+def attach(swarm = DEFAULT_SWARM, state_file = STATE_FILENAME):
+    """
+    Write a roster for a swarm that was called up elsewhere, found by its
+    EC2 tags, so it can be given orders from here.
+    """
+    state = _read_server_list(state_file)
+
+    if state and state['instances'] and state.get('swarm') != swarm:
+        print 'The roster holds other bees; bring them down or use -f to keep another roster.'
+        return
+
+    print 'Connecting to the hive.'
+
+    ec2_connection = _connect_ec2()
+
+    members = _discover(ec2_connection, {'tag:' + SWARM_TAG: swarm})
+
+    if not members:
+        print 'No bees of the %s swarm are flying.' % swarm
+        return
+
+    ttl = members[0].tags.get(TTL_TAG)
+
+    _write_server_list({
+        'swarm': swarm,
+        'username': members[0].tags.get(LOGIN_TAG),
+        'key_name': members[0].key_name,
+        'ttl': int(ttl) if ttl else None,
+        'expires_at': 0,
+        'refreshed_at': time.time(),
+        'instances': [_describe(instance) for instance in members],
+    }, state_file)
+
+    print 'Attached to %i bees of the %s swarm, called up by %s.' % (len(members), swarm, members[0].tags.get(OWNER_TAG, 'someone'))
+
+def reap(state_file = STATE_FILENAME):
+    """
+    Terminate the bees of every swarm that have been idle past their TTL.
+
+    Run it from cron to keep forgotten swarms from running up a bill.
+    Returns the IDs of the bees reaped.
+    """
+    print 'Connecting to the hive.'
+
+    ec2_connection = _connect_ec2()
+
+    reaped = _reap(ec2_connection)
+
+    _forget(reaped, state_file)
+
+    print 'Reaped %i idle bees.' % len(reaped)
+
+    return reaped
+
+def report(state_file = STATE_FILENAME):
+    """
+    Report the status of the load testing servers.
+    """
+    state = _read_server_list(state_file)
+
+    if not state or not state['instances']:
+        print 'No bees have been mobilized.'
+        return
+
+    instances = _get_instances(state, state_file, refresh=True)
+
+    for instance in instances:
+        print 'Bee %s: %s @ %s' % (instance['id'], instance['state'], instance['ip_address'])
+
+def down(state_file = STATE_FILENAME):
+    """
+    Shutdown the load testing server, returning the IDs of the bees stood
+    down.
+    """
+    state = _read_server_list(state_file)
+
+    if not state or not state['instances']:
+        print 'No bees have been mobilized.'
+        return
+
+    instance_ids = [instance['id'] for instance in state['instances']]
+
+    print 'Connecting to the hive.'
+
+    ec2_connection = _connect_ec2()
+
+    print 'Calling off the swarm.'
+
+    with tracing.span('ec2.terminate'):
+        terminated_instance_ids = ec2_connection.terminate_instances(
+            instance_ids=instance_ids)
+
+    print 'Stood down %i bees.' % len(terminated_instance_ids)
+
+    _delete_server_list(state_file)
+
+    return [instance.id for instance in terminated_instance_ids]
+
+def _interrupt(client, command):
+    """
+    Run a command on a bee to stop its gun, ignoring a bee that has already
+    hung up.
+    """
+    transport = client.get_transport()
+
+    if transport is None or not transport.is_active():
+        return
+
+    try:
+        stdin, stdout, stderr = client.exec_command(command)
+        stdout.read()
+    except (socket.error, paramiko.SSHException, EOFError):
+        pass
+
+def _fire(client, gun, params):
+    """
+    Run one round of a gun on a bee and return its results, or None if the
+    bee lost sight of the target.
+
+    What the bee finishes is fed to params' breaker, if it has one, frame by
+    frame if the gun sends them (only the native gun does), or else all at
+    once at the end, which is too late to stop the round it came from.
+
+    The bee's own resources are sampled while the gun runs, and returned
+    as telemetry_rows.
+    """
+    circuit = params.get('breaker')
+    framed = False
+
+    with tracing.span('bee.fire', params['i']):
+        stdin, stdout, stderr = client.exec_command(telemetry.wrap(gun.command(params)))
+
+        payload = gun.payload(params)
+
+        if payload is not None:
+            stdin.write(payload)
+            stdin.channel.shutdown_write()
+
+        # Live frames go straight to the monitor; everything else is the report
+        output = []
+
+        for line in stdout:
+            frame = gun.frame(line)
+
+            if frame is None:
+                output.append(line)
+                continue
+
+            params['monitor'].record(params['i'], frame)
+
+            if circuit is not None:
+                latency_histogram = {}
+
+                for latency, count in frame['latency_counts']:
+                    histogram.record(latency_histogram, latency, count)
+
+                circuit.record(params['i'], dict(frame, latency_histogram=latency_histogram))
+                framed = True
+
+    with tracing.span('bee.parse', params['i']):
+        report, marker, samples = ''.join(output).partition(telemetry.MARKER)
+        response = gun.parse(report)
+
+        if response is None:
+            return None
+
+        response['telemetry_rows'] = telemetry.parse(samples)
+
+    if circuit is not None and not framed:
+        circuit.record(params['i'], response)
+
+    return response
+
+def _combine(responses):
+    """
+    Add up a bee's results from several rounds of its gun.
+    """
+    if len(responses) == 1:
+        return responses[0]
+
+    complete = sum([r['complete_requests'] for r in responses])
+    elapsed = sum([r['complete_requests'] / r['requests_per_second'] for r in responses if r['requests_per_second']])
+
+    latency_by_second = {}
+    errors_by_second = {}
+    failed_by_kind = {}
+
+    for r in responses:
+        for second, h in r.get('latency_by_second', {}).items():
+            latency_by_second[second] = histogram.merge([latency_by_second.get(second, {}), h])
+
+        for second, count in r.get('errors_by_second', {}).items():
+            errors_by_second[second] = errors_by_second.get(second, 0) + count
+
+        for kind, count in r.get('failed_by_kind', {}).items():
+            failed_by_kind[kind] = failed_by_kind.get(kind, 0) + count
+
+    combined = {
+        'complete_requests': complete,
+        'failed_requests': sum([r.get('failed_requests', 0) for r in responses]),
+        'non_2xx_responses': sum([r.get('non_2xx_responses', 0) for r in responses]),
+        'failed_by_kind': failed_by_kind,
+        'requests_per_second': complete / elapsed if elapsed else 0.0,
+        'ms_per_request': sum([r['ms_per_request'] * r['complete_requests'] for r in responses]) / complete if complete else 0.0,
+        'latency_histogram': histogram.merge([r['latency_histogram'] for r in responses]),
+        'latency_by_second': latency_by_second,
+        'telemetry_rows': sum([r.get('telemetry_rows', []) for r in responses], []),
+        'rounds': len(responses),
+    }
+
+    # Errors are only known by the second if the gun counted them that way
+    if any(['errors_by_second' in r for r in responses]):
+        combined['errors_by_second'] = errors_by_second
+
+    return combined
+
+def _attack(params):
+    """
+    Test the target URL with requests.
+
+    If params has a barrier, the bee is armed, its clock is compared with
+    ours, and it then waits for the rest of the swarm so they all open fire
+    at the same moment.
+
+    Once it has fired its own share, the bee keeps taking chunks of
+    requests from params' pool, if it has one, until the pool is empty.
+
+    If params has a breaker, the bee stops early when it trips, and its
+    results so far are returned marked with why.
+
+    Intended for use with _fan_out.
+    """
+    #print 'Bee %i is joining the swarm.' % params['i']
+
+    barrier = params.get('barrier')
+    pool = params.get('pool')
+    circuit = params.get('breaker')
+    clock_offset = 0.0
+
+    try:
+        try:
+            client = _connect(params)
+        except (socket.error, paramiko.SSHException), e:
+            if circuit is not None:
+                circuit.record_lost(params['i'], 'unreachable')
+
+            return socket.error(str(e))
+
+        #print 'Bee %i is firing his machine gun. Bang bang!' % params['i']
+
+        gun = guns.GUNS[params['gun']]
+
+        if circuit is not None:
+            circuit.enlist(params['i'], lambda: _interrupt(client, gun.stop(params)))
+
+        with tracing.span('bee.upload', params['i']):
+            for remote_path, data in gun.uploads(params):
+                _upload(client, remote_path, data)
+
+        if barrier is not None:
+            with tracing.span('bee.clock', params['i']):
+                clock_offset = _clock_offset(client)
+
+            with tracing.span('bee.barrier', params['i']):
+                params['start_at'] = barrier.wait(params['i']) + clock_offset
+
+        responses = []
+
+        # A bee with no share of its own goes straight to the pool
+        if (params['num_requests'] or params.get('rate') or params.get('replay')) and not (circuit and circuit.tripped):
+            response = _fire(client, gun, params)
+
+            if response is None:
+                if circuit is not None:
+                    circuit.record_lost(params['i'], 'lost')
+
+                if not (circuit and circuit.tripped):
+                    _print(params, 'Bee %i lost sight of the target (connection timed out).' % params['i'])
+
+                _release(client)
+                return None
+
+            responses.append(response)
+
+        while pool is not None and not (circuit and circuit.tripped):
+            try:
+                chunk = pool.get_nowait()
+            except Queue.Empty:
+                break
+
+            response = _fire(client, gun, dict(params, num_requests=chunk, concurrent_requests=min(params['concurrent_requests'], chunk), start_at=None))
+
+            if response is None:
+                # Leave the chunk for a bee that can still see the target
+                pool.put(chunk)
+                break
+
+            responses.append(response)
+
+        #print 'Bee %i is out of ammo.' % params['i']
+
+        _release(client)
+
+        if not responses:
+            if not (circuit and circuit.tripped):
+                _print(params, 'Bee %i lost sight of the target (connection timed out).' % params['i'])
+
+            return None
+
+        response = _combine(responses)
+        response['clock_offset'] = clock_offset
+        response['concurrent_requests'] = params['concurrent_requests']
+        response['telemetry'] = telemetry.summarize(response.pop('telemetry_rows'), params.get('instance_type'))
+
+        if circuit is not None and circuit.tripped:
+            response['stopped'] = circuit.reason
+
+        return response
+    except socket.error, e:
+        if circuit is not None:
+            circuit.record_lost(params['i'], 'unreachable')
+
+        return e
+    finally:
+        if barrier is not None:
+            barrier.abandon(params['i'])
+
+        if circuit is not None:
+            circuit.discharge(params['i'])
+
+def _steady_window(results):
+    """
+    Return the first and last whole seconds (by our clock) in which every
+    bee was firing, or None if there are none or a bee didn't say when it
+    fired.
+    """
+    spans = []
+
+    for r in results:
+        if not r.get('latency_by_second'):
+            return None
+
+        shift = int(round(r.get('clock_offset', 0)))
+        spans.append((min(r['latency_by_second']) - shift, max(r['latency_by_second']) - shift))
+
+    if not spans:
+        return None
+
+    # The seconds the swarm opened and ceased fire in are only partly full
+    start = max([first for first, last in spans]) + 1
+    end = min([last for first, last in spans]) - 1
+
+    if end < start:
+        return None
+
+    return start, end, min([first for first, last in spans]), max([last for first, last in spans])
+
+
+def _summarize(results):
+    """
+    Combine every bee's results into totals for the whole swarm.
+    """
+    complete_bees = [r for r in results if r is not None and type(r) != socket.error]
+
+    summary = {
+        'timeout_bees': len([r for r in results if r is None]),
+        'exception_bees': len([r for r in results if type(r) == socket.error]),
+        'complete_bees': len(complete_bees),
+        'stopped_bees': len([r for r in complete_bees if r.get('stopped')]),
+        'stopped_reason': ([r['stopped'] for r in complete_bees if r.get('stopped')] or [None])[0],
+        'complete_requests': sum([r['complete_requests'] for r in complete_bees]),
+        'failed_requests': sum([r.get('failed_requests', 0) for r in complete_bees]),
+        'non_2xx_responses': sum([r.get('non_2xx_responses', 0) for r in complete_bees]),
+        'failed_by_kind': {},
+        'requests_per_second': sum([r['requests_per_second'] for r in complete_bees]),
+        'ms_per_request': None,
+        # Percentiles can't be averaged across bees, so merge every bee's
+        # latency histogram and read them off the whole swarm at once.
+        'latency_histogram': histogram.merge([r['latency_histogram'] for r in complete_bees]),
+        'saturated_bees': len([r for r in complete_bees if r.get('telemetry', {}).get('saturated')]),
+        'recommendation': telemetry.recommend([r['telemetry'] for r in complete_bees if 'telemetry' in r], len(results)),
+    }
+
+    for r in complete_bees:
+        for kind, count in r.get('failed_by_kind', {}).items():
+            summary['failed_by_kind'][kind] = summary['failed_by_kind'].get(kind, 0) + count
+
+    if complete_bees:
+        summary['ms_per_request'] = sum([r['ms_per_request'] for r in complete_bees]) / len(complete_bees)
+
+    window = _steady_window(complete_bees)
+
+    # Throughput and latencies only count the seconds in which every bee was
+    # firing, leaving out the warm-up and cool-down at either end.
+    if window is not None:
+        start, end, first, last = window
+        steady = []
+
+        for r in complete_bees:
+            shift = int(round(r.get('clock_offset', 0)))
+            steady.extend([h for second, h in r['latency_by_second'].items() if start <= second - shift <= end])
+
+        steady_histogram = histogram.merge(steady)
+
+        summary.update({
+            'steady_seconds': end - start + 1,
+            'warm_up_seconds': start - first,
+            'cool_down_seconds': last - end,
+            'requests_per_second': histogram.count(steady_histogram) / float(end - start + 1),
+            'ms_per_request': histogram.mean(steady_histogram),
+            'latency_histogram': steady_histogram,
+        })
+
+    return summary
+
+def _print_results(results):
+    """
+    Print summarized load-testing results.
+    """
+    summary = _summarize(results)
+
+    if summary['exception_bees']:
+        print '     %i of your bees didn\'t make it to the action. They might be taking a little longer than normal to find their machine guns, or may have been terminated without using "bees down".' % summary['exception_bees']
+
+    if summary['timeout_bees']:
+        print '     Target timed out without fully responding to %i bees.' % summary['timeout_bees']
+
+    if summary['complete_bees'] == 0:
+        print '     No bees completed the mission. Apparently your bees are peace-loving hippies.'
+        return
+
+    if summary['stopped_bees']:
+        print '     The breaker stopped %i bees early (%s); these results are partial.' % (summary['stopped_bees'], summary['stopped_reason'])
+
+    print '     Complete requests:\t\t%i' % summary['complete_requests']
+
+    if 'steady_seconds' in summary:
+        print '     Steady state:\t\t%i seconds (dropped %is of warm-up and %is of cool-down)' % (summary['steady_seconds'], summary['warm_up_seconds'], summary['cool_down_seconds'])
+
+    failed_by_kind = dict((kind, count) for kind, count in summary['failed_by_kind'].items() if kind != 'length')
+
+    if summary['failed_requests'] or summary['non_2xx_responses']:
+        print '     Failed requests:\t\t%i' % summary['failed_requests']
+
+        if failed_by_kind:
+            print '       (%s)' % ', '.join(['%s: %i' % (kind.capitalize(), count) for kind, count in sorted(failed_by_kind.items())])
+
+        print '     Non-2xx responses:\t\t%i' % summary['non_2xx_responses']
+        print '     Error rate:\t\t\t%.2f%%' % (capacity.error_rate(summary) * 100)
+
+    if summary['failed_by_kind'].get('length'):
+        print '     Length mismatches:\t\t%i (not counted as errors)' % summary['failed_by_kind']['length']
+
+    print '     Requests per second:\t%f [#/sec] (mean)' % summary['requests_per_second']
+
+    mean_response = summary['ms_per_request']
+    print '     Time per request:\t\t%f [ms] (mean)' % mean_response
+
+    latency_histogram = summary['latency_histogram']
+
+    if histogram.count(latency_histogram):
+        for percent in histogram.PERCENTILES:
+            print '     %s%% response time:\t\t%f [ms]' % (percent, histogram.percentile(latency_histogram, percent))
+
+        print '     Longest request:\t\t%f [ms]' % histogram.maximum(latency_histogram)
+
+    series = timeline.build(results)
+
+    if series is not None and len(series['second']) > 1:
+        timeline.report(series)
+
+    # How hard the bees themselves were working
+    bee_telemetry = [(i, r['telemetry']) for i, r in enumerate(results)
+        if isinstance(r, dict) and r.get('telemetry', {}).get('samples')]
+
+    if bee_telemetry:
+        print '     Bee CPU busy:\t\t%.0f%% mean, %.0f%% at worst (%.0f%% stolen)' % (
+            100 * sum([t['cpu_busy'] for i, t in bee_telemetry]) / len(bee_telemetry),
+            100 * max([t['cpu_busy_max'] for i, t in bee_telemetry]),
+            100 * sum([t['cpu_steal'] for i, t in bee_telemetry]) / len(bee_telemetry))
+        print '     Bee network:\t\t%f [Mbit/s] (mean per bee)' % (sum([t['net_mbps'] for i, t in bee_telemetry]) / len(bee_telemetry))
+
+        saturated = [(i, t) for i, t in bee_telemetry if t['saturated']]
+
+        for i, t in saturated[:10]:
+            print '     Bee %i ran out of %s (CPU %.0f%% busy, %.0f%% stolen, %.1f Mbit/s, %i sockets in TIME_WAIT).' % (
+                i, ' and '.join(t['saturated']), 100 * t['cpu_busy'], 100 * t['cpu_steal'], t['net_mbps'], t['tcp_tw_max'])
+
+        if len(saturated) > 10:
+            print '     ...and %i more.' % (len(saturated) - 10)
+
+    if mean_response < 500:
+        print 'Mission Assessment: Target crushed bee offensive.'
+    elif mean_response < 1000:
+        print 'Mission Assessment: Target successfully fended off the swarm.'
+    elif mean_response < 1500:
+        print 'Mission Assessment: Target wounded, but operational.'
+    elif mean_response < 2000:
+        print 'Mission Assessment: Target severely compromised.'
+    else:
+        print 'Mission Assessment: Swarm annihilated target.'
+
+    if summary['recommendation']:
+        print 'Swarm Assessment: %s' % summary['recommendation']
+    
+def attack(url, n, c, state_file = STATE_FILENAME, gun = guns.DEFAULT_GUN, frames_file = None, refresh = False, rate = None, rate_end = None, duration = None,
+           workload_file = None, replay_file = None, archive_dir = archive.ARCHIVE_DIR, split = 'even', spare = SPARE_FRACTION,
+           abort_error_rate = ABORT_ERROR_RATE, abort_p99 = None, abort_lost_bees = None, timeline_file = None):
+    """
+    Test the root url of this site.
+
+    The whole swarm is stopped early, keeping the results so far, if over
+    the last few seconds more than abort_error_rate of requests fail or get
+    a non-2xx response, the p99 latency passes abort_p99 ms, or more than
+    abort_lost_bees of the bees are lost. None turns a check off. Only the
+    native gun reports every second; the ab gun reports when a round
+    finishes, so its errors and latencies are only checked between rounds
+    and a failing target can go on being hit until a bee's share is done.
+
+    Exactly n requests over c connections (or the given rate) are shared
+    out between the bees by split: evenly, by instance type, or by the
+    capacity they were measured at in earlier archived runs. The spare
+    fraction of n is held back in chunks, for bees that finish early to
+    take, so the slowest bee doesn't hold up the whole attack.
+
+    Every bee is armed before any of them fire, and then the whole swarm
+    opens fire at once. Throughput and latencies are only counted over the
+    seconds in which every bee was firing.
+
+    Every bee's raw results are archived in archive_dir, for bees compare,
+    along with the swarm's second-by-second timeline, which is also written
+    to timeline_file (CSV, or JSON if it ends in .json) if one is given.
+    The summary returned carries the run's archive_path and timeline too.
+
+    With the native gun, requests can instead be drawn at random from the
+    weighted requests in a JSON workload_file, or replayed from an access
+    log in replay_file, which is sharded across the bees. Relative URLs in
+    either are joined to url.
+
+    If rate is given the attack is open-loop instead of firing n rounds: the
+    swarm as a whole sends rate requests per second, ramping linearly to
+    rate_end if given, for duration seconds. Only the native gun can do this.
+
+    The bees' addresses come from the roster unless refresh is set or they
+    are older than STATE_TTL.
+
+    Bees that report live frames are shown as they go, and their frames are
+    written to frames_file if one is given.
+    """
+    state = _read_server_list(state_file)
+
+    if not state or not state['instances']:
+        print 'No bees are ready to attack.'
+        return
+
+    username = state['username']
+    key_name = state['key_name']
+
+    instances = _get_instances(state, state_file, refresh)
+
+    _keep_alive(state, state_file)
+
+    print 'Assembling bees.'
+
+    monitor = live.Monitor(frames_file=frames_file)
+
+    params = _plan(instances, url, n, c, gun, rate, rate_end, duration, workload_file, replay_file, split, spare, archive_dir)
+
+    for i, p in enumerate(params):
+        p.update({
+            'i': i,
+            'monitor': monitor,
+            'abort_error_rate': abort_error_rate,
+            'abort_p99': abort_p99,
+            'abort_lost_bees': abort_lost_bees,
+            'username': username,
+            'key_name': key_name,
+        })
 
-# Utilities
+    if replay_file:
+        print 'Dealing the access log out to the bees.'
 
-def _read_server_list(state_file):
-    instance_ids = []
+        with tracing.span('attack.replay'):
+            failed = _ship_replay(params, replay_file, guns.native.REPLAY_PATH)
 
-    if not os.path.isfile(state_file):
-        return (None, None, None)
+        for i in failed:
+            print 'Bee %i couldn\'t be given its share of the access log.' % i
 
-    with open(state_file, 'r') as f:
-        username = f.readline().strip()
-        key_name = f.readline().strip()
-        text = f.read()
-        instance_ids = text.split('\n')
+    print 'Stinging URL so it will be cached for the attack.'
 
-        print 'Read %i bees from the roster.' % len(instance_ids)
+    # Ping url so it will be cached for testing
+    with tracing.span('attack.warm_up'):
+        urllib2.urlopen(url)
 
-    return (username, key_name, instance_ids)
+    print 'Organizing the swarm.'
 
-def _write_server_list(username, key_name, instances, state_file, instance_ids):
-    with open(state_file, 'w') as f:
-        f.write('%s\n' % username)
-        f.write('%s\n' % key_name)
-        f.write('\n'.join([instance.id for instance in instances if instance.id in instance_ids]))
+    _arm(params)
 
-def _delete_server_list(state_file):
-    os.remove(state_file)
+    monitor.start()
 
-def _get_pem_path(key):
-    return os.path.expanduser('~/.ssh/%s.pem' % key)
+    # Drive every bee's SSH session from this process, or the hive's
+    with tracing.span('attack.swarm'):
+        results = _swarm('attack', params)
 
-# Methods
+    monitor.stop()
 
-def up(count, group, zone, image_id, username, key_name, state_file = STATE_FILENAME):
+    print 'Offensive complete.'
+
+    with tracing.span('attack.summarize'):
+        _print_results(results)
+
+        summary = _summarize(results)
+
+    parameters = {
+        'url': url,
+        'num_requests': n,
+        'concurrent_requests': c,
+        'gun': gun,
+        'rate': rate,
+        'rate_end': rate_end,
+        'duration': duration,
+        'workload_file': workload_file,
+        'replay_file': replay_file,
+        'split': split,
+        'spare': spare,
+        'abort_error_rate': abort_error_rate,
+        'abort_p99': abort_p99,
+        'abort_lost_bees': abort_lost_bees,
+        'bees': len(params),
+        'instance_ids': [p['instance_id'] for p in params],
+    }
+
+    series = timeline.build(results)
+
+    if timeline_file and series is not None:
+        timeline.export(series, timeline_file)
+
+        print 'The attack\'s timeline was written to %s.' % timeline_file
+
+    with tracing.span('attack.archive'):
+        path = archive.save(results, parameters, summary, monitor.series, archive_dir, series)
+
+    print 'This run was archived as %s.' % path
+
+    summary['archive_path'] = path
+    summary['timeline'] = series
+
+    print 'The swarm is awaiting new orders.'
+
+    return summary
+
+def scenario(targets, state_file = STATE_FILENAME, gun = guns.DEFAULT_GUN, frames_file = None, refresh = False, archive_dir = archive.ARCHIVE_DIR,
+             split = 'even', spare = SPARE_FRACTION, abort_error_rate = ABORT_ERROR_RATE, abort_p99 = None, abort_lost_bees = None, timeline_file = None):
     """
-    Startup the load testing server.
+    Attack several targets at once with one swarm.
+
+    Each target is a dict with a name, a url and, like attack's arguments,
+    the number of requests and how many to make concurrently, or a rate
+    (ramping to rate_end) to send for duration seconds, and optionally a
+    workload or replay file and its own gun. The bees are dealt out between
+    the targets in proportion to each target's bees (1 if not given), and
+    each target's attack is shared out between its bees by split, with its
+    own spare chunks.
+
+    Every bee of every target opens fire at the same moment, and if any
+    abort threshold is passed across the whole swarm, they are all stopped.
+
+    Each target's results are printed and archived as a run of their own, so
+    bees compare follows each target separately, and then the whole swarm's
+    are printed together, with the combined timeline written to
+    timeline_file if one is given. Returns a dict of each target's summary
+    by name, and the combined summary.
     """
-    existing_username, existing_key_name, instance_ids = _read_server_list(state_file)
+    names = [target['name'] for target in targets]
 
-    if instance_ids:
-        print 'Bees are already assembled and awaiting orders.'
+    if len(set(names)) < len(names):
+        print 'Every target in a scenario needs a name of its own.'
         return
 
-    count = int(count)
+    state = _read_server_list(state_file)
+
+    if not state or not state['instances']:
+        print 'No bees are ready to attack.'
+        return
 
-    pem_path = _get_pem_path(key_name)
+    username = state['username']
+    key_name = state['key_name']
 
-    if not os.path.isfile(pem_path):
-        print 'No key file found at %s' % pem_path
+    instances = _get_instances(state, state_file, refresh)
+
+    shares = _split(len(instances), [target.get('bees', 1) for target in targets])
+
+    if not all(shares):
+        print 'The swarm of %i bees is too small to spare a bee for each of the %i targets.' % (len(instances), len(targets))
         return
 
-    print 'Connecting to the hive.'
+    _keep_alive(state, state_file)
+
+    print 'Assembling bees.'
 
-    ec2_connection = boto.connect_ec2()
+    monitor = live.Monitor(frames_file=frames_file)
 
-    print 'Attempting to call up %i bees.' % count
+    params = []
+    first = 0
 
-    reservation = ec2_connection.run_instances(
-        image_id=image_id,
-        min_count=count,
-        max_count=count,
-        key_name=key_name,
-        security_groups=[group],
-        instance_type=EC2_INSTANCE_TYPE,
-        placement=zone)
+    for target, share in zip(targets, shares):
+        params.extend(_plan(instances[first:first + share], target['url'], target.get('number', 1000), target.get('concurrent', 100),
+                            target.get('gun', gun), target.get('rate'), target.get('rate_end'), target.get('duration', 60), target.get('workload'),
+                            target.get('replay'), split, spare, archive_dir, target['name']))
 
-    print 'Waiting for bees to load their machine guns...'
+        first += share
 
-    instance_ids = []
+    for i, p in enumerate(params):
+        p.update({
+            'i': i,
+            'monitor': monitor,
+            'abort_error_rate': abort_error_rate,
+            'abort_p99': abort_p99,
+            'abort_lost_bees': abort_lost_bees,
+            'username': username,
+            'key_name': key_name,
+        })
 
-    waitcount = 0
-    for instance in reservation.instances:
-        instance.update()
-        while instance.state != 'running' and waitcount < WAIT_COUNT:
-            print '.'
-            time.sleep(5)
-            instance.update()
-            waitcount = waitcount + 1
+    for target in targets:
+        if not target.get('replay'):
+            continue
 
-        if instance.state == 'running':
-            instance_ids.append(instance.id)
-            print 'Bee %s is ready for the attack.' % instance.id
+        print 'Dealing the access log out to the bees attacking %s.' % target['name']
+
+        target_params = [p for p in params if p['target'] == target['name']]
+
+        with tracing.span('attack.replay'):
+            failed = _ship_replay(target_params, target['replay'], guns.native.REPLAY_PATH)
+
+        for i in failed:
+            print 'Bee %i couldn\'t be given its share of the access log.' % target_params[i]['i']
+
+    print 'Stinging every target\'s URL so it will be cached for the attack.'
+
+    with tracing.span('attack.warm_up'):
+        for target in targets:
+            urllib2.urlopen(target['url'])
+
+    print 'Organizing the swarm.'
+
+    _arm(params)
+
+    monitor.start()
+
+    # Drive every bee's SSH session from this process, or the hive's
+    with tracing.span('attack.swarm'):
+        results = _swarm('attack', params)
+
+    monitor.stop()
+
+    print 'Offensive complete.'
+
+    summaries = {}
+
+    for target in targets:
+        chosen = [i for i, p in enumerate(params) if p['target'] == target['name']]
+        target_results = [results[i] for i in chosen]
+
+        if target['name'] == target['url']:
+            print 'Target %s:' % target['url']
         else:
-            print 'Bee %s seems to be lost!' % instance.id
+            print 'Target %s (%s):' % (target['name'], target['url'])
 
-    ec2_connection.create_tags(instance_ids, { "Name": "a bee!" })
+        with tracing.span('attack.summarize'):
+            _print_results(target_results)
 
-    _write_server_list(username, key_name, reservation.instances, state_file, instance_ids)
+            summary = _summarize(target_results)
 
-    print 'The swarm has assembled %i bees.' % len(instance_ids)
+        parameters = {
+            'url': target['url'],
+            'num_requests': target.get('number', 1000),
+            'concurrent_requests': target.get('concurrent', 100),
+            'gun': target.get('gun', gun),
+            'rate': target.get('rate'),
+            'rate_end': target.get('rate_end'),
+            'duration': target.get('duration', 60),
+            'workload_file': target.get('workload'),
+            'replay_file': target.get('replay'),
+            'split': split,
+            'spare': spare,
+            'abort_error_rate': abort_error_rate,
+            'abort_p99': abort_p99,
+            'abort_lost_bees': abort_lost_bees,
+            'bees': len(chosen),
+            'instance_ids': [params[i]['instance_id'] for i in chosen],
+            'scenario': names,
+            'target': target['name'],
+        }
 
-def report(state_file = STATE_FILENAME):
-    """
-    Report the status of the load testing servers.
-    """
-    username, key_name, instance_ids = _read_server_list(state_file)
+        series = timeline.build(target_results)
 
-    if not instance_ids:
-        print 'No bees have been mobilized.'
-        return
+        with tracing.span('attack.archive'):
+            path = archive.save(target_results, parameters, summary, None, archive_dir, series)
 
-    ec2_connection = boto.connect_ec2()
+        print 'This target\'s run was archived as %s.' % path
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+        summary['archive_path'] = path
+        summary['timeline'] = series
+        summaries[target['name']] = summary
 
-    instances = []
+    print 'All targets together:'
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    with tracing.span('attack.summarize'):
+        _print_results(results)
 
-    for instance in instances:
-        print 'Bee %s: %s @ %s' % (instance.id, instance.state, instance.ip_address)
+        combined = _summarize(results)
 
-def down(state_file = STATE_FILENAME):
-    """
-    Shutdown the load testing server.
-    """
-    username, key_name, instance_ids = _read_server_list(state_file)
+    width = max([len(name) for name in names] + [len('Target')])
 
-    if not instance_ids:
-        print 'No bees have been mobilized.'
-        return
+    print '     %-*s %6s %14s %12s %12s %10s' % (width, 'Target', 'Bees', 'Req/s', 'p50 [ms]', 'p99 [ms]', 'Errors')
 
-    print 'Connecting to the hive.'
+    for target in targets:
+        summary = summaries[target['name']]
+        firing = len([p for p in params if p['target'] == target['name']])
 
-    ec2_connection = boto.connect_ec2()
+        if not summary['complete_bees']:
+            print '     %-*s %6i %14s %12s %12s %10s' % (width, target['name'], firing, '-', '-', '-', '-')
+            continue
 
-    print 'Calling off the swarm.'
+        print '     %-*s %6i %14.1f %12.1f %12.1f %9.2f%%' % (
+            width,
+            target['name'],
+            firing,
+            summary['requests_per_second'],
+            histogram.percentile(summary['latency_histogram'], 50) or 0,
+            histogram.percentile(summary['latency_histogram'], 99) or 0,
+            capacity.error_rate(summary) * 100)
 
-    terminated_instance_ids = ec2_connection.terminate_instances(
-        instance_ids=instance_ids)
+    combined['timeline'] = timeline.build(results)
 
-    print 'Stood down %i bees.' % len(terminated_instance_ids)
+    if timeline_file and combined['timeline'] is not None:
+        timeline.export(combined['timeline'], timeline_file)
 
-    _delete_server_list(state_file)
+        print 'The scenario\'s combined timeline was written to %s.' % timeline_file
 
-def _attack(params):
-    """
-    Test the target URL with requests.
+    print 'The swarm is awaiting new orders.'
+
+    return {'targets': summaries, 'combined': combined}
 
-    Intended for use with multiprocessing.
+def compare(candidate = None, baseline = None, archive_dir = archive.ARCHIVE_DIR, tolerance = 0.1):
     """
-    #print 'Bee %i is joining the swarm.' % params['i']
+    Compare an archived run (by default the latest) against a baseline run
+    (by default the one before it against the same url), print the
+    differences and return whether it regressed, or None if there was
+    nothing to compare.
+    """
+    runs = archive.runs(archive_dir)
 
-    try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(
-            params['instance_name'],
-            username=params['username'],
-            key_filename=_get_pem_path(params['key_name']))
+    if candidate is None:
+        if not runs:
+            print 'No runs have been archived in %s.' % archive_dir
+            return None
 
-        #print 'Bee %i is firing his machine gun. Bang bang!' % params['i']
+        candidate = runs[-1][0]
+    else:
+        candidate = archive.find(candidate, archive_dir)
+
+        if candidate is None:
+            print 'No such run.'
+            return None
 
-        stdin, stdout, stderr = client.exec_command('ab -r -n %(num_requests)s -c %(concurrent_requests)s -C "sessionid=NotARealSessionID" "%(url)s"' % params)
+    if baseline is None:
+        url = archive.load(candidate)[0]['parameters']['url']
+        earlier = [path for path, header in runs if header['parameters']['url'] == url]
+        earlier = earlier[:earlier.index(candidate)] if candidate in earlier else earlier
 
-        response = {}
+        if not earlier:
+            print 'There is no earlier run against the same url to compare with.'
+            return None
 
-        ab_results = stdout.read()
-        ms_per_request_search = re.search('Time\ per\ request:\s+([0-9.]+)\ \[ms\]\ \(mean\)', ab_results)
+        baseline = earlier[-1]
+    else:
+        baseline = archive.find(baseline, archive_dir)
 
-        if not ms_per_request_search:
-            print 'Bee %i lost sight of the target (connection timed out).' % params['i']
+        if baseline is None:
+            print 'No such baseline run.'
             return None
 
-        requests_per_second_search = re.search('Requests\ per\ second:\s+([0-9.]+)\ \[#\/sec\]\ \(mean\)', ab_results)
-        fifty_percent_search = re.search('\s+50\%\s+([0-9]+)', ab_results)
-        ninety_percent_search = re.search('\s+90\%\s+([0-9]+)', ab_results)
-        complete_requests_search = re.search('Complete\ requests:\s+([0-9]+)', ab_results)
+    print 'Comparing %s against %s.' % (candidate, baseline)
 
-        response['ms_per_request'] = float(ms_per_request_search.group(1))
-        response['requests_per_second'] = float(requests_per_second_search.group(1))
-        response['fifty_percent'] = float(fifty_percent_search.group(1))
-        response['ninety_percent'] = float(ninety_percent_search.group(1))
-        response['complete_requests'] = float(complete_requests_search.group(1))
+    rows, regressions, inconclusive = archive.compare(candidate, baseline, tolerance)
 
-        #print 'Bee %i is out of ammo.' % params['i']
+    print '     %-24s %14s %14s %10s' % ('', 'Baseline', 'Candidate', 'Change')
 
-        client.close()
+    for label, old, new, change in rows:
+        if label == 'Error rate':
+            print '     %-24s %13.2f%% %13.2f%% %+9.2f%%' % (label, old * 100, new * 100, change * 100)
+        elif change is None:
+            print '     %-24s %14s %14.2f %10s' % (label, '-', new or 0, '-')
+        else:
+            print '     %-24s %14.2f %14.2f %+9.1f%%' % (label, old, new, change * 100)
 
-        return response
-    except socket.error, e:
-        return e
+    for note in inconclusive:
+        print 'Inconclusive: %s' % note
 
+    if not regressions:
+        print 'No regressions found.'
+        return False
 
-def _print_results(results):
+    for regression in regressions:
+        print 'Regression: %s' % regression
+
+    return True
+
+def _search_requests(n, start, level):
     """
-    Print summarized load-testing results.
+    Return how many rounds a concurrency search fires at level: n at the
+    start, and as many per connection as that from there on, so n never
+    caps the concurrency a step can reach.
     """
-    timeout_bees = [r for r in results if r is None]
-    exception_bees = [r for r in results if type(r) == socket.error]
-    complete_bees = [r for r in results if r is not None and type(r) != socket.error]
-
-    num_timeout_bees = len(timeout_bees)
-    num_exception_bees = len(exception_bees)
-    num_complete_bees = len(complete_bees)
+    return max(int(n), int(math.ceil(float(n) * level / start)))
 
-    if exception_bees:
-        print '     %i of your bees didn\'t make it to the action. They might be taking a little longer than normal to find their machine guns, or may have been terminated without using "bees down".' % num_exception_bees
+def search(url, n, c, start, limit, state_file = STATE_FILENAME, gun = guns.DEFAULT_GUN, refresh = False, mode = 'concurrency', slo_p99 = None, max_error_rate = None, duration = None,
+           archive_dir = archive.ARCHIVE_DIR, split = 'even', spare = SPARE_FRACTION):
+    """
+    Find the most load the target can take while it meets a p99 latency
+    objective (in ms) and an error-rate threshold.
 
-    if timeout_bees:
-        print '     Target timed out without fully responding to %i bees.' % num_timeout_bees
+    In concurrency mode the first step fires n rounds at the start
+    concurrency, and each step after as many rounds per connection; in rate
+    mode each step is an open-loop attack of duration seconds at a growing
+    rate, with at most c requests in flight.
+    """
+    state = _read_server_list(state_file)
 
-    if num_complete_bees == 0:
-        print '     No bees completed the mission. Apparently your bees are peace-loving hippies.'
+    if not state or not state['instances']:
+        print 'No bees are ready to attack.'
         return
 
-    complete_results = [r['complete_requests'] for r in complete_bees]
-    total_complete_requests = sum(complete_results)
-    print '     Complete requests:\t\t%i' % total_complete_requests
+    def measure(level):
+        print 'Probing the target at a %s of %s.' % (mode, level)
 
-    complete_results = [r['requests_per_second'] for r in complete_bees]
-    mean_requests = sum(complete_results)
-    print '     Requests per second:\t%f [#/sec] (mean)' % mean_requests
+        if mode == 'rate':
+            return attack(url, n, c, state_file, gun, refresh=refresh, rate=level, duration=duration, archive_dir=archive_dir, split=split)
 
-    complete_results = [r['ms_per_request'] for r in complete_bees]
-    mean_response = sum(complete_results) / num_complete_bees
-    print '     Time per request:\t\t%f [ms] (mean)' % mean_response
+        return attack(url, _search_requests(n, start, level), level, state_file, gun, refresh=refresh, archive_dir=archive_dir, split=split, spare=spare)
 
-    complete_results = [r['fifty_percent'] for r in complete_bees]
-    mean_fifty = sum(complete_results) / num_complete_bees
-    print '     50%% response time:\t\t%f [ms] (mean)' % mean_fifty
+    best, best_summary, curve = capacity.search(measure, start, limit, slo_p99, max_error_rate, integer=(mode != 'rate'))
 
-    complete_results = [r['ninety_percent'] for r in complete_bees]
-    mean_ninety = sum(complete_results) / num_complete_bees
-    print '     90%% response time:\t\t%f [ms] (mean)' % mean_ninety
+    print 'Capacity search complete.'
 
-    if mean_response < 500:
-        print 'Mission Assessment: Target crushed bee offensive.'
-    elif mean_response < 1000:
-        print 'Mission Assessment: Target successfully fended off the swarm.'
-    elif mean_response < 1500:
-        print 'Mission Assessment: Target wounded, but operational.'
-    elif mean_response < 2000:
-        print 'Mission Assessment: Target severely compromised.'
+    print '     %12s %14s %12s %12s %10s' % (mode.capitalize(), 'Req/s', 'p50 [ms]', 'p99 [ms]', 'Errors')
+
+    for level, summary, ok in sorted(curve):
+        if summary is None or not summary['complete_bees']:
+            print '     %12s %14s %12s %12s %10s  breached' % (level, '-', '-', '-', '-')
+            continue
+
+        print '     %12s %14.1f %12.1f %12.1f %9.2f%%  %s' % (
+            level,
+            summary['requests_per_second'],
+            histogram.percentile(summary['latency_histogram'], 50) or 0,
+            histogram.percentile(summary['latency_histogram'], 99) or 0,
+            capacity.error_rate(summary) * 100,
+            'ok' if ok else 'breached')
+
+    if best is None:
+        print 'The target breached the objective even at a %s of %s.' % (mode, start)
     else:
-        print 'Mission Assessment: Swarm annihilated target.'
-    
-def attack(url, n, c, state_file = STATE_FILENAME):
+        print 'Maximum sustainable %s: %s (%f [#/sec])' % (mode, best, best_summary['requests_per_second'])
+
+    return best, best_summary, curve
+
+def shell(command, state_file = STATE_FILENAME, refresh = False, output_dir = None):
     """
-    Test the root url of this site.
+    Execute a shell command on each bee
+
+    Output is printed line by line as it arrives, prefixed with the bee it
+    came from, or if output_dir is given, written to a .out and .err file
+    per bee there. Returns each bee's exit status, or the socket.error it
+    couldn't be reached with.
     """
-    username, key_name, instance_ids = _read_server_list(state_file)
+    state = _read_server_list(state_file)
 
-    if not instance_ids:
+    if not state or not state['instances']:
         print 'No bees are ready to attack.'
         return
 
-    print 'Connecting to the hive.'
-
-    ec2_connection = boto.connect_ec2()
-
-    print 'Assembling bees.'
+    username = state['username']
+    key_name = state['key_name']
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    instances = _get_instances(state, state_file, refresh)
 
-    instances = []
+    _keep_alive(state, state_file)
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    print 'Assembling bees.'
 
-    instance_count = len(instances)
-    requests_per_instance = int(float(n) / instance_count)
-    connections_per_instance = int(float(c) / instance_count)
+    if output_dir:
+        output_dir = os.path.abspath(output_dir)
 
-    print 'Each of %i bees will fire %s rounds, %s at a time.' % (instance_count, requests_per_instance, connections_per_instance)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
 
     params = []
 
     for i, instance in enumerate(instances):
         params.append({
             'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.public_dns_name,
-            'url': url,
-            'concurrent_requests': connections_per_instance,
-            'num_requests': requests_per_instance,
+            'instance_id': instance['id'],
+            'instance_name': instance['public_dns_name'],
+            'command': command,
             'username': username,
             'key_name': key_name,
+            'output_dir': output_dir,
         })
 
-    print 'Stinging URL so it will be cached for the attack.'
+    print 'Organizing the swarm.'
 
-    # Ping url so it will be cached for testing
-    urllib2.urlopen(url)
+    _multiplex(params)
 
-    print 'Organizing the swarm.'
+    # Drive every bee's SSH session from this process, or the hive's
+    with tracing.span('shell.swarm'):
+        results = _swarm('shell', params)
+
+    unreachable = [p for p, result in zip(params, results) if not isinstance(result, int)]
+    failed = [(p, result) for p, result in zip(params, results) if isinstance(result, int) and result != 0]
+
+    print '%i bees succeeded, %i failed and %i could not be reached.' % (len(results) - len(failed) - len(unreachable), len(failed), len(unreachable))
+
+    for p, status in failed[:10]:
+        print '     Bee %s exited with status %i.' % (p['instance_id'], status)
+
+    if len(failed) > 10:
+        print '     ...and %i more.' % (len(failed) - 10)
 
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_attack, params)
+    if output_dir:
+        print 'The output of each bee was written to %s.' % output_dir
 
     print 'Offensive complete.'
 
-    _print_results(results)
+    return results
 
-    print 'The swarm is awaiting new orders.'
+class _Multiplexer(object):
+    """
+    Read the output of every bee's shell command from a single thread, and
+    write it out a whole line at a time so lines from different bees never
+    interleave.
 
-def shell(command, state_file = STATE_FILENAME):
+    stdout and stderr are read together, SHELL_CHUNK bytes at a time, so
+    neither can fill up and stall the command while the other is waited on.
+    No more than MAX_LINE bytes of a line are held before it is written out.
     """
-    Execute a shell command on each bee
+
+    def __init__(self, out, output_dir=None):
+        self.out = out
+        self.output_dir = output_dir
+        self.incoming = Queue.Queue()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def add(self, bee, channel):
+        """
+        Start streaming a bee's channel, and return an Event that is set once
+        the command has exited and all its output has been written.
+        """
+        done = threading.Event()
+
+        with self.lock:
+            self.incoming.put({'bee': bee, 'channel': channel, 'done': done, 'partial': {'out': '', 'err': ''}, 'files': {}})
+
+            if not self.running:
+                self.running = True
+
+                thread = threading.Thread(target=self._run)
+                thread.daemon = True
+                thread.start()
+
+        return done
+
+    def _run(self):
+        poller = select.poll()
+        streams = {}
+
+        while True:
+            with self.lock:
+                while not self.incoming.empty():
+                    entry = self.incoming.get()
+
+                    if self.output_dir:
+                        for stream in ('out', 'err'):
+                            entry['files'][stream] = open(os.path.join(self.output_dir, '%s.%s' % (entry['bee'], stream)), 'w')
+
+                    fd = entry['channel'].fileno()
+                    poller.register(fd, select.POLLIN)
+                    streams[fd] = entry
+
+                if not streams:
+                    self.running = False
+                    return
+
+            for fd, event in poller.poll(MUX_TIMEOUT * 1000):
+                self._read(streams[fd])
+
+            for fd, entry in streams.items():
+                channel = entry['channel']
+
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    poller.unregister(fd)
+                    del streams[fd]
+                    self._finish(entry)
+
+    def _read(self, entry):
+        channel = entry['channel']
+
+        if channel.recv_ready():
+            self._feed(entry, 'out', channel.recv(SHELL_CHUNK))
+
+        if channel.recv_stderr_ready():
+            self._feed(entry, 'err', channel.recv_stderr(SHELL_CHUNK))
+
+    def _feed(self, entry, stream, data):
+        lines = (entry['partial'][stream] + data).split('\n')
+        entry['partial'][stream] = lines.pop()
+
+        if len(entry['partial'][stream]) >= MAX_LINE:
+            lines.append(entry['partial'][stream])
+            entry['partial'][stream] = ''
+
+        for line in lines:
+            self._write(entry, stream, line)
+
+    def _write(self, entry, stream, line):
+        if stream in entry['files']:
+            entry['files'][stream].write('%s\n' % line)
+        elif line:
+            self.out.write('[%s::%s] %s\n' % (entry['bee'], stream, line))
+
+    def _finish(self, entry):
+        for stream, partial in entry['partial'].items():
+            if partial:
+                self._write(entry, stream, partial)
+
+        for f in entry['files'].values():
+            f.close()
+
+        entry['done'].set()
+
+def _multiplex(params):
+    """
+    Give every bee running a shell command together the same multiplexer.
+    """
+    if not params:
+        return
+
+    mux = _Multiplexer(params[0].get('out', sys.stdout), params[0].get('output_dir'))
+
+    for p in params:
+        p['mux'] = mux
+
+def _shell(params):
+    """
+    Excecute a shell command on a bee, streaming its output through the
+    multiplexer, and return its exit status, or a socket.error saying why it
+    couldn't be reached, SSH errors included.
+
+    Intended for use with _fan_out.
+    """
+
+    try:
+        client = _connect(params)
+
+        with tracing.span('bee.shell', params['i']):
+            channel = client.get_transport().open_session()
+            channel.exec_command(params['command'])
+
+            done = params['mux'].add(params['instance_id'], channel)
+
+            # Wait with a timeout so Ctrl-C still reaches the main thread
+            while not done.is_set():
+                done.wait(1)
+
+        status = channel.recv_exit_status()
+
+        channel.close()
+        _release(client)
+
+        return status
+    except (socket.error, paramiko.SSHException), e:
+        return socket.error(str(e))
+
+def push(local_path, remote_path = None, state_file = STATE_FILENAME, refresh = False, fanout = PUSH_FANOUT):
+    """
+    Copy a file to every bee, to remote_path or by default to /tmp.
+
+    The file is sent from here to only PUSH_SEEDS bees. Then every bee that
+    has it serves it to up to fanout others at a time, so it spreads through
+    the swarm like a tree. Bees that already have the file are skipped, and
+    every chunk is checksummed, so an interrupted push resumes where it left
+    off.
+
+    Returns how many bees had, were relayed or were sent the file, and how
+    many couldn't be given it.
     """
-    username, key_name, instance_ids = _read_server_list(state_file)
+    state = _read_server_list(state_file)
 
-    if not instance_ids:
+    if not state or not state['instances']:
         print 'No bees are ready to attack.'
         return
 
-    print 'Connecting to the hive.'
+    username = state['username']
+    key_name = state['key_name']
 
-    ec2_connection = boto.connect_ec2()
+    instances = _get_instances(state, state_file, refresh)
 
-    print 'Assembling bees.'
+    _keep_alive(state, state_file)
 
-    reservations = ec2_connection.get_all_instances(instance_ids=instance_ids)
+    remote_path = remote_path or '/tmp/%s' % os.path.basename(local_path)
 
-    instances = []
+    print 'Checksumming %s.' % local_path
 
-    for reservation in reservations:
-        instances.extend(reservation.instances)
+    with tracing.span('push.checksum'):
+        manifest = _manifest(local_path)
+
+    print 'Assembling bees.'
 
     params = []
 
     for i, instance in enumerate(instances):
         params.append({
             'i': i,
-            'instance_id': instance.id,
-            'instance_name': instance.public_dns_name,
-            'command': command,
+            'instance_id': instance['id'],
+            'instance_name': instance['public_dns_name'],
+            'relay_url': 'http://%s:%i/' % (instance.get('private_ip_address') or instance['public_dns_name'], RELAY_PORT),
             'username': username,
             'key_name': key_name,
+            'local_path': os.path.abspath(local_path),
+            'remote_path': remote_path,
+            'manifest': manifest,
+            'action': 'check',
+            'source': None,
         })
 
-    print 'Organizing the swarm.'
+    print 'Checking which bees already have %s.' % remote_path
 
-    # Spin up processes for connecting to EC2 instances
-    pool = Pool(len(params))
-    results = pool.map(_shell, params)
-    
-    timeout_bees = [r for r in results if r is not True]
-    exception_bees = [r for r in results if type(r) == socket.error]
+    with tracing.span('push.check'):
+        results = _swarm('relay', params)
 
-    print "No response from %d bees / error from %d bees" % (len(timeout_bees), len(exception_bees))
+    holding = [p for p, result in zip(params, results) if result == 'had']
+    missing = [p for p, result in zip(params, results) if result is None]
+    counts = {'had': len(holding), 'relayed': 0, 'sent': 0, 'failed': len(params) - len(holding) - len(missing)}
 
-    print 'Offensive complete.'
+    while missing:
+        if holding:
+            batch = missing[:len(holding) * fanout]
 
-def _shell(params):
+            for i, p in enumerate(batch):
+                p['source'] = holding[i % len(holding)]['relay_url']
+
+            print 'Relaying the file to %i bees from %i.' % (len(batch), len(holding))
+        else:
+            batch = missing[:PUSH_SEEDS]
+
+            print 'Sending the file to %i seed bees.' % len(batch)
+
+        missing = missing[len(batch):]
+
+        for p in batch:
+            p['action'] = 'get'
+
+        with tracing.span('push.round'):
+            results = _swarm('relay', batch)
+
+        for p, result in zip(batch, results):
+            if result in ('relayed', 'sent'):
+                counts[result] += 1
+                holding.append(p)
+            else:
+                counts['failed'] += 1
+
+    for p in holding:
+        p['action'] = 'stop'
+
+    _swarm('relay', holding)
+
+    print '%(had)i bees already had the file, %(relayed)i were relayed it, %(sent)i were sent it from here and %(failed)i could not be given it.' % counts
+
+    return counts
+
+def _manifest(local_path):
+    """
+    Describe a file for the relays: its size and sha256, and the sha256 of
+    each PUSH_CHUNK_SIZE chunk of it.
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+
+    with open(local_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(PUSH_CHUNK_SIZE), ''):
+            digest.update(chunk)
+            chunks.append(hashlib.sha256(chunk).hexdigest())
+            size += len(chunk)
+
+    return {
+        'size': size,
+        'chunk_size': PUSH_CHUNK_SIZE,
+        'digest': digest.hexdigest(),
+        'chunks': chunks,
+    }
+
+def _execute(client, command):
+    """
+    Run a command on a bee and return its exit status and output.
+    """
+    channel = client.get_transport().open_session()
+    channel.exec_command(command)
+
+    output = channel.makefile('r').read()
+    status = channel.recv_exit_status()
+
+    channel.close()
+
+    return status, output
+
+def _send(client, params, offset):
     """
-    Excecute a shell command on a bee.
+    Copy a file from here to the part file on a bee, from offset on.
+    """
+    sftp = client.open_sftp()
+    f = sftp.open(params['remote_path'] + '.part', 'r+' if offset else 'w')
+    f.seek(offset)
+    f.set_pipelined(True)
+
+    with open(params['local_path'], 'rb') as local:
+        local.seek(offset)
 
-    Intended for use with multiprocessing.
+        for block in iter(lambda: local.read(REPLAY_CHUNK_SIZE), ''):
+            f.write(block)
+
+    f.close()
+    sftp.close()
+
+def _relay(params):
     """
+    Get a file being pushed onto a bee, and have the bee serve it to others.
+
+    With the action 'check', the bee only looks for the file. With 'get', it
+    fetches the chunks it's missing from params['source'], another bee's
+    relay, or if there is none or that fails, is sent them from here. Either
+    way, a bee that ends up with the file serves it on RELAY_PORT until
+    the action 'stop'.
+
+    Returns 'had', 'relayed' or 'sent', None if the bee doesn't have the
+    file, or a socket.error saying why it couldn't be reached, SSH errors
+    included.
 
+    Intended for use with _fan_out.
+    """
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(
-            params['instance_name'],
-            username=params['username'],
-            key_filename=_get_pem_path(params['key_name']))
-
-        stdin, stdout, stderr = client.exec_command(params['command'])
-
-        response = {}
-
-        results_err = stderr.read()
-        for line in results_err.split("\n"):
-            if len(line) > 0:
-                print "[%s::err] %s" % (params['instance_id'], line)
-        results = stdout.read()
-        for line in results.split("\n"):
-            if len(line) > 0:
-                print "[%s::out] %s" % (params['instance_id'], line)
+        client = _connect(params)
 
-        client.close()
+        # Only match the relay itself, not the shell running pkill
+        stop = 'pkill -f "^python %s"' % RELAY_PATH
 
-        return True
-    except socket.error, e:
-        return e
+        if params['action'] == 'stop':
+            _execute(client, stop)
+            _release(client)
+            return 'stopped'
+
+        manifest_path = '/tmp/bees-push-%s.json' % params['manifest']['digest'][:16]
+
+        _upload(client, RELAY_PATH, inspect.getsource(relay))
+        _upload(client, manifest_path, json.dumps(params['manifest']))
+
+        run = 'python %s %s "%s"' % (RELAY_PATH, manifest_path, params['remote_path'])
+        status, output = _execute(client, run)
+        result = 'had'
+
+        if params['action'] == 'get' and not output.startswith('HAVE'):
+            if params['source']:
+                with tracing.span('bee.fetch', params['i']):
+                    status, output = _execute(client, '%s --from %s' % (run, params['source']))
+
+                result = 'relayed'
+
+            if not output.startswith('DONE'):
+                with tracing.span('bee.send', params['i']):
+                    _send(client, params, int(output.split()[1]) if output.startswith('PARTIAL') else 0)
+                    status, output = _execute(client, run)
+
+                result = 'sent'
+
+        if output.startswith('HAVE') or output.startswith('DONE'):
+            _execute(client, '%s; nohup %s --serve %i > /dev/null 2>&1 < /dev/null &' % (stop, run, RELAY_PORT))
+        else:
+            result = None
+
+        _release(client)
+
+        return result
+    except (socket.error, paramiko.SSHException), e:
+        return socket.error(str(e))
+
+COMMANDS = {
+    'attack': _attack,
+    'shell': _shell,
+    'relay': _relay,
+}
@@ -0,0 +1,178 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from collections import deque
+import sys
+import threading
+import time
+
+import histogram
+
+# Only the last WINDOW seconds of requests are judged, and only once there
+# are MIN_REQUESTS of them, so a handful of early errors can't trip it.
+WINDOW = 10
+MIN_REQUESTS = 100
+
+class Breaker(object):
+    """
+    Watch every bee's errors and latencies while an attack runs, and stop
+    the whole swarm as soon as any threshold is crossed:
+
+      max_error_rate  the fraction of recent requests that failed or got a
+                      non-2xx response
+      max_p99         the 99th percentile of recent latencies, in ms
+      max_lost_bees   the fraction of bees that couldn't be reached or lost
+                      sight of the target
+
+    Each bee enlists a function that stops it. When the breaker trips, they
+    are all called at once and the reason is written to out.
+    """
+
+    def __init__(self, bees, max_error_rate=None, max_p99=None, max_lost_bees=None, out=None):
+        self.bees = bees
+        self.max_error_rate = max_error_rate
+        self.max_p99 = max_p99
+        self.max_lost_bees = max_lost_bees
+        self.out = out or sys.stdout
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.window = self._new_counts()
+        self.lost = {}
+        self.stoppers = {}
+        self.reason = None
+
+    def _new_counts(self):
+        return {
+            'complete_requests': 0,
+            'failed_requests': 0,
+            'non_2xx_responses': 0,
+            'latency_histogram': {},
+        }
+
+    def _add(self, counts, sign):
+        for key in ('complete_requests', 'failed_requests', 'non_2xx_responses'):
+            self.window[key] += sign * counts[key]
+
+        latency_histogram = self.window['latency_histogram']
+
+        for index, count in counts['latency_histogram'].items():
+            latency_histogram[index] = latency_histogram.get(index, 0) + sign * count
+
+            if not latency_histogram[index]:
+                del latency_histogram[index]
+
+    @property
+    def tripped(self):
+        return self.reason is not None
+
+    def enlist(self, bee, stop):
+        """
+        Register a function that stops bee number bee mid-attack.
+        """
+        with self.lock:
+            self.stoppers[bee] = stop
+
+    def discharge(self, bee):
+        """
+        Forget how to stop a bee that has finished.
+        """
+        with self.lock:
+            self.stoppers.pop(bee, None)
+
+    def record(self, bee, counts):
+        """
+        Count requests a bee has finished: a dict of complete_requests,
+        failed_requests and non_2xx_responses, with their latency_histogram.
+        """
+        now = time.time()
+
+        with self.lock:
+            self.recent.append((now, counts))
+            self._add(counts, 1)
+
+            while self.recent[0][0] <= now - WINDOW:
+                self._add(self.recent.popleft()[1], -1)
+
+        self._check()
+
+    def record_lost(self, bee, kind):
+        """
+        Count a bee that was 'unreachable' or 'lost' sight of the target.
+        """
+        with self.lock:
+            self.lost[bee] = kind
+
+        self._check()
+
+    def _check(self):
+        with self.lock:
+            if self.reason is not None:
+                return
+
+            reason = self._judge()
+
+            if reason is None:
+                return
+
+            self.reason = reason
+            stoppers = self.stoppers.values()
+
+        self.out.write('The breaker tripped (%s), so the swarm is being called off.\n' % reason)
+
+        for stop in stoppers:
+            thread = threading.Thread(target=stop)
+            thread.daemon = True
+            thread.start()
+
+    def _judge(self):
+        if self.max_lost_bees is not None and self.lost:
+            lost = float(len(self.lost)) / self.bees
+
+            if lost > self.max_lost_bees:
+                kinds = [kind for kind in self.lost.values()]
+
+                return '%i%% of bees lost: %i unreachable, %i lost sight of the target' % (
+                    lost * 100, kinds.count('unreachable'), kinds.count('lost'))
+
+        requests = self.window['complete_requests']
+
+        if requests < MIN_REQUESTS:
+            return None
+
+        failed = self.window['failed_requests']
+        non_2xx = self.window['non_2xx_responses']
+
+        if self.max_error_rate is not None and float(failed + non_2xx) / requests > self.max_error_rate:
+            return '%.1f%% errors in the last %is: %i failed, %i non-2xx' % (
+                100.0 * (failed + non_2xx) / requests, WINDOW, failed, non_2xx)
+
+        if self.max_p99 is not None:
+            p99 = histogram.percentile(self.window['latency_histogram'], 99)
+
+            if p99 is not None and p99 > self.max_p99:
+                return 'p99 of %.1f ms in the last %is' % (p99, WINDOW)
+
+        return None
@@ -0,0 +1,62 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Each gun is a module that knows how to run one load generator on a bee:
+#
+#   command(params)  the shell command to run over SSH
+#   payload(params)  data to send to the command's stdin, or None
+#   uploads(params)  (remote path, data) pairs to copy to the bee first
+#   parse(output)    a results dict from the command's stdout, or None if the
+#                    bee lost sight of the target
+#   frame(line)      a live metrics frame if a line of stdout is one, else None
+#   stop(params)     a shell command that interrupts the gun, so that it
+#                    reports what it has done so far and exits
+#
+# Frames hold complete_requests, failed_requests and non_2xx_responses for
+# the requests finished since the last frame, with their latency_counts as
+# [latency in ms, count] pairs.
+#
+# Results carry the keys _print_results expects: ms_per_request,
+# requests_per_second, complete_requests and latency_histogram, and
+# latency_by_second, a histogram for each second (by the bee's clock) in
+# which requests were sent. They may also carry errors_by_second, the number
+# of requests sent in each second that failed or got a non-2xx response, and
+# failed_by_kind, how many failed requests failed to connect, to be received
+# or in time, or (for ab) came back a different length. Only the last aren't
+# counted in failed_requests.
+#
+# If params has a start_at, the command must hold its fire until the bee's
+# clock reads start_at, so the whole swarm opens fire at once.
+
+import ab
+import native
+
+GUNS = {
+    'ab': ab,
+    'native': native,
+}
+
+DEFAULT_GUN = 'ab'
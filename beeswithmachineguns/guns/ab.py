@@ -0,0 +1,115 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import re
+
+from beeswithmachineguns import histogram
+
+# Printed by each bee between ab's report and its per-request latency counts
+HISTOGRAM_MARKER = '=== bees: latency histogram ==='
+
+# The kinds of failed request ab breaks its count down into
+FAILURE_KINDS = ('connect', 'receive', 'length', 'exceptions')
+
+# Whichever of the wait and ab is running records its pid here, so stop()
+# signals nothing else on the bee. exec keeps the pid the same.
+PID_PATH = '/tmp/bees-ab.pid'
+RECORDED = 'sh -c \'echo $$ > %s; exec "$0" "$@"\' ' % PID_PATH
+
+def command(params):
+    """
+    Run ab against the target.
+
+    ab writes one line per request to the gnuplot file; only the counts of
+    each distinct second it was sent in (column 2) and total time (column 5,
+    in ms) are sent back.
+    """
+    wait = ''
+
+    # ab has no way to wait, so the shell sleeps until start_at first
+    if params.get('start_at'):
+        wait = RECORDED + 'python -c "import time; time.sleep(max(0, %r - time.time()))" && ' % params['start_at']
+
+    return wait + (RECORDED + 'ab -r -n %(num_requests)s -c %(concurrent_requests)s -g /tmp/bees.$$.tsv -C "sessionid=NotARealSessionID" "%(url)s"; '
+        'rm -f %(pid_path)s; echo "%(marker)s"; tail -n +2 /tmp/bees.$$.tsv | cut -f2,5 | sort -n | uniq -c; rm -f /tmp/bees.$$.tsv' % dict(params, marker=HISTOGRAM_MARKER, pid_path=PID_PATH))
+
+def payload(params):
+    return None
+
+def uploads(params):
+    return []
+
+def stop(params):
+    """
+    Interrupt ab, which prints its report so far when it gets SIGINT, or
+    stop it from starting at all.
+    """
+    return 'kill -INT $(cat %s 2>/dev/null) 2>/dev/null' % PID_PATH
+
+def frame(line):
+    # ab only reports once it has finished
+    return None
+
+def parse(output):
+    """
+    Scrape ab's text report.
+    """
+    response = {}
+
+    ab_results, marker, latency_counts = output.partition(HISTOGRAM_MARKER)
+    ms_per_request_search = re.search('Time\ per\ request:\s+([0-9.]+)\ \[ms\]\ \(mean\)', ab_results)
+
+    if not ms_per_request_search:
+        return None
+
+    requests_per_second_search = re.search('Requests\ per\ second:\s+([0-9.]+)\ \[#\/sec\]\ \(mean\)', ab_results)
+    complete_requests_search = re.search('Complete\ requests:\s+([0-9]+)', ab_results)
+    failed_requests_search = re.search('Failed\ requests:\s+([0-9]+)', ab_results)
+    non_2xx_responses_search = re.search('Non-2xx\ responses:\s+([0-9]+)', ab_results)
+
+    response['ms_per_request'] = float(ms_per_request_search.group(1))
+    response['requests_per_second'] = float(requests_per_second_search.group(1))
+    response['complete_requests'] = float(complete_requests_search.group(1))
+    response['failed_requests'] = int(failed_requests_search.group(1)) if failed_requests_search else 0
+    response['failed_by_kind'] = {}
+
+    # ab counts a response whose length differs from the first one's as
+    # failed, which on a dynamic page is nearly every one, so those are kept
+    # apart and not counted as errors
+    breakdown_search = re.search('\(Connect:\ ([0-9]+),\ Receive:\ ([0-9]+),\ Length:\ ([0-9]+),\ Exceptions:\ ([0-9]+)\)', ab_results)
+
+    if breakdown_search:
+        for kind, count in zip(FAILURE_KINDS, breakdown_search.groups()):
+            if int(count):
+                response['failed_by_kind'][kind] = int(count)
+
+        response['failed_requests'] -= response['failed_by_kind'].get('length', 0)
+
+    response['non_2xx_responses'] = int(non_2xx_responses_search.group(1)) if non_2xx_responses_search else 0
+    response['latency_by_second'] = histogram.from_timed_counts(latency_counts)
+    response['latency_histogram'] = histogram.merge(response['latency_by_second'].values())
+
+    return response
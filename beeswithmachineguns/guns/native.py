@@ -0,0 +1,123 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import inspect
+import json
+
+from beeswithmachineguns import histogram
+from beeswithmachineguns import stinger
+
+FRAME_INTERVAL = 1
+WORKLOAD_PATH = '/tmp/bees-workload.json'
+REPLAY_PATH = '/tmp/bees-replay.log'
+
+# The stinger records its pid here, so stop() signals nothing else on the
+# bee; it passes the signal on to its own workers. exec keeps the pid the
+# same.
+PID_PATH = '/tmp/bees-stinger.pid'
+RECORDED = 'sh -c \'echo $$ > %s; exec "$0" "$@"\' ' % PID_PATH
+
+def command(params):
+    """
+    Run the stinger load generator, which is read from stdin.
+    """
+    options = '-n %(num_requests)s -c %(concurrent_requests)s -i %(interval)s' % dict(params, interval=FRAME_INTERVAL)
+
+    if params.get('rate'):
+        options += ' --rate %(rate)s --rate-end %(rate_end)s --duration %(duration)s' % params
+
+    if params.get('workload'):
+        options += ' --workload %s' % WORKLOAD_PATH
+
+    if params.get('start_at'):
+        options += ' --start-at %r' % params['start_at']
+
+    # A replay sends every request in the bee's share of the log, however many
+    if params.get('replay'):
+        options += ' --replay %s -n 0' % REPLAY_PATH
+
+    return '%spython - %s "%s"; rm -f %s' % (RECORDED, options, params['url'], PID_PATH)
+
+def payload(params):
+    return inspect.getsource(stinger)
+
+def uploads(params):
+    if params.get('workload'):
+        return [(WORKLOAD_PATH, json.dumps(params['workload']))]
+
+    return []
+
+def stop(params):
+    """
+    Interrupt the stinger, which then reports its tallies so far.
+    """
+    return 'kill -INT $(cat %s 2>/dev/null) 2>/dev/null' % PID_PATH
+
+def frame(line):
+    if not line.startswith('FRAME '):
+        return None
+
+    return json.loads(line[len('FRAME '):])
+
+def parse(output):
+    """
+    Read the stinger's RESULT line.
+    """
+    for line in output.splitlines():
+        if line.startswith('RESULT '):
+            break
+    else:
+        return None
+
+    result = json.loads(line[len('RESULT '):])
+
+    if not result['complete_requests'] or result['failed_requests'] == result['complete_requests']:
+        return None
+
+    latency_histogram = {}
+    latency_by_second = {}
+
+    for latency, count in result['latency_counts']:
+        histogram.record(latency_histogram, latency, count)
+
+    for second, latency, count in result['timed_counts']:
+        histogram.record(latency_by_second.setdefault(second, {}), latency, count)
+
+    errors_by_second = dict((second, count) for second, count in result.get('timed_errors', []))
+
+    response = {}
+
+    response['ms_per_request'] = result['ms_per_request']
+    response['requests_per_second'] = result['requests_per_second']
+    response['complete_requests'] = float(result['complete_requests'])
+    response['failed_requests'] = result['failed_requests']
+    response['failed_by_kind'] = result.get('failed_by_kind', {})
+    response['non_2xx_responses'] = result['non_2xx_responses']
+    response['latency_histogram'] = latency_histogram
+    response['latency_by_second'] = latency_by_second
+    response['errors_by_second'] = errors_by_second
+
+    return response
@@ -0,0 +1,154 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import math
+
+# Latencies are counted in logarithmic buckets. Each bucket's representative
+# value is within RELATIVE_ERROR of every latency it holds, so histograms from
+# any number of bees can be merged by adding counts and still give percentiles
+# with the same accuracy as a single bee.
+RELATIVE_ERROR = 0.01
+MIN_VALUE = 0.001
+PERCENTILES = (50, 90, 99, 99.9)
+
+_GAMMA = (1 + RELATIVE_ERROR) / (1 - RELATIVE_ERROR)
+_LOG_GAMMA = math.log(_GAMMA)
+
+def bucket_index(value):
+    """
+    Return the bucket a latency (in ms) is counted in.
+
+    Bucket 0 holds everything at or below MIN_VALUE.
+    """
+    if value <= MIN_VALUE:
+        return 0
+
+    return int(math.ceil(math.log(float(value) / MIN_VALUE) / _LOG_GAMMA))
+
+def bucket_value(index):
+    """
+    Return the representative latency (in ms) of a bucket.
+    """
+    if index <= 0:
+        return 0.0
+
+    return MIN_VALUE * 2 * _GAMMA ** index / (_GAMMA + 1)
+
+def record(histogram, value, count=1):
+    """
+    Count a latency (in ms) in a histogram.
+    """
+    index = bucket_index(value)
+    histogram[index] = histogram.get(index, 0) + count
+
+def merge(histograms):
+    """
+    Combine any number of histograms into a new one.
+    """
+    merged = {}
+
+    for histogram in histograms:
+        for index, count in histogram.iteritems():
+            merged[index] = merged.get(index, 0) + count
+
+    return merged
+
+def count(histogram):
+    """
+    Return the number of latencies in a histogram.
+    """
+    return sum(histogram.itervalues())
+
+def percentile(histogram, percent):
+    """
+    Return the latency (in ms) that percent of all requests completed within.
+    """
+    total = count(histogram)
+
+    if not total:
+        return None
+
+    rank = max(1, int(math.ceil(total * percent / 100.0)))
+    seen = 0
+
+    for index in sorted(histogram):
+        seen += histogram[index]
+
+        if seen >= rank:
+            return bucket_value(index)
+
+def mean(histogram):
+    """
+    Return the mean latency (in ms) in a histogram.
+    """
+    total = count(histogram)
+
+    if not total:
+        return None
+
+    return sum([bucket_value(index) * n for index, n in histogram.iteritems()]) / total
+
+def maximum(histogram):
+    """
+    Return the longest latency (in ms) in a histogram.
+    """
+    if not histogram:
+        return None
+
+    return bucket_value(max(histogram))
+
+def from_counts(text):
+    """
+    Build a histogram from "uniq -c" style lines of "<count> <latency>".
+    """
+    histogram = {}
+
+    for line in text.splitlines():
+        fields = line.split()
+
+        if len(fields) != 2:
+            continue
+
+        record(histogram, float(fields[1]), int(fields[0]))
+
+    return histogram
+
+def from_timed_counts(text):
+    """
+    Build a histogram for each second from "uniq -c" style lines of
+    "<count> <second> <latency>", keyed by the second.
+    """
+    histograms = {}
+
+    for line in text.splitlines():
+        fields = line.split()
+
+        if len(fields) != 3:
+            continue
+
+        record(histograms.setdefault(int(fields[1]), {}), float(fields[2]), int(fields[0]))
+
+    return histograms
@@ -0,0 +1,219 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import json
+import os
+import socket
+import SocketServer
+import sys
+import threading
+
+import bees
+
+SOCKET_PATH = os.path.expanduser('~/.bees.sock')
+
+# Results travel as JSON, so the few things in them that JSON can't hold
+# are wrapped on the way out and unwrapped on the way back.
+
+def _encode(result):
+    if isinstance(result, socket.error):
+        return {'socket_error': str(result)}
+
+    if isinstance(result, dict) and 'latency_histogram' in result:
+        encoded = dict(result,
+            latency_histogram=sorted(result['latency_histogram'].items()),
+            latency_by_second=[[second, sorted(h.items())] for second, h in sorted(result.get('latency_by_second', {}).items())])
+
+        if 'errors_by_second' in result:
+            encoded['errors_by_second'] = sorted(result['errors_by_second'].items())
+
+        return encoded
+
+    return result
+
+def _decode(result):
+    if isinstance(result, dict) and 'socket_error' in result:
+        return socket.error(result['socket_error'])
+
+    if isinstance(result, dict) and 'latency_histogram' in result:
+        decoded = dict(result,
+            latency_histogram=dict(result['latency_histogram']),
+            latency_by_second=dict((second, dict(h)) for second, h in result['latency_by_second']))
+
+        if 'errors_by_second' in result:
+            decoded['errors_by_second'] = dict((second, count) for second, count in result['errors_by_second'])
+
+        return decoded
+
+    return result
+
+class _Relay(object):
+    """
+    Send a bee's output and live frames back to the bees command that asked
+    for them, one JSON message per line.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.wfile.write('%s\n' % json.dumps(message))
+            self.wfile.flush()
+
+    def write(self, text):
+        self.send({'out': text})
+
+    def record(self, bee, frame):
+        self.send({'frame': [bee, frame]})
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+
+        # is_running() connects without asking for anything
+        if not line.strip():
+            return
+
+        request = json.loads(line)
+        relay = _Relay(self.wfile)
+
+        params = request['params']
+
+        for p in params:
+            p['out'] = relay
+            p['monitor'] = relay
+
+        # The bees wait for each other, share out spare work and stream their
+        # output through one multiplexer here, not in the bees command
+        if request['command'] == 'attack':
+            bees._arm(params)
+        elif request['command'] == 'shell':
+            bees._multiplex(params)
+
+        results = bees._fan_out(bees.COMMANDS[request['command']], params)
+
+        relay.send({'results': [_encode(result) for result in results]})
+
+def serve(socket_path=SOCKET_PATH):
+    """
+    Run the hive agent until interrupted.
+
+    The agent keeps an authenticated SSH session open to every bee it has
+    talked to, and runs attack and shell requests from the bees command over
+    a local socket, so back-to-back commands skip the SSH handshakes.
+    """
+    if is_running(socket_path):
+        print 'The hive is already running at %s.' % socket_path
+        return
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+
+    bees._sessions = {}
+
+    # Create the socket 0600 from the start; a chmod afterwards would leave a
+    # moment in which another user could connect and give orders
+    umask = os.umask(0177)
+
+    try:
+        server = SocketServer.ThreadingUnixStreamServer(socket_path, _Handler)
+    finally:
+        os.umask(umask)
+
+    server.daemon_threads = True
+
+    print 'The hive is listening at %s.' % socket_path
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+
+        for client in bees._sessions.values():
+            client.close()
+
+    print 'The hive has dispersed.'
+
+def is_running(socket_path=SOCKET_PATH):
+    """
+    Check whether a hive agent is answering at socket_path.
+    """
+    if not os.path.exists(socket_path):
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+    return True
+
+def request(command, params, socket_path=SOCKET_PATH):
+    """
+    Have the hive agent run a command on every bee and return the results.
+
+    Output and live frames from the bees are printed and handed to the
+    caller's monitor as they arrive.
+    """
+    monitor = None
+
+    if params:
+        monitor = params[0].get('monitor')
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path)
+
+    try:
+        message = {
+            'command': command,
+            'params': [dict((key, value) for key, value in p.items() if key not in ('out', 'monitor', 'barrier', 'pool', 'breaker', 'mux')) for p in params],
+        }
+
+        sock.sendall('%s\n' % json.dumps(message))
+
+        for line in sock.makefile('r'):
+            message = json.loads(line)
+
+            if 'out' in message:
+                sys.stdout.write(message['out'])
+            elif 'frame' in message:
+                if monitor is not None:
+                    monitor.record(*message['frame'])
+            elif 'results' in message:
+                return [_decode(result) for result in message['results']]
+    finally:
+        sock.close()
+
+    raise socket.error('The hive hung up before the bees reported back.')
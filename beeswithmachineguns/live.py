@@ -0,0 +1,194 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from array import array
+import json
+import sys
+import threading
+import time
+
+import histogram
+
+class Monitor(object):
+    """
+    Merge metric frames from every bee as they arrive and print a running
+    aggregate once per interval.
+
+    Only the current interval and a running latency histogram are held, so
+    memory stays flat however long the attack runs. A row of SERIES numbers
+    is also kept for the run's archive, one per interval until there are
+    MAX_ROWS, when neighbouring rows are merged in pairs and each row from
+    then on covers twice as many intervals. A merged row holds the total
+    counts of its intervals and the worst of their percentiles.
+
+    Every frame is also appended to frames_file, if one is given, as a line
+    of JSON.
+    """
+
+    SERIES = ('second', 'complete_requests', 'errors', 'p50', 'p99')
+    MAX_ROWS = 3600
+
+    def __init__(self, interval=1, frames_file=None):
+        self.interval = interval
+        self.frames = None
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.thread = None
+        self.started = None
+        self.window = self._new_counts()
+        self.totals = self._new_counts()
+        self.series = dict((column, array('d')) for column in self.SERIES)
+        self.stride = 1
+        self.pending = None
+        self.pending_intervals = 0
+
+        if frames_file:
+            self.frames = open(frames_file, 'a')
+
+    def _new_counts(self):
+        return {
+            'complete_requests': 0,
+            'failed_requests': 0,
+            'non_2xx_responses': 0,
+            'latency_histogram': {},
+        }
+
+    def _add(self, counts, frame):
+        counts['complete_requests'] += frame['complete_requests']
+        counts['failed_requests'] += frame['failed_requests']
+        counts['non_2xx_responses'] += frame['non_2xx_responses']
+
+        for latency, count in frame['latency_counts']:
+            histogram.record(counts['latency_histogram'], latency, count)
+
+    def record(self, bee, frame):
+        """
+        Count a frame reported by bee number bee.
+        """
+        with self.lock:
+            self._add(self.window, frame)
+            self._add(self.totals, frame)
+
+            if self.frames:
+                self.frames.write('%s\n' % json.dumps(dict(frame, bee=bee)))
+
+    def start(self):
+        self.started = time.time()
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+        # Keep the last few intervals even if they don't fill a row
+        if self.pending is not None:
+            for column in self.SERIES:
+                self.series[column].append(self.pending[column])
+
+            self.pending = None
+
+        with self.lock:
+            if self.frames:
+                self.frames.close()
+                self.frames = None
+
+    def _run(self):
+        last = self.started
+
+        while not self.done.is_set():
+            self.done.wait(self.interval)
+
+            now = time.time()
+
+            with self.lock:
+                window = self.window
+                self.window = self._new_counts()
+
+            if self.totals['complete_requests']:
+                self._keep(window, now - self.started)
+                self._print(window, now - last, now - self.started)
+
+            last = now
+
+    def _merge_rows(self, a, b):
+        return {
+            'second': b['second'],
+            'complete_requests': a['complete_requests'] + b['complete_requests'],
+            'errors': a['errors'] + b['errors'],
+            'p50': max(a['p50'], b['p50']),
+            'p99': max(a['p99'], b['p99']),
+        }
+
+    def _keep(self, window, running):
+        latency = window['latency_histogram']
+
+        row = {
+            'second': running,
+            'complete_requests': window['complete_requests'],
+            'errors': window['failed_requests'] + window['non_2xx_responses'],
+            'p50': histogram.percentile(latency, 50) or 0,
+            'p99': histogram.percentile(latency, 99) or 0,
+        }
+
+        self.pending = row if self.pending is None else self._merge_rows(self.pending, row)
+        self.pending_intervals += 1
+
+        if self.pending_intervals < self.stride:
+            return
+
+        for column in self.SERIES:
+            self.series[column].append(self.pending[column])
+
+        self.pending = None
+        self.pending_intervals = 0
+
+        if len(self.series['second']) >= self.MAX_ROWS:
+            rows = [dict((column, self.series[column][i]) for column in self.SERIES) for i in range(len(self.series['second']))]
+            merged = [self._merge_rows(*rows[i:i + 2]) if i + 1 < len(rows) else rows[i] for i in range(0, len(rows), 2)]
+
+            self.series = dict((column, array('d', [row[column] for row in merged])) for column in self.SERIES)
+            self.stride *= 2
+
+    def _print(self, window, elapsed, running):
+        latency = window['latency_histogram']
+
+        if histogram.count(latency):
+            latencies = 'p50 %.1f ms, p99 %.1f ms' % (histogram.percentile(latency, 50), histogram.percentile(latency, 99))
+        else:
+            latencies = 'no responses'
+
+        print '     [%5is] %10.1f req/s, %s, %i errors (%i requests so far)' % (
+            running,
+            window['complete_requests'] / elapsed,
+            latencies,
+            window['failed_requests'] + window['non_2xx_responses'],
+            self.totals['complete_requests'])
+        sys.stdout.flush()
@@ -25,8 +25,13 @@ THE SOFTWARE.
 """
 
 import bees
+import guns
+import hive
+import json
 import re
+import session
 import sys
+import tracing
 from optparse import OptionParser, OptionGroup
 
 NO_TRAILING_SLASH_REGEX = re.compile(r'^.*?\.\w+$')
@@ -45,11 +50,18 @@ A utility for arming (creating) many bees (small EC2 instances) to attack
 (load test) targets (web applications).
 
 commands:
-  up      Start a batch of load testing servers.
+  up      Start a batch of load testing servers, or grow or shrink the swarm.
+  attach  Take over a swarm called up elsewhere, by its name.
   attack  Begin the attack on a specific url.
+  scenario Attack several urls at once, each with its share of the bees.
+  search  Attack repeatedly to find the most load a url can sustain.
+  compare Compare an archived attack against a baseline.
   down    Shutdown and deactivate the load testing servers.
+  reap    Shutdown the bees of any swarm that have been idle too long.
   report  Report the status of the load testing servers.
   shell   Run a command on each bee.
+  push    Copy a file to each bee, relayed from bee to bee.
+  hive    Keep SSH sessions to the bees open for the commands that follow.
     """)
     
     general_group = OptionGroup(parser, "general", """General options for all commands""")
@@ -57,6 +69,16 @@ commands:
     general_group.add_option('-f', '--file',  metavar="STATE_FILE",  nargs=1,
                         action='store', dest='statefile', type='string', default=bees.STATE_FILENAME,
                         help="The state file to use (default: ~/.bees). Note that if you use this option, you have to set it for attack, down, and report.")
+    general_group.add_option('-r', '--refresh', action='store_true', dest='refresh', default=False,
+                        help="Look the bees up in EC2 even if the addresses cached in the state file are still fresh.")
+    general_group.add_option('--archive', metavar="ARCHIVE_DIR", nargs=1,
+                        action='store', dest='archive', type='string', default=bees.archive.ARCHIVE_DIR,
+                        help="The directory every attack's results are archived in (default: ~/.bees-runs).")
+    general_group.add_option('--profile', action='store_true', dest='profile', default=False,
+                        help="Time each phase of the command, overall and for each bee, and print where the time went at the end.")
+    general_group.add_option('--trace', metavar="TRACE_FILE", nargs=1,
+                        action='store', dest='trace', type='string',
+                        help="Write the timed phases to this file in the Chrome trace format, to open in chrome://tracing or Perfetto. With the hive running, the bees' own phases happen there and aren't included.")
 
     parser.add_option_group(general_group)
 
@@ -76,13 +98,24 @@ commands:
                         help="The security group to run the instances under (default: default).")
     up_group.add_option('-z', '--zone',  metavar="ZONE",  nargs=1,
                         action='store', dest='zone', type='string', default='us-east-1d',
-                        help="The availability zone to start the instances in (default: us-east-1d).")
+                        help="The availability zone to start the instances in, or several separated by commas to spread them over (default: us-east-1d).")
     up_group.add_option('-i', '--instance',  metavar="INSTANCE",  nargs=1,
                         action='store', dest='instance', type='string', default='ami-ff17fb96',
                         help="The instance-id to use for each server from (default: ami-ff17fb96).")
     up_group.add_option('-l', '--login',  metavar="LOGIN",  nargs=1,
                         action='store', dest='login', type='string', default='newsapps',
                         help="The ssh username name to use to connect to the new servers (default: newsapps).")
+    up_group.add_option('-t', '--type',  metavar="TYPE",  nargs=1,
+                        action='store', dest='type', type='string', default=bees.EC2_INSTANCE_TYPE,
+                        help="The EC2 instance type to start (default: %s). Attacks warn when the bees run out of CPU or bandwidth and a bigger type would help." % bees.EC2_INSTANCE_TYPE)
+    up_group.add_option('-S', '--swarm',  metavar="SWARM",  nargs=1,
+                        action='store', dest='swarm', type='string', default=bees.DEFAULT_SWARM,
+                        help="The name the swarm is tagged with in EC2, for attach to find it by (default: %s)." % bees.DEFAULT_SWARM)
+    up_group.add_option('--ttl',  metavar="MINUTES",  nargs=1,
+                        action='store', dest='ttl', type='float',
+                        help="Reap the bees once they have gone this many minutes without an attack or shell command. Run bees reap from cron to enforce it (default: never).")
+    up_group.add_option('--wait-for-ssh', action='store_true', dest='wait_for_ssh', default=False,
+                        help="Only count a bee as ready once its SSH server is answering, not just when EC2 says it is running.")
     
     parser.add_option_group(up_group)
 
@@ -100,17 +133,103 @@ commands:
     attack_group.add_option('-c', '--concurrent', metavar="CONCURRENT", nargs=1,
                         action='store', dest='concurrent', type='int', default=100,
                         help="The number of concurrent connections to make to the target (default: 100).")
+    attack_group.add_option('-G', '--gun', metavar="GUN", nargs=1,
+                        action='store', dest='gun', type='choice', choices=sorted(guns.GUNS.keys()), default=guns.DEFAULT_GUN,
+                        help="The load generator each bee fires: ab, or native for the built-in keep-alive engine (default: %s)." % guns.DEFAULT_GUN)
+    attack_group.add_option('--rate', metavar="RATE", nargs=1,
+                        action='store', dest='rate', type='float',
+                        help="Send this many requests per second across the whole swarm on a fixed timeline, instead of -n rounds. Latency is measured from when each request was due. Needs the native gun.")
+    attack_group.add_option('--rate-end', metavar="RATE", nargs=1,
+                        action='store', dest='rate_end', type='float',
+                        help="Ramp linearly from --rate to this many requests per second over the attack (default: no ramp).")
+    attack_group.add_option('--duration', metavar="SECONDS", nargs=1,
+                        action='store', dest='duration', type='float', default=60,
+                        help="How long a --rate attack lasts, in seconds (default: 60).")
+    attack_group.add_option('--workload', metavar="WORKLOAD_FILE", nargs=1,
+                        action='store', dest='workload', type='string',
+                        help="A JSON file of weighted requests, each with a url and optionally a method, headers and body, to pick from instead of hitting -u alone. Relative urls are joined to -u. Needs the native gun.")
+    attack_group.add_option('--replay', metavar="LOG_FILE", nargs=1,
+                        action='store', dest='replay', type='string',
+                        help="An access log (common or combined format, optionally gzipped) whose requests are dealt out to the bees and replayed against -u instead of -n rounds. Needs the native gun.")
+    attack_group.add_option('--split', metavar="SPLIT", nargs=1,
+                        action='store', dest='split', type='choice', choices=sorted(bees.SPLITS.keys()), default='even',
+                        help="How to share the attack out between the bees: even, by instance type, or by the capacity they were measured at in earlier archived runs (default: even).")
+    attack_group.add_option('--spare', metavar="FRACTION", nargs=1,
+                        action='store', dest='spare', type='float', default=bees.SPARE_FRACTION,
+                        help="The fraction of -n rounds to hold back and hand out in chunks to whichever bees finish first, or 0 to give every bee its whole share at once (default: %s)." % bees.SPARE_FRACTION)
+    attack_group.add_option('--abort-errors', metavar="FRACTION", nargs=1,
+                        action='store', dest='abort_errors', type='float', default=bees.ABORT_ERROR_RATE,
+                        help="Stop every bee early if more than this fraction of the last few seconds' requests fail or get a non-2xx response, or 1 to never stop for errors. Checked every second with the native gun, but with ab only between rounds (default: %s)." % bees.ABORT_ERROR_RATE)
+    attack_group.add_option('--abort-p99', metavar="MS", nargs=1,
+                        action='store', dest='abort_p99', type='float',
+                        help="Stop every bee early if the 99th percentile response time of the last few seconds passes this many milliseconds. Checked every second with the native gun, but with ab only between rounds.")
+    attack_group.add_option('--abort-lost', metavar="FRACTION", nargs=1,
+                        action='store', dest='abort_lost', type='float',
+                        help="Stop every bee early if more than this fraction of them can't be reached or lose sight of the target.")
+    attack_group.add_option('--timeline', metavar="TIMELINE_FILE", nargs=1,
+                        action='store', dest='timeline', type='string',
+                        help="A file to write the whole swarm's throughput, latency percentiles and errors to, second by second: CSV, or JSON if the name ends in .json.")
+    attack_group.add_option('--frames', metavar="FRAMES_FILE", nargs=1,
+                        action='store', dest='frames', type='string',
+                        help="A file to append the live metric frames from every bee to, one JSON object per line. Only the native gun reports frames.")
     
     parser.add_option_group(attack_group)
     
+    scenario_group = OptionGroup(parser, "scenario",
+            """bees scenario SCENARIO_FILE attacks every target in a JSON file at once, sharing the swarm out between them. The file holds a list of targets, each with a url and optionally a name, number, concurrent, rate, rate_end, duration, workload, replay and gun like the attack options, and bees, its share of the swarm relative to the other targets' (default: 1). The attack options apply to every target that doesn't set its own, and the abort thresholds to the whole swarm.""")
+
+    parser.add_option_group(scenario_group)
+
+    search_group = OptionGroup(parser, "search",
+            """Searching takes the same options as attack. The first step fires -n rounds at --start concurrency and later steps as many rounds per connection, or with --search-mode rate, sends a growing --rate for --duration seconds.""")
+
+    search_group.add_option('--search-mode', metavar="MODE", nargs=1,
+                        action='store', dest='search_mode', type='choice', choices=['concurrency', 'rate'], default='concurrency',
+                        help="Whether to grow the concurrency or the request rate (default: concurrency).")
+    search_group.add_option('--start', metavar="LEVEL", nargs=1,
+                        action='store', dest='start', type='float', default=10,
+                        help="The concurrency or rate of the first step (default: 10).")
+    search_group.add_option('--limit', metavar="LEVEL", nargs=1,
+                        action='store', dest='limit', type='float', default=10000,
+                        help="The highest concurrency or rate to try (default: 10000).")
+    search_group.add_option('--slo-p99', metavar="MS", nargs=1,
+                        action='store', dest='slo_p99', type='float',
+                        help="Stop once the 99th percentile response time exceeds this many milliseconds.")
+    search_group.add_option('--max-errors', metavar="FRACTION", nargs=1,
+                        action='store', dest='max_errors', type='float', default=0.01,
+                        help="Stop once this fraction of requests fail or get a non-2xx response (default: 0.01).")
+
+    parser.add_option_group(search_group)
+
+    compare_group = OptionGroup(parser, "compare",
+            """bees compare [RUN [BASELINE]] compares an archived run, by default the latest, with a baseline, by default the run before it against the same url. Runs are given by path or run ID. It exits with status 1 if the run regressed, or 2 if there was no run or baseline to compare.""")
+
+    compare_group.add_option('--tolerance', metavar="FRACTION", nargs=1,
+                        action='store', dest='tolerance', type='float', default=0.1,
+                        help="How much worse a statistically significant change must be to count as a regression (default: 0.1).")
+
+    parser.add_option_group(compare_group)
+
     shell_group = OptionGroup(parser, "shell", """Run a command on each bee""")
     
     shell_group.add_option('-e', '--execute',  metavar="COMMAND",  nargs=1,
                         action='store', dest='command', type='string',
                         help="The command to run")
+    shell_group.add_option('-o', '--output-dir',  metavar="OUTPUT_DIR",  nargs=1,
+                        action='store', dest='output_dir', type='string',
+                        help="Write each bee's output to its own INSTANCE_ID.out and INSTANCE_ID.err files in this directory, instead of printing it prefixed with the bee it came from.")
 
     parser.add_option_group(shell_group)
 
+    push_group = OptionGroup(parser, "push",
+            """bees push FILE [REMOTE_PATH] copies FILE to REMOTE_PATH, by default in /tmp, on every bee that doesn't already have it. It is sent from here to a couple of bees, which relay it to the rest over port %i, so the bees' security group must let them reach each other on it.""" % bees.RELAY_PORT)
+
+    push_group.add_option('--fanout', metavar="FANOUT", nargs=1,
+                        action='store', dest='fanout', type='int', default=bees.PUSH_FANOUT,
+                        help="How many bees each bee with the file relays it to at once (default: %i)." % bees.PUSH_FANOUT)
+
+    parser.add_option_group(push_group)
+
     (options, args) = parser.parse_args()
 
     if len(args) <= 0:
@@ -118,6 +237,41 @@ commands:
 
     command = args[0]
 
+    if options.profile or options.trace:
+        tracing.enable()
+
+    try:
+        with tracing.span(command):
+            run_command(parser, options, args)
+    finally:
+        if options.profile:
+            tracing.report()
+
+        if options.trace:
+            tracing.export(options.trace)
+
+            print 'Wrote a trace of the command to %s.' % options.trace
+
+def run_command(parser, options, args):
+    """
+    Carry out the command given on the command line.
+    """
+    command = args[0]
+
+    if command == 'hive':
+        hive.serve()
+        return
+
+    # Every other command is given through a session, as a script would
+    with session.Session(options.statefile, options.archive, refresh=options.refresh) as orders:
+        give_orders(orders, parser, options, args)
+
+def give_orders(orders, parser, options, args):
+    """
+    Give the command on the command line to the swarm, through a session.
+    """
+    command = args[0]
+
     if command == 'up':
         if not options.key:
             parser.error('To spin up new instances you need to specify a key-pair name with -k')
@@ -125,7 +279,12 @@ commands:
         if options.group == 'default':
             print 'New bees will use the "default" EC2 security group. Please note that port 22 (SSH) is not normally open on this group. You will need to use to the EC2 tools to open it before you will be able to attack.'
 
-        bees.up(options.servers, options.group, options.zone, options.instance, options.login, options.key, options.statefile)
+        ttl = options.ttl * 60 if options.ttl is not None else None
+
+        orders.up(options.servers, options.key, options.group, options.zone, options.instance, options.login, options.type, options.swarm, ttl,
+                  options.wait_for_ssh)
+    elif command == 'attach':
+        orders.attach(options.swarm)
     elif command == 'attack':
         if not options.url:
             parser.error('To run an attack you need to specify a url with -u')
@@ -133,16 +292,88 @@ commands:
         if NO_TRAILING_SLASH_REGEX.match(options.url):
             parser.error('It appears your URL lacks a trailing slash, this will disorient the bees. Please try again with a trailing slash.')
 
-        bees.attack(options.url, options.number, options.concurrent, options.statefile)
+        if options.rate and options.gun != 'native':
+            parser.error('Only the native gun can hold a steady --rate; add --gun native.')
+
+        if (options.workload or options.replay) and options.gun != 'native':
+            parser.error('Only the native gun can follow a --workload or --replay; add --gun native.')
+
+        orders.attack(options.url, options.number, options.concurrent, options.gun, frames_file=options.frames,
+                      rate=options.rate, rate_end=options.rate_end, duration=options.duration, workload_file=options.workload, replay_file=options.replay,
+                      split=options.split, spare=options.spare, abort_error_rate=options.abort_errors, abort_p99=options.abort_p99,
+                      abort_lost_bees=options.abort_lost, timeline_file=options.timeline)
+    elif command == 'scenario':
+        if len(args) != 2:
+            parser.error('Please give a scenario file of targets to attack.')
+
+        with open(args[1]) as f:
+            targets = json.load(f)
+
+        for target in targets:
+            if not target.get('url'):
+                parser.error('Every target in the scenario needs a url.')
+
+            if NO_TRAILING_SLASH_REGEX.match(target['url']):
+                parser.error('It appears the url %s lacks a trailing slash, this will disorient the bees. Please try again with a trailing slash.' % target['url'])
+
+            target.setdefault('name', target['url'])
+            target.setdefault('number', options.number)
+            target.setdefault('concurrent', options.concurrent)
+            target.setdefault('duration', options.duration)
+
+            if (target.get('rate') or target.get('workload') or target.get('replay')) and target.get('gun', options.gun) != 'native':
+                parser.error('Only the native gun can hold a steady rate or follow a workload or replay; give %s "gun": "native" or add --gun native.' % target['name'])
+
+        orders.scenario(targets, options.gun, frames_file=options.frames, split=options.split, spare=options.spare,
+                        abort_error_rate=options.abort_errors, abort_p99=options.abort_p99, abort_lost_bees=options.abort_lost,
+                        timeline_file=options.timeline)
+    elif command == 'search':
+        if not options.url:
+            parser.error('To run a search you need to specify a url with -u')
+
+        if NO_TRAILING_SLASH_REGEX.match(options.url):
+            parser.error('It appears your URL lacks a trailing slash, this will disorient the bees. Please try again with a trailing slash.')
+
+        if options.search_mode == 'rate' and options.gun != 'native':
+            parser.error('Only the native gun can hold a steady --rate; add --gun native.')
+
+        start, limit = options.start, options.limit
+
+        if options.search_mode == 'concurrency':
+            start, limit = int(start), int(limit)
+
+        orders.search(options.url, options.number, options.concurrent, start, limit, options.gun, mode=options.search_mode,
+                      slo_p99=options.slo_p99, max_error_rate=options.max_errors, duration=options.duration, split=options.split, spare=options.spare)
+    elif command == 'compare':
+        if len(args) > 3:
+            parser.error('Please give at most a run and a baseline to compare.')
+
+        runs = args[1:] + [None, None]
+
+        regressed = orders.compare(runs[0], runs[1], options.tolerance)
+
+        # A missing run mustn't pass for one that didn't regress
+        if regressed is None:
+            sys.exit(2)
+
+        if regressed:
+            sys.exit(1)
     elif command == 'down':
-        bees.down(options.statefile)
+        orders.down()
+    elif command == 'reap':
+        orders.reap()
     elif command == 'report':
-        bees.report(options.statefile)
+        orders.report()
     elif command == 'shell':
         if not options.command:
             parser.error('You must specify a shell command with -e')
         
-        bees.shell(options.command, options.statefile)
+        orders.shell(options.command, options.output_dir)
+    elif command == 'push':
+        if len(args) not in (2, 3):
+            parser.error('Please give a file to push and optionally where to put it on the bees.')
+
+        orders.push(args[1], (args[2:] + [None])[0], options.fanout)
 
 
 def main():
@@ -0,0 +1,251 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# A standalone file relay, used by bees push. It has no dependencies outside
+# the standard library and runs under Python 2.6+ or 3, so it can be copied to
+# a bee and run there:
+#
+#   python bees-relay.py MANIFEST PATH [--from URL]
+#   python bees-relay.py MANIFEST PATH --serve PORT
+#
+# The manifest is a JSON file describing the file to be pushed:
+#
+#   {"size": 12582912, "chunk_size": 8388608, "digest": "<sha256>",
+#    "chunks": ["<sha256 of chunk 0>", "<sha256 of chunk 1>"]}
+#
+# The file is put together in PATH.part. First the chunks already there are
+# checked against the manifest, and the part is cut back to the last good
+# one, so an interrupted push resumes where it left off. With --from, the
+# missing chunks are then fetched from another bee's relay, a Range request
+# each, and checked as they arrive. Once every chunk is there, the part is
+# renamed to PATH. One line says how it went:
+#
+#   HAVE            PATH already matched the manifest
+#   DONE            PATH was completed
+#   PARTIAL <n>     the first n bytes are in PATH.part and have been checked
+#
+# With --serve, PATH is served over HTTP on PORT to any bee that asks, until
+# nobody has asked for --idle seconds.
+
+import hashlib
+import json
+import optparse
+import os
+import sys
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+
+TIMEOUT = 30
+RETRIES = 3
+COPY_SIZE = 64 * 1024
+
+def _digest(path):
+    """
+    Return the sha256 of a file, read COPY_SIZE bytes at a time.
+    """
+    digest = hashlib.sha256()
+    f = open(path, 'rb')
+
+    for block in iter(lambda: f.read(COPY_SIZE), b''):
+        digest.update(block)
+
+    f.close()
+
+    return digest.hexdigest()
+
+def _chunk_size(manifest, i):
+    return min(manifest['chunk_size'], manifest['size'] - i * manifest['chunk_size'])
+
+def have(manifest, path):
+    """
+    Check whether path already holds the file in the manifest.
+    """
+    return os.path.isfile(path) and os.path.getsize(path) == manifest['size'] and _digest(path) == manifest['digest']
+
+def verify(manifest, part_path):
+    """
+    Check the chunks in a part file against the manifest, cut it back to
+    the last good one, and return how many are good.
+    """
+    if not os.path.isfile(part_path):
+        open(part_path, 'wb').close()
+        return 0
+
+    f = open(part_path, 'r+b')
+    good = 0
+
+    for i, expected in enumerate(manifest['chunks']):
+        chunk = f.read(_chunk_size(manifest, i))
+
+        if len(chunk) < _chunk_size(manifest, i) or hashlib.sha256(chunk).hexdigest() != expected:
+            break
+
+        good += 1
+
+    f.truncate(good * manifest['chunk_size'] if good < len(manifest['chunks']) else manifest['size'])
+    f.close()
+
+    return good
+
+def fetch(manifest, part_path, good, url):
+    """
+    Fetch the chunks after the first good ones from url into a part file,
+    checking each one, and return how many are good afterwards.
+    """
+    f = open(part_path, 'ab')
+
+    for i in range(good, len(manifest['chunks'])):
+        start = i * manifest['chunk_size']
+        end = start + _chunk_size(manifest, i) - 1
+
+        for attempt in range(RETRIES):
+            try:
+                response = urlopen(Request(url, headers={'Range': 'bytes=%i-%i' % (start, end)}), timeout=TIMEOUT)
+                chunk = response.read()
+                response.close()
+            except (IOError, OSError):
+                continue
+
+            if hashlib.sha256(chunk).hexdigest() == manifest['chunks'][i]:
+                break
+        else:
+            sys.stderr.write('Chunk %i could not be fetched intact from %s.\n' % (i, url))
+            f.close()
+            return i
+
+        f.write(chunk)
+        f.flush()
+
+    f.close()
+
+    return len(manifest['chunks'])
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def serve(path, port, idle):
+    """
+    Serve path to every GET, whatever the URL, honouring a single byte
+    Range, until no request has come in for idle seconds.
+    """
+    size = os.path.getsize(path)
+    last = [time.time()]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            last[0] = time.time()
+
+            start, end = 0, size - 1
+            ranged = self.headers.get('Range', '')
+
+            if ranged.startswith('bytes='):
+                first, _, final = ranged[len('bytes='):].partition('-')
+                start = int(first or 0)
+                end = min(int(final or end), end)
+
+            self.send_response(206 if ranged else 200)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+
+            f = open(path, 'rb')
+            f.seek(start)
+            remaining = end - start + 1
+
+            while remaining > 0:
+                block = f.read(min(COPY_SIZE, remaining))
+
+                if not block:
+                    break
+
+                self.wfile.write(block)
+                remaining -= len(block)
+
+            f.close()
+
+            last[0] = time.time()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = _Server(('', port), Handler)
+    server.timeout = 1
+
+    while time.time() - last[0] < idle:
+        server.handle_request()
+
+    server.server_close()
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] MANIFEST PATH')
+    parser.add_option('--from', dest='source',
+                      help='The URL of another relay to fetch the missing chunks from.')
+    parser.add_option('--serve', dest='port', type='int',
+                      help='Serve PATH on this port instead.')
+    parser.add_option('--idle', dest='idle', type='float', default=600,
+                      help='Stop serving after this many seconds without a request (default: 600).')
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 2:
+        parser.error('Please give a manifest and a path.')
+
+    f = open(args[0])
+    manifest = json.load(f)
+    f.close()
+
+    path = args[1]
+
+    if options.port:
+        serve(path, options.port, options.idle)
+        return
+
+    if have(manifest, path):
+        print('HAVE')
+        return
+
+    part_path = path + '.part'
+    good = verify(manifest, part_path)
+
+    if options.source and good < len(manifest['chunks']):
+        good = fetch(manifest, part_path, good, options.source)
+
+    if good == len(manifest['chunks']):
+        os.rename(part_path, path)
+        print('DONE')
+    else:
+        print('PARTIAL %i' % (good * manifest['chunk_size']))
+
+if __name__ == '__main__':
+    main()
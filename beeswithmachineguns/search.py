@@ -0,0 +1,124 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import histogram
+
+GROWTH = 2.0
+PRECISION = 0.1
+
+def meets_slo(summary, slo_p99=None, max_error_rate=None):
+    """
+    Check an attack's summary against a p99 latency objective (in ms) and an
+    error-rate threshold. An attack that no bee finished never meets them.
+    """
+    if summary is None or not summary['complete_bees']:
+        return False
+
+    if max_error_rate is not None and error_rate(summary) > max_error_rate:
+        return False
+
+    if slo_p99 is not None:
+        p99 = histogram.percentile(summary['latency_histogram'], 99)
+
+        if p99 is None or p99 > slo_p99:
+            return False
+
+    return True
+
+def error_rate(summary):
+    """
+    Return the fraction of requests that failed or got a non-2xx response.
+    """
+    if not summary['complete_requests']:
+        return 1.0
+
+    return float(summary['failed_requests'] + summary['non_2xx_responses']) / summary['complete_requests']
+
+def search(measure, start, limit, slo_p99=None, max_error_rate=None, integer=True):
+    """
+    Find the highest load level that meets the SLO.
+
+    measure(level) runs one attack at a level (a concurrency or a rate) and
+    returns its summary. Levels grow by GROWTH from start until the SLO is
+    breached or limit is reached, then the gap between the last good level
+    and the first bad one is bisected until it is within PRECISION of the
+    good one. Integer levels stop bisecting when there's no level between.
+
+    Returns the best level (None if even start breached the SLO), its
+    summary, and the curve of (level, summary, ok) for every attack run.
+    """
+    curve = []
+
+    def attempt(level):
+        summary = measure(level)
+        ok = meets_slo(summary, slo_p99, max_error_rate)
+        curve.append((level, summary, ok))
+        return summary, ok
+
+    best, best_summary = None, None
+    level = start
+
+    # Grow until something breaks
+    while True:
+        summary, ok = attempt(level)
+
+        if not ok:
+            break
+
+        best, best_summary = level, summary
+
+        if level >= limit:
+            return best, best_summary, curve
+
+        level = min(limit, level * GROWTH)
+
+        if integer:
+            level = int(level)
+
+    if best is None:
+        return None, None, curve
+
+    # Bisect between the last good level and the first bad one
+    low, high = best, level
+
+    while high - low > low * PRECISION:
+        middle = (low + high) / 2.0
+
+        if integer:
+            middle = int(middle)
+
+            if middle <= low:
+                break
+
+        summary, ok = attempt(middle)
+
+        if ok:
+            low = middle
+            best, best_summary = middle, summary
+        else:
+            high = middle
+
+    return best, best_summary, curve
@@ -0,0 +1,330 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Run the bees from Python instead of the command line.
+#
+# A Session gives the same orders as the bees script, but returns what came
+# of them as named tuples rather than printing it. What the script would
+# print is handed, a line at a time, to the session's progress callback, or
+# printed as usual if there isn't one. The session keeps its EC2 connection
+# and the SSH sessions to the bees open from one order to the next, so a
+# suite of attacks doesn't pay to connect again for each one:
+#
+#     with Session(progress=log.info) as session:
+#         session.up(10, 'frakkingtoasters', group='public')
+#
+#         for c in (10, 100, 1000):
+#             print session.attack('http://www.ournewwebbyhotness.com/', 10000, c).p99
+#
+#         session.down()
+#
+# Only one session should be open in a process at a time, since the
+# connections are kept in the bees module.
+
+from collections import namedtuple
+import sys
+import threading
+
+import archive
+import bees
+import guns
+import histogram
+import search as capacity
+
+Bee = namedtuple('Bee', 'id state address instance_type zone')
+
+Swarm = namedtuple('Swarm', 'name username key_name bees')
+
+Attack = namedtuple('Attack', [
+    'complete_requests', 'failed_requests', 'non_2xx_responses', 'error_rate',
+    'requests_per_second', 'ms_per_request', 'p50', 'p90', 'p99',
+    'complete_bees', 'stopped_reason', 'recommendation', 'archive_path', 'timeline', 'summary'])
+
+Scenario = namedtuple('Scenario', 'targets combined')
+
+Search = namedtuple('Search', 'best attack curve')
+
+Step = namedtuple('Step', 'level attack ok')
+
+ShellResult = namedtuple('ShellResult', 'bee status error')
+
+Push = namedtuple('Push', 'had relayed sent failed')
+
+class _Progress(object):
+    """
+    A stand-in for sys.stdout that hands each whole line written to it, from
+    any thread, to a callback.
+    """
+    encoding = None
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.partial = ''
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        with self.lock:
+            lines = (self.partial + text).split('\n')
+            self.partial = lines.pop()
+
+            for line in lines:
+                self.callback(line)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        with self.lock:
+            if self.partial:
+                self.callback(self.partial)
+
+            self.partial = ''
+
+def _capture(progress, func, *args, **kwargs):
+    """
+    Call func, handing each line it prints to progress instead.
+    """
+    stdout = sys.stdout
+    sys.stdout = out = _Progress(progress)
+
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sys.stdout = stdout
+        out.close()
+
+def _bee(instance):
+    return Bee(instance['id'], instance.get('state'), instance.get('public_dns_name'), instance.get('instance_type'), instance.get('placement'))
+
+def _attack(summary):
+    """
+    Turn an attack's summary into an Attack, or None if there wasn't one.
+    """
+    if summary is None:
+        return None
+
+    latency = summary['latency_histogram']
+
+    return Attack(
+        summary['complete_requests'],
+        summary['failed_requests'],
+        summary['non_2xx_responses'],
+        capacity.error_rate(summary),
+        summary['requests_per_second'],
+        summary['ms_per_request'],
+        histogram.percentile(latency, 50),
+        histogram.percentile(latency, 90),
+        histogram.percentile(latency, 99),
+        summary['complete_bees'],
+        summary['stopped_reason'],
+        summary['recommendation'],
+        summary.get('archive_path'),
+        summary.get('timeline'),
+        summary)
+
+class Session(object):
+    """
+    Give orders to the swarm in the roster at state_file, archiving attacks
+    in archive_dir.
+
+    progress, if given, is called with each line of output instead of it
+    being printed. If refresh is set, the bees are looked up in EC2 before
+    every order even if the roster's addresses are still fresh.
+    """
+    def __init__(self, state_file = bees.STATE_FILENAME, archive_dir = archive.ARCHIVE_DIR, progress = None, refresh = False):
+        self.state_file = state_file
+        self.archive_dir = archive_dir
+        self.progress = progress
+        self.refresh = refresh
+
+        # Leave the connections alone if the hive or another session owns them
+        self.owns_ec2 = not bees._keep_ec2
+        self.owns_sessions = bees._sessions is None
+
+        if self.owns_ec2:
+            bees._keep_ec2 = True
+
+        if self.owns_sessions:
+            bees._sessions = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the session's SSH sessions to the bees and its EC2 connection.
+        """
+        if self.owns_sessions and bees._sessions is not None:
+            for client in bees._sessions.values():
+                client.close()
+
+            bees._sessions = None
+
+        if self.owns_ec2 and bees._keep_ec2:
+            if bees._ec2 is not None:
+                bees._ec2.close()
+
+            bees._keep_ec2 = False
+            bees._ec2 = None
+
+    def _run(self, func, *args, **kwargs):
+        """
+        Carry out an order, sending what it prints to the progress callback.
+        """
+        if self.progress is None:
+            return func(*args, **kwargs)
+
+        return _capture(self.progress, func, *args, **kwargs)
+
+    def swarm(self):
+        """
+        Return the swarm as the roster has it, without asking EC2.
+        """
+        state = _capture(lambda line: None, bees._read_server_list, self.state_file)
+
+        if not state:
+            return Swarm(None, None, None, [])
+
+        return Swarm(state.get('swarm'), state['username'], state['key_name'], [_bee(instance) for instance in state['instances']])
+
+    def up(self, count, key_name, group = 'default', zone = 'us-east-1d', image_id = 'ami-ff17fb96', username = 'newsapps',
+           instance_type = bees.EC2_INSTANCE_TYPE, swarm = bees.DEFAULT_SWARM, ttl = None, wait_for_ssh = False):
+        """
+        Grow or shrink the swarm to count bees, as bees.up does, and return it.
+        """
+        self._run(bees.up, count, group, zone, image_id, username, key_name, self.state_file, wait_for_ssh, instance_type, swarm, ttl)
+
+        return self.swarm()
+
+    def attach(self, swarm = bees.DEFAULT_SWARM):
+        """
+        Take over a swarm called up elsewhere, and return it.
+        """
+        self._run(bees.attach, swarm, self.state_file)
+
+        return self.swarm()
+
+    def report(self):
+        """
+        Look the bees up in EC2 and return the swarm.
+        """
+        self._run(bees.report, self.state_file)
+
+        return self.swarm()
+
+    def attack(self, url, n, c, gun = guns.DEFAULT_GUN, **kwargs):
+        """
+        Attack url with n requests over c connections, taking the rest of
+        bees.attack's options as keywords, and return an Attack, or None if
+        no bees are ready.
+        """
+        kwargs.setdefault('refresh', self.refresh)
+        kwargs.setdefault('archive_dir', self.archive_dir)
+
+        return _attack(self._run(bees.attack, url, n, c, self.state_file, gun, **kwargs))
+
+    def scenario(self, targets, gun = guns.DEFAULT_GUN, **kwargs):
+        """
+        Attack every target at once, as bees.scenario does, taking the rest
+        of its options as keywords. Returns a Scenario of an Attack for each
+        target by name and one for the whole swarm, or None if no bees are
+        ready.
+        """
+        kwargs.setdefault('refresh', self.refresh)
+        kwargs.setdefault('archive_dir', self.archive_dir)
+
+        found = self._run(bees.scenario, targets, self.state_file, gun, **kwargs)
+
+        if found is None:
+            return None
+
+        return Scenario(dict((name, _attack(summary)) for name, summary in found['targets'].items()), _attack(found['combined']))
+
+    def search(self, url, n, c, start, limit, gun = guns.DEFAULT_GUN, **kwargs):
+        """
+        Search for the most load url can sustain, taking the rest of
+        bees.search's options as keywords. Returns a Search of the best
+        level, the Attack at it and a Step for every attack run, or None if
+        no bees are ready.
+        """
+        kwargs.setdefault('refresh', self.refresh)
+        kwargs.setdefault('archive_dir', self.archive_dir)
+
+        found = self._run(bees.search, url, n, c, start, limit, self.state_file, gun, **kwargs)
+
+        if found is None:
+            return None
+
+        best, summary, curve = found
+
+        return Search(best, _attack(summary), [Step(level, _attack(step_summary), ok) for level, step_summary, ok in curve])
+
+    def compare(self, candidate = None, baseline = None, tolerance = 0.1):
+        """
+        Compare an archived run with a baseline, and return whether it
+        regressed, or None if either couldn't be found.
+        """
+        return self._run(bees.compare, candidate, baseline, self.archive_dir, tolerance)
+
+    def shell(self, command, output_dir = None):
+        """
+        Run command on every bee, and return a ShellResult for each, with
+        its exit status or why it couldn't be reached.
+        """
+        results = self._run(bees.shell, command, self.state_file, self.refresh, output_dir)
+
+        if results is None:
+            return []
+
+        return [ShellResult(bee.id, result if isinstance(result, int) else None, None if isinstance(result, int) else str(result))
+            for bee, result in zip(self.swarm().bees, results)]
+
+    def push(self, local_path, remote_path = None, fanout = bees.PUSH_FANOUT):
+        """
+        Copy a file to every bee that doesn't have it, and return a Push
+        counting how each bee came by it.
+        """
+        counts = self._run(bees.push, local_path, remote_path, self.state_file, self.refresh, fanout)
+
+        if counts is None:
+            return None
+
+        return Push(**counts)
+
+    def down(self):
+        """
+        Stand the swarm down, and return the IDs of the bees that were.
+        """
+        return self._run(bees.down, self.state_file) or []
+
+    def reap(self):
+        """
+        Terminate every swarm's idle bees, and return their IDs.
+        """
+        return self._run(bees.reap, self.state_file)
@@ -0,0 +1,537 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# A standalone load generator, used by the "native" gun. It has no
+# dependencies outside the standard library and runs under Python 2.6+ or 3,
+# so it can be piped to a bee's interpreter or run locally:
+#
+#   python -m beeswithmachineguns.stinger -n 1000 -c 10 http://localhost:8000/
+#
+# Every worker thread holds one keep-alive connection to the target. The
+# tallies are printed as a single "RESULT <json>" line when the attack ends.
+# With -i, a "FRAME <json>" line holding the requests finished since the last
+# frame is also printed every interval seconds while the attack runs.
+#
+# By default the attack is closed-loop: each connection sends its next request
+# as soon as the last one is answered. With --rate it is open-loop instead:
+# requests are due on a fixed timeline, optionally ramping linearly to
+# --rate-end over --duration seconds, and each one's latency is measured from
+# when it was due, so a slow target can't hide its queueing delay.
+#
+# Every request goes to URL unless --workload or --replay says otherwise. A
+# workload is a JSON file of weighted requests:
+#
+#   {"requests": [{"url": "/search?q=bees", "weight": 5},
+#                 {"url": "/login", "method": "POST", "weight": 1,
+#                  "headers": {"Content-Type": "application/json"},
+#                  "body": "{\"user\": \"bee\"}"}]}
+#
+# A replay is an access log in common or combined log format, whose requests
+# are sent once each, in order. Relative URLs in either are joined to URL.
+#
+# With --start-at, the workers are started and then held until that time (in
+# seconds since the epoch), so many stingers can open fire together. Each
+# latency is also counted against the second its request was sent in.
+#
+# SIGINT stops the attack early; the RESULT line then holds the requests
+# finished so far. Only the stinger itself need be signalled: it passes the
+# signal on to its worker processes.
+
+import bisect
+import errno
+import gzip
+import itertools
+import json
+import math
+import multiprocessing
+import optparse
+import os
+import random
+import re
+import signal
+import socket
+import sys
+import threading
+import time
+
+try:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urlparse import urljoin, urlsplit
+except ImportError:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urljoin, urlsplit
+
+TIMEOUT = 30
+HEADERS = {'Cookie': 'sessionid=NotARealSessionID'}
+LOG_REQUEST = re.compile(r'"([A-Z]+) (\S+)[^"]*"')
+
+# Set to stop every worker after the request it is sending
+_stopping = threading.Event()
+
+def _connect(target):
+    if target.scheme == 'https':
+        return HTTPSConnection(target.hostname, target.port, timeout=TIMEOUT)
+
+    return HTTPConnection(target.hostname, target.port, timeout=TIMEOUT)
+
+def _request(base, url, method='GET', headers=None, body=None):
+    target = urlsplit(urljoin(base, url))
+    path = target.path or '/'
+
+    if target.query:
+        path += '?' + target.query
+
+    return target, method, path, dict(HEADERS, **(headers or {})), body
+
+def _single(url):
+    request = _request(url, url)
+
+    return lambda: request
+
+def _weighted(url, workload):
+    """
+    Return a source of requests picked at random, in proportion to their
+    weights, from a workload file.
+    """
+    f = open(workload)
+    entries = json.load(f)['requests']
+    f.close()
+
+    requests = [_request(url, entry['url'], entry.get('method', 'GET'), entry.get('headers'), entry.get('body')) for entry in entries]
+    cumulative = []
+    total = 0
+
+    for entry in entries:
+        total += entry.get('weight', 1)
+        cumulative.append(total)
+
+    return lambda: requests[bisect.bisect(cumulative, random.random() * total)]
+
+def _replay(url, replay, shard, shards):
+    """
+    Return a source of the requests in an access log, read a line at a time,
+    that hands out every line whose number is shard modulo shards once and
+    then None.
+    """
+    if replay.endswith('.gz'):
+        lines = enumerate(gzip.open(replay, 'rt'))
+    else:
+        lines = enumerate(open(replay))
+
+    lock = threading.Lock()
+
+    def next_request():
+        lock.acquire()
+
+        try:
+            for number, line in lines:
+                if number % shards != shard:
+                    continue
+
+                match = LOG_REQUEST.search(line)
+
+                if match:
+                    return _request(url, match.group(2), match.group(1))
+        finally:
+            lock.release()
+
+        return None
+
+    return next_request
+
+def _new_tally():
+    return {
+        'complete_requests': 0,
+        'failed_requests': 0,
+        'non_2xx_responses': 0,
+        'latency_counts': {},
+        'timed_counts': {},
+        'timed_errors': {},
+        'failed_by_kind': {},
+    }
+
+def _merge_tallies(tallies):
+    merged = _new_tally()
+
+    for tally in tallies:
+        for key in ('complete_requests', 'failed_requests', 'non_2xx_responses'):
+            merged[key] += tally[key]
+
+        for latency, count in tally['latency_counts'].items():
+            merged['latency_counts'][latency] = merged['latency_counts'].get(latency, 0) + count
+
+        for key, count in tally['timed_counts'].items():
+            merged['timed_counts'][key] = merged['timed_counts'].get(key, 0) + count
+
+        for second, count in tally['timed_errors'].items():
+            merged['timed_errors'][second] = merged['timed_errors'].get(second, 0) + count
+
+        for kind, count in tally['failed_by_kind'].items():
+            merged['failed_by_kind'][kind] = merged['failed_by_kind'].get(kind, 0) + count
+
+    return merged
+
+# Errors that mean the bee never got through to the target
+CONNECT_ERRORS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+def _failure_kind(error):
+    """
+    Say whether a request failed to connect, to be answered in time, or to
+    be received whole.
+    """
+    if isinstance(error, socket.timeout):
+        return 'timeout'
+
+    if isinstance(error, socket.gaierror) or (isinstance(error, socket.error) and error.errno in CONNECT_ERRORS):
+        return 'connect'
+
+    return 'receive'
+
+def _tally(tally, ms, status, start=None, kind=None):
+    """
+    Count one finished request; ms and status are None if it failed, and
+    kind says how. If the time the request was sent is given, its latency,
+    or if it failed or got a non-2xx response, the error, is also counted
+    against that second.
+    """
+    tally['complete_requests'] += 1
+
+    if start is not None and (status is None or not 200 <= status < 300):
+        tally['timed_errors'][int(start)] = tally['timed_errors'].get(int(start), 0) + 1
+
+    if status is None:
+        tally['failed_requests'] += 1
+        tally['failed_by_kind'][kind] = tally['failed_by_kind'].get(kind, 0) + 1
+        return
+
+    # Three significant figures keeps the counts compact at 0.5% error
+    latency = float('%.3g' % ms)
+    tally['latency_counts'][latency] = tally['latency_counts'].get(latency, 0) + 1
+
+    if start is not None:
+        key = (int(start), latency)
+        tally['timed_counts'][key] = tally['timed_counts'].get(key, 0) + 1
+
+    if not 200 <= status < 300:
+        tally['non_2xx_responses'] += 1
+
+def schedule(rate, rate_end, duration):
+    """
+    Return how many requests a rate profile holds, and a function giving the
+    second each one is due at, for a rate that ramps linearly from rate to
+    rate_end requests per second over duration seconds.
+    """
+    total = int((rate + rate_end) * duration / 2.0)
+    slope = (rate_end - rate) / (2.0 * duration)
+
+    def due(ticket):
+        if slope == 0:
+            return ticket / float(rate)
+
+        return (math.sqrt(rate * rate + 4 * slope * ticket) - rate) / (2 * slope)
+
+    return total, due
+
+def _worker(source, num_requests, due, started, tickets, tally, window, window_lock):
+    # One keep-alive connection per host the requests go to
+    connections = {}
+
+    for ticket in tickets:
+        if _stopping.is_set() or (num_requests and ticket >= num_requests):
+            break
+
+        request = source()
+
+        if request is None:
+            break
+
+        target, method, path, headers, body = request
+
+        if due is None:
+            start = time.time()
+        else:
+            start = started + due(ticket)
+
+            _stopping.wait(max(0, start - time.time()))
+
+            if _stopping.is_set():
+                break
+
+        connection = connections.get(target.netloc)
+
+        if connection is None:
+            connection = connections[target.netloc] = _connect(target)
+
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (socket.error, HTTPException):
+            ms, status, kind = None, None, _failure_kind(sys.exc_info()[1])
+            connection.close()
+            del connections[target.netloc]
+        else:
+            ms, status, kind = (time.time() - start) * 1000, response.status, None
+
+            if response.will_close:
+                connection.close()
+                del connections[target.netloc]
+
+        _tally(tally, ms, status, start, kind)
+
+        if window is not None:
+            window_lock.acquire()
+            _tally(window, ms, status, kind=kind)
+            window_lock.release()
+
+    for connection in connections.values():
+        connection.close()
+
+def _report(window, window_lock, interval, emit, done):
+    """
+    Hand a frame of everything counted in window to emit every interval
+    seconds, and once more after done is set.
+    """
+    while not done.is_set():
+        done.wait(interval)
+
+        window_lock.acquire()
+        frame = dict(window)
+        window.update(_new_tally())
+        window_lock.release()
+
+        del frame['timed_counts']
+        del frame['timed_errors']
+        frame['t'] = time.time()
+        frame['latency_counts'] = sorted(frame['latency_counts'].items())
+
+        emit(frame)
+
+def _source(url, workload=None, replay=None, shard=(0, 1)):
+    if replay:
+        return _replay(url, replay, *shard)
+
+    if workload:
+        return _weighted(url, workload)
+
+    return _single(url)
+
+def fire(url, num_requests, concurrency, interval=0, emit=None, profile=None, workload=None, replay=None, shard=(0, 1), start_at=None):
+    """
+    Send num_requests to url over concurrency keep-alive connections from this
+    process and return the tallies. A num_requests of 0 means no limit.
+
+    Requests are drawn from the workload file or replay log if one is given;
+    only lines of the log in this process's (index, count) shard are sent.
+
+    If interval and emit are given, emit is called with a frame of the
+    requests finished since the last one every interval seconds.
+
+    If profile is given, it is a (rate, rate_end, duration) tuple for an
+    open-loop attack, and num_requests is ignored.
+
+    If start_at is given, nothing is sent until then.
+    """
+    source = _source(url, workload, replay, shard)
+
+    window = None
+    window_lock = threading.Lock()
+
+    if interval and emit:
+        window = _new_tally()
+
+    due = None
+
+    if profile is not None:
+        num_requests, due = schedule(*profile)
+
+    done = threading.Event()
+    reporter = None
+
+    if window is not None:
+        reporter = threading.Thread(target=_report, args=(window, window_lock, interval, emit, done))
+        reporter.daemon = True
+        reporter.start()
+
+    if start_at is not None:
+        _stopping.wait(max(0, start_at - time.time()))
+
+    start = time.time()
+
+    tickets = itertools.count()
+    tallies = [_new_tally() for i in range(concurrency)]
+    threads = [threading.Thread(target=_worker, args=(source, num_requests, due, start, tickets, tally, window, window_lock)) for tally in tallies]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(1)
+
+    tally = _merge_tallies(tallies)
+    tally['elapsed'] = time.time() - start
+
+    if reporter is not None:
+        done.set()
+        reporter.join()
+
+    return tally
+
+def _fire_process(url, num_requests, concurrency, interval, frames, profile, workload, replay, shard, start_at, results):
+    emit = None
+
+    if frames is not None:
+        emit = frames.put
+
+    results.put(fire(url, num_requests, concurrency, interval, emit, profile, workload, replay, shard, start_at))
+
+def _split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+def attack(url, num_requests, concurrency, processes=1, interval=0, emit=None, profile=None, workload=None, replay=None, start_at=None):
+    """
+    Run an attack, spread over several processes if asked, and return the
+    results in the same shape as the ab gun's.
+
+    Frames from every process are handed to emit as they arrive. An open-loop
+    profile's rates are shared out evenly between the processes, and each
+    process replays its own shard of the log.
+    """
+    processes = max(1, min(processes, concurrency))
+
+    if processes == 1:
+        tallies = [fire(url, num_requests, concurrency, interval, emit, profile, workload, replay, start_at=start_at)]
+    else:
+        frames = None
+        printer = None
+        results = multiprocessing.Queue()
+
+        if interval and emit:
+            frames = multiprocessing.Queue()
+            printer = threading.Thread(target=lambda: [emit(frame) for frame in iter(frames.get, None)])
+            printer.daemon = True
+            printer.start()
+
+        share_profile = None
+
+        if profile is not None:
+            rate, rate_end, duration = profile
+            share_profile = (float(rate) / processes, float(rate_end) / processes, duration)
+
+        workers = []
+
+        shares = zip(_split(num_requests, processes), _split(concurrency, processes))
+
+        for i, (share_requests, share_concurrency) in enumerate(shares):
+            worker = multiprocessing.Process(target=_fire_process, args=(url, share_requests, share_concurrency, interval, frames, share_profile,
+                                                                          workload, replay, (i, processes), start_at, results))
+            worker.start()
+            workers.append(worker)
+
+        tallies = [results.get() for _ in workers]
+
+        for worker in workers:
+            worker.join()
+
+        if printer is not None:
+            frames.put(None)
+            printer.join()
+
+    result = _merge_tallies(tallies)
+    elapsed = max(tally['elapsed'] for tally in tallies)
+    complete = result['complete_requests']
+
+    result['elapsed'] = elapsed
+    result['requests_per_second'] = complete / elapsed if elapsed else 0.0
+    result['ms_per_request'] = concurrency * elapsed * 1000 / complete if complete else 0.0
+    result['latency_counts'] = sorted(result['latency_counts'].items())
+    result['timed_counts'] = [[second, latency, count] for (second, latency), count in sorted(result['timed_counts'].items())]
+    result['timed_errors'] = sorted(result['timed_errors'].items())
+
+    return result
+
+_output_lock = threading.Lock()
+
+def _write(kind, data):
+    _output_lock.acquire()
+    sys.stdout.write('%s %s\n' % (kind, json.dumps(data)))
+    sys.stdout.flush()
+    _output_lock.release()
+
+def _stop(signum, frame):
+    """
+    Stop firing, and have every worker process stop too.
+    """
+    _stopping.set()
+
+    for worker in multiprocessing.active_children():
+        os.kill(worker.pid, signal.SIGINT)
+
+def main():
+    parser = optparse.OptionParser(usage='%prog [options] URL')
+    parser.add_option('-n', dest='number', type='int', default=1000,
+                      help='Total number of requests to send, or 0 for no limit (default: 1000).')
+    parser.add_option('-c', dest='concurrent', type='int', default=100,
+                      help='Number of keep-alive connections to hold open (default: 100).')
+    parser.add_option('-p', dest='processes', type='int', default=multiprocessing.cpu_count(),
+                      help='Number of worker processes (default: one per CPU).')
+    parser.add_option('-i', dest='interval', type='float', default=0,
+                      help='Seconds between FRAME lines, or 0 for none (default: 0).')
+    parser.add_option('--rate', dest='rate', type='float',
+                      help='Send this many requests per second on a fixed timeline instead of -n.')
+    parser.add_option('--rate-end', dest='rate_end', type='float',
+                      help='Ramp linearly from --rate to this many requests per second (default: no ramp).')
+    parser.add_option('--duration', dest='duration', type='float', default=60,
+                      help='Seconds an open-loop attack lasts (default: 60).')
+    parser.add_option('--workload', dest='workload',
+                      help='A JSON file of weighted requests to pick from instead of URL.')
+    parser.add_option('--replay', dest='replay',
+                      help='An access log whose requests to send once each, in order, instead of URL.')
+    parser.add_option('--start-at', dest='start_at', type='float',
+                      help='Hold fire until this time, in seconds since the epoch.')
+
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('Please give exactly one URL.')
+
+    # Worker processes inherit this, so each stops and reports what it has
+    signal.signal(signal.SIGINT, _stop)
+
+    profile = None
+
+    if options.rate:
+        profile = (options.rate, options.rate_end or options.rate, options.duration)
+
+    result = attack(args[0], options.number, options.concurrent, options.processes,
+                    options.interval, lambda frame: _write('FRAME', frame), profile, options.workload, options.replay, options.start_at)
+
+    _write('RESULT', result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Watch a bee's own resources while it attacks, to tell a saturated bee from
+# a slow target.
+#
+# A sampler runs in the background on the bee alongside the gun, copying the
+# raw counters from /proc/stat, /proc/net/dev and /proc/net/sockstat every
+# INTERVAL seconds. They are sent back after the gun's own report, and turned
+# into rates here.
+
+import math
+
+MARKER = '=== bees: telemetry ==='
+INTERVAL = 1
+SAMPLES_PATH = '/tmp/bees-telemetry.$$'
+
+# A bee is saturated if, on average over the attack, its CPU is this busy,
+# the hypervisor steals this much of it (as it does from a t1.micro out of
+# CPU credits), it uses this much of its nominal bandwidth, or this many of
+# its ephemeral ports are stuck in TIME_WAIT.
+MAX_CPU_BUSY = 0.9
+MAX_CPU_STEAL = 0.1
+MAX_BANDWIDTH = 0.8
+MAX_TIME_WAIT = 0.8 * 28232
+
+# Roughly what EC2 promises each instance type's network, in Mbit/s
+BANDWIDTH = {
+    't1.micro': 50,
+    'm1.small': 250,
+    'm1.medium': 250,
+    'c1.medium': 250,
+    'm1.large': 500,
+    'm2.xlarge': 500,
+    'm2.2xlarge': 500,
+    'm1.xlarge': 1000,
+    'c1.xlarge': 1000,
+    'm2.4xlarge': 1000,
+    'cc1.4xlarge': 10000,
+}
+
+# What to move a saturated swarm up to, and how busy to aim for
+LARGER = {
+    't1.micro': 'm1.small',
+    'm1.small': 'c1.medium',
+    'm1.medium': 'c1.medium',
+    'c1.medium': 'c1.xlarge',
+    'm1.large': 'c1.xlarge',
+}
+TARGET_UTILIZATION = 0.6
+
+def wrap(command):
+    """
+    Run the sampler for as long as a gun's command runs, and print its
+    samples after the command's own output.
+    """
+    sampler = ('(while :; do echo "T $(date +%%s.%%N)"; head -n 1 /proc/stat; tail -n +3 /proc/net/dev; head -n 2 /proc/net/sockstat; sleep %s; done) '
+               '</dev/null >%s 2>/dev/null & BEES_SAMPLER=$!; ') % (INTERVAL, SAMPLES_PATH)
+
+    return '%s{ %s; }; kill $BEES_SAMPLER; echo "%s"; cat %s; rm -f %s' % (sampler, command, MARKER, SAMPLES_PATH, SAMPLES_PATH)
+
+def _read(text):
+    samples = []
+
+    for line in text.splitlines():
+        if line.startswith('T '):
+            samples.append({'t': float(line[2:]), 'cpu': None, 'rx': 0, 'tx': 0, 'tcp_inuse': 0, 'tcp_tw': 0})
+            continue
+
+        if not samples or ':' not in line and not line.startswith('cpu '):
+            continue
+
+        sample = samples[-1]
+
+        if line.startswith('cpu '):
+            sample['cpu'] = [int(field) for field in line.split()[1:]]
+            continue
+
+        name, fields = line.split(':', 1)
+        name, fields = name.strip(), fields.split()
+
+        if name == 'TCP':
+            counts = dict(zip(fields[::2], fields[1::2]))
+            sample['tcp_inuse'] = int(counts.get('inuse', 0))
+            sample['tcp_tw'] = int(counts.get('tw', 0))
+        elif name != 'sockets' and name != 'lo' and len(fields) >= 9:
+            sample['rx'] += int(fields[0])
+            sample['tx'] += int(fields[8])
+
+    return [kept for kept in samples if kept['cpu'] is not None]
+
+def parse(text):
+    """
+    Turn the sampler's output into one row of rates per interval: the time,
+    the fraction of CPU busy and stolen, Mbit/s received and sent, and TCP
+    sockets in use and in TIME_WAIT.
+    """
+    samples = _read(text)
+    rows = []
+
+    for before, after in zip(samples, samples[1:]):
+        elapsed = after['t'] - before['t']
+        ticks = [b - a for a, b in zip(before['cpu'], after['cpu'])]
+        total = float(sum(ticks)) or 1.0
+
+        if elapsed <= 0:
+            continue
+
+        # user nice system idle iowait irq softirq steal ...
+        idle = ticks[3] + (ticks[4] if len(ticks) > 4 else 0)
+        steal = ticks[7] if len(ticks) > 7 else 0
+
+        rows.append({
+            't': after['t'],
+            'cpu_busy': (total - idle - steal) / total,
+            'cpu_steal': steal / total,
+            'rx_mbps': (after['rx'] - before['rx']) * 8 / elapsed / 1e6,
+            'tx_mbps': (after['tx'] - before['tx']) * 8 / elapsed / 1e6,
+            'tcp_inuse': after['tcp_inuse'],
+            'tcp_tw': after['tcp_tw'],
+        })
+
+    return rows
+
+def _mean(values):
+    return sum(values) / len(values) if values else 0.0
+
+def summarize(rows, instance_type=None):
+    """
+    Boil a bee's telemetry down to averages and peaks, and list what, if
+    anything, it ran out of.
+    """
+    net = [row['rx_mbps'] + row['tx_mbps'] for row in rows]
+
+    summary = {
+        'samples': len(rows),
+        'cpu_busy': _mean([row['cpu_busy'] for row in rows]),
+        'cpu_busy_max': max([row['cpu_busy'] for row in rows] or [0]),
+        'cpu_steal': _mean([row['cpu_steal'] for row in rows]),
+        'net_mbps': _mean(net),
+        'net_mbps_max': max(net or [0]),
+        'tcp_inuse_max': max([row['tcp_inuse'] for row in rows] or [0]),
+        'tcp_tw_max': max([row['tcp_tw'] for row in rows] or [0]),
+        'instance_type': instance_type,
+        'saturated': [],
+    }
+
+    if summary['cpu_busy'] >= MAX_CPU_BUSY:
+        summary['saturated'].append('cpu')
+
+    if summary['cpu_steal'] >= MAX_CPU_STEAL:
+        summary['saturated'].append('steal')
+
+    if instance_type in BANDWIDTH and summary['net_mbps'] >= MAX_BANDWIDTH * BANDWIDTH[instance_type]:
+        summary['saturated'].append('network')
+
+    if summary['tcp_tw_max'] >= MAX_TIME_WAIT:
+        summary['saturated'].append('ports')
+
+    return summary
+
+def recommend(summaries, bees):
+    """
+    Given the telemetry summaries of a swarm of bees, return advice on how
+    to grow it so no bee is saturated, or None if none were.
+    """
+    saturated = [summary for summary in summaries if summary['saturated']]
+
+    if not saturated:
+        return None
+
+    # How much bigger the swarm needs to be to bring its busiest resource
+    # down to TARGET_UTILIZATION
+    utilization = []
+
+    for summary in summaries:
+        utilization.append(summary['cpu_busy'] + summary['cpu_steal'])
+
+        if summary['instance_type'] in BANDWIDTH:
+            utilization.append(summary['net_mbps'] / BANDWIDTH[summary['instance_type']])
+
+    needed = max(bees + 1, int(math.ceil(bees * max(utilization) / TARGET_UTILIZATION)))
+
+    advice = 'call up at least %i bees (bees up -s %i)' % (needed, needed)
+
+    instance_types = set([summary['instance_type'] for summary in saturated])
+    larger = [LARGER[instance_type] for instance_type in instance_types if instance_type in LARGER]
+
+    if larger:
+        advice += ' or bigger ones (bees up -t %s)' % larger[0]
+
+    reasons = []
+
+    for reason in ('cpu', 'steal', 'network', 'ports'):
+        count = len([summary for summary in saturated if reason in summary['saturated']])
+
+        if count:
+            reasons.append('%i %s' % (count, reason))
+
+    return '%i of %i bees were saturated (%s), so the results may measure the bees rather than the target; %s.' % (
+        len(saturated), bees, ', '.join(reasons), advice)
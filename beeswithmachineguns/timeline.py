@@ -0,0 +1,184 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Follow an attack second by second, across the whole swarm.
+#
+# Each bee reports a latency histogram for every second (by its own clock)
+# it sent requests in. Shifted by the bee's clock offset, these line up on
+# our clock, and are merged into a series of WINDOW-second buckets. The
+# series is kept as columns, like the live monitor's, so it is as big as the
+# attack is long however many requests were sent.
+
+from array import array
+import csv
+import json
+import sys
+
+import histogram
+
+WINDOW = 1
+WIDTH = 60
+
+COLUMNS = ('second', 'time', 'requests', 'requests_per_second', 'errors', 'p50', 'p90', 'p99', 'max')
+
+TICKS = u' \u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+ASCII_TICKS = ' .:-=+*#%@'
+
+def build(results, window=WINDOW):
+    """
+    Merge every bee's per-second latencies and errors into one series of
+    window-second buckets, as a dict of columns, or None if no bee said when
+    it sent its requests.
+
+    errors is NaN in any bucket a bee sent requests in without counting its
+    errors by the second, as ab doesn't, so a mixed swarm's errors aren't
+    undercounted, and throughout if no bee counted them.
+    """
+    latencies = {}
+    errors = {}
+    uncounted = set()
+    counted_errors = False
+
+    for r in results:
+        if not isinstance(r, dict) or not r.get('latency_by_second'):
+            continue
+
+        shift = int(round(r.get('clock_offset', 0)))
+
+        for second, h in r['latency_by_second'].items():
+            latencies.setdefault((second - shift) // window, []).append(h)
+
+            if 'errors_by_second' not in r:
+                uncounted.add((second - shift) // window)
+
+        if 'errors_by_second' in r:
+            counted_errors = True
+
+            for second, count in r['errors_by_second'].items():
+                bucket = (second - shift) // window
+                errors[bucket] = errors.get(bucket, 0) + count
+
+    if not latencies:
+        return None
+
+    first = min(latencies.keys() + errors.keys())
+    last = max(latencies.keys() + errors.keys())
+
+    series = dict((column, array('d')) for column in COLUMNS)
+
+    for bucket in range(first, last + 1):
+        merged = histogram.merge(latencies.get(bucket, []))
+        requests = histogram.count(merged)
+
+        series['second'].append((bucket - first) * window)
+        series['time'].append(bucket * window)
+        series['requests'].append(requests)
+        series['requests_per_second'].append(float(requests) / window)
+        series['errors'].append(errors.get(bucket, 0) if counted_errors and bucket not in uncounted else float('nan'))
+
+        for percent in (50, 90, 99):
+            series['p%i' % percent].append(histogram.percentile(merged, percent) if requests else 0)
+
+        series['max'].append(histogram.maximum(merged) if requests else 0)
+
+    return series
+
+def rows(series):
+    """
+    Return the series a bucket at a time, as dicts.
+    """
+    return [dict((column, series[column][i]) for column in COLUMNS) for i in range(len(series['second']))]
+
+def export(series, path, window=WINDOW):
+    """
+    Write the series to path, as JSON if it ends in .json and otherwise as
+    CSV. Missing error counts are left blank in CSV and null in JSON.
+    """
+    table = rows(series)
+
+    for row in table:
+        if row['errors'] != row['errors']:
+            row['errors'] = None
+
+    with open(path, 'wb') as f:
+        if path.endswith('.json'):
+            json.dump({'window': window, 'rows': table}, f, indent=2)
+        else:
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writerow(dict((column, column) for column in COLUMNS))
+            writer.writerows(table)
+
+def _resample(values, width, combine):
+    """
+    Squeeze values into at most width points, combining each run of them.
+    """
+    if len(values) <= width:
+        return list(values)
+
+    step = (len(values) + width - 1) // width
+
+    return [combine(values[i:i + step]) for i in range(0, len(values), step)]
+
+def sparkline(values, ticks=None):
+    """
+    Draw values as a row of bars scaled from zero to their maximum.
+    """
+    ticks = ticks or TICKS
+    top = max(values) if values else 0
+
+    if not top:
+        return ticks[0] * len(values)
+
+    return ''.join([ticks[int(round(value / top * (len(ticks) - 1)))] for value in values])
+
+def report(series, out=None, width=WIDTH, window=WINDOW):
+    """
+    Print the series as sparklines of throughput, p99 latency and errors,
+    squeezed into width characters.
+    """
+    out = out or sys.stdout
+    encoding = getattr(out, 'encoding', None) or ''
+    ticks = TICKS if encoding.lower().replace('-', '') == 'utf8' else ASCII_TICKS
+
+    mean = lambda values: sum(values) / len(values)
+
+    lines = [
+        ('Requests per second', _resample(series['requests_per_second'], width, mean), '%.1f peak' % max(series['requests_per_second'])),
+        ('99% response time', _resample(series['p99'], width, max), '%.1f [ms] worst' % max(series['p99'])),
+    ]
+
+    if not any(value != value for value in series['errors']):
+        lines.append(('Errors', _resample(series['errors'], width, sum), '%i total' % sum(series['errors'])))
+
+    out.write('     Timeline:\t\t%i seconds, %i to a bar\n' % (len(series['second']) * window, window * ((len(series['second']) + width - 1) // width)))
+
+    for label, values, note in lines:
+        text = sparkline(values, ticks)
+
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+
+        out.write('     %-20s|%s| %s\n' % (label, text, note))
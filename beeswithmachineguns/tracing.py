@@ -0,0 +1,160 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Time the phases of a bees command, overall and for each bee.
+#
+# Code marks a phase with a span:
+#
+#     with tracing.span('ssh.connect', params['i']):
+#         ...
+#
+# Spans nest, and each is recorded against the thread it ran on, so a trace
+# shows every bee's phases side by side. Nothing is recorded until enable()
+# is called, and a span costs next to nothing until then.
+
+import json
+import sys
+import threading
+import time
+
+# Finished spans, or None while tracing is off
+_spans = None
+_origin = 0.0
+_main_thread = None
+
+def enable():
+    """
+    Start recording spans, forgetting any recorded before.
+    """
+    global _spans, _origin, _main_thread
+
+    _origin = time.time()
+    _main_thread = threading.current_thread().ident
+    _spans = []
+
+def enabled():
+    return _spans is not None
+
+class span(object):
+    """
+    Record how long the code inside a with block takes, as a phase called
+    name, of a bee if one is given.
+    """
+
+    def __init__(self, name, bee=None):
+        self.name = name
+        self.bee = bee
+
+    def __enter__(self):
+        if _spans is not None:
+            self.start = time.time()
+
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if _spans is not None and hasattr(self, 'start'):
+            _spans.append({
+                'name': self.name,
+                'bee': self.bee,
+                'start': self.start - _origin,
+                'duration': time.time() - self.start,
+                'thread': threading.current_thread().ident,
+                'failed': kind is not None,
+            })
+
+def summarize():
+    """
+    Total up the spans of each name, in the order the phases first began.
+    """
+    phases = {}
+
+    for s in sorted(_spans or [], key=lambda s: s['start']):
+        phase = phases.setdefault(s['name'], {'name': s['name'], 'first': s['start'], 'calls': 0, 'total': 0.0, 'max': 0.0, 'bees': set(), 'failed': 0})
+
+        phase['calls'] += 1
+        phase['total'] += s['duration']
+        phase['max'] = max(phase['max'], s['duration'])
+        phase['failed'] += s['failed']
+
+        if s['bee'] is not None:
+            phase['bees'].add(s['bee'])
+
+    return sorted(phases.values(), key=lambda phase: phase['first'])
+
+def report(out=sys.stdout):
+    """
+    Print a table of where the time went, phase by phase.
+
+    A phase run by many bees at once can add up to more than the command
+    took; its slowest call is usually the one that held the command up.
+    """
+    out.write('Profile:\n')
+    out.write('     %-20s %8s %6s %12s %12s %12s\n' % ('Phase', 'Calls', 'Bees', 'Total [s]', 'Mean [ms]', 'Max [ms]'))
+
+    for phase in summarize():
+        out.write('     %-20s %8i %6s %12.3f %12.1f %12.1f%s\n' % (
+            phase['name'],
+            phase['calls'],
+            len(phase['bees']) or '-',
+            phase['total'],
+            phase['total'] * 1000 / phase['calls'],
+            phase['max'] * 1000,
+            '  (%i failed)' % phase['failed'] if phase['failed'] else ''))
+
+def export(path):
+    """
+    Write the spans to path in the Chrome trace event format, for
+    chrome://tracing or Perfetto, with a row for each thread named after
+    the bee it worked for.
+    """
+    threads = {}
+    names = {}
+    events = []
+
+    for s in sorted(_spans or [], key=lambda s: s['start']):
+        tid = threads.setdefault(s['thread'], len(threads))
+
+        if s['bee'] is not None:
+            names[tid] = 'bee %s' % s['bee']
+        else:
+            names.setdefault(tid, 'orchestrator' if s['thread'] == _main_thread else 'thread %i' % tid)
+
+        events.append({
+            'name': s['name'],
+            'cat': 'bee' if s['bee'] is not None else 'bees',
+            'ph': 'X',
+            'ts': int(s['start'] * 1000000),
+            'dur': int(s['duration'] * 1000000),
+            'pid': 1,
+            'tid': tid,
+            'args': {'bee': s['bee'], 'failed': s['failed']},
+        })
+
+    for tid, name in names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': name}})
+
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
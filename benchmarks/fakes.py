@@ -0,0 +1,460 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Stand-ins for EC2 and for the bees themselves, so the orchestrator's real
+# code paths can be timed without launching anything.
+#
+# FakeEC2Connection answers the handful of boto calls bees makes, in process.
+# FakeBeeServer runs in its own process, so it doesn't count against the
+# orchestrator's CPU or memory: an SSH server that pretends to be every bee
+# at once, answering ab with a synthetic report, and a web server to be the
+# target.
+
+import BaseHTTPServer
+import logging
+import math
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+
+import boto
+import boto.exception
+import paramiko
+from Crypto import Random
+
+from beeswithmachineguns import telemetry
+from beeswithmachineguns.guns import ab
+
+# EC2
+
+class FakeInstance(object):
+    def __init__(self, id, image_id, key_name, instance_type, placement, address, boot_polls=0):
+        self.id = id
+        self.image_id = image_id
+        self.key_name = key_name
+        self.instance_type = instance_type
+        self.placement = placement
+        self.public_dns_name = address
+        self.ip_address = address
+        self.private_ip_address = address
+        self.launch_time = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        self.state = 'pending'
+        self.tags = {}
+        self.boot_polls = boot_polls
+
+    def update(self):
+        return self.state
+
+class FakeReservation(object):
+    def __init__(self, id, instances):
+        self.id = id
+        self.instances = instances
+
+class FakeEC2Connection(object):
+    """
+    Enough of boto's EC2Connection for bees: run, describe, terminate and
+    tag instances. Every instance lives at address.
+
+    An instance stays pending for boot_polls describe calls after launch.
+    The number of calls made to each method is kept in calls.
+    """
+    def __init__(self, address='127.0.0.1', boot_polls=0):
+        self.address = address
+        self.boot_polls = boot_polls
+        self.reservations = []
+        self.instances = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _reserve(self, instances):
+        reservation = FakeReservation('r-%08x' % len(self.reservations), instances)
+        self.reservations.append(reservation)
+
+        for instance in instances:
+            self.instances[instance.id] = instance
+
+        return reservation
+
+    def adopt(self, described):
+        """
+        Take over instances from a roster, as if they had been run here.
+        """
+        instances = []
+
+        for details in described:
+            instance = FakeInstance(details['id'], None, None, details['instance_type'], details['placement'], self.address)
+            instance.state = details['state']
+            instances.append(instance)
+
+        with self.lock:
+            self._reserve(instances)
+
+    def run_instances(self, image_id, min_count=1, max_count=1, key_name=None, security_groups=None, instance_type='m1.small', placement=None, **kwargs):
+        with self.lock:
+            self._count('run_instances')
+
+            instances = []
+
+            for i in range(max_count):
+                instances.append(FakeInstance('i-%08x' % len(self.instances), image_id, key_name, instance_type, placement, self.address, self.boot_polls))
+                self.instances[instances[-1].id] = instances[-1]
+
+            return self._reserve(instances)
+
+    def _matches(self, instance, filters):
+        for name, value in filters.items():
+            values = value if isinstance(value, list) else [value]
+
+            if name == 'instance-state-name' and instance.state not in values:
+                return False
+            elif name == 'tag-key' and not set(values) & set(instance.tags):
+                return False
+            elif name.startswith('tag:') and instance.tags.get(name[4:]) not in values:
+                return False
+
+        return True
+
+    def get_all_instances(self, instance_ids=None, filters=None):
+        with self.lock:
+            self._count('get_all_instances')
+
+            for instance_id in instance_ids or []:
+                if instance_id not in self.instances:
+                    raise boto.exception.EC2ResponseError(400, 'Bad Request')
+
+            reservations = []
+
+            for reservation in self.reservations:
+                instances = [instance for instance in reservation.instances
+                    if (instance_ids is None or instance.id in instance_ids) and self._matches(instance, filters or {})]
+
+                for instance in instances:
+                    if instance.state == 'pending':
+                        if instance.boot_polls <= 0:
+                            instance.state = 'running'
+                        instance.boot_polls -= 1
+
+                if instances:
+                    reservations.append(FakeReservation(reservation.id, instances))
+
+            return reservations
+
+    def create_tags(self, resource_ids, tags):
+        with self.lock:
+            self._count('create_tags')
+
+            for resource_id in resource_ids:
+                self.instances[resource_id].tags.update(tags)
+
+            return True
+
+    def terminate_instances(self, instance_ids=None):
+        with self.lock:
+            self._count('terminate_instances')
+
+            terminated = []
+
+            for instance_id in instance_ids or []:
+                instance = self.instances.get(instance_id)
+
+                if instance is not None:
+                    instance.state = 'terminated'
+                    terminated.append(instance)
+
+            return terminated
+
+    def close(self):
+        pass
+
+def install(connection):
+    """
+    Make boto.connect_ec2 hand out connection.
+    """
+    boto.connect_ec2 = lambda *args, **kwargs: connection
+
+# Bees
+
+AB_REPORT = """This is ApacheBench, Version 2.3 <$Revision: 655654 $>
+Copyright 1996 Adam Twiss, Zeus Technology Ltd, http://www.zeustech.net/
+Licensed to The Apache Software Foundation, http://www.apache.org/
+
+Benchmarking %(host)s (be patient)
+
+
+Server Software:        nginx/1.0.5
+Server Hostname:        %(host)s
+Server Port:            80
+
+Document Path:          /
+Document Length:        612 bytes
+
+Concurrency Level:      %(concurrency)i
+Time taken for tests:   %(seconds).3f seconds
+Complete requests:      %(requests)i
+Failed requests:        %(failed)i
+%(breakdown)sWrite errors:           0
+Total transferred:      %(transferred)i bytes
+HTML transferred:       %(html)i bytes
+Requests per second:    %(rate).2f [#/sec] (mean)
+Time per request:       %(mean).3f [ms] (mean)
+Time per request:       %(mean_across).3f [ms] (mean, across all concurrent requests)
+Transfer rate:          %(kbps).2f [Kbytes/sec] received
+
+Connection Times (ms)
+              min  mean[+/-sd] median   max
+Connect:        0    1   0.4      1       3
+Processing:     1   %(mean)i   2.1      %(mean)i      %(distinct)i
+Waiting:        1   %(mean)i   2.1      %(mean)i      %(distinct)i
+Total:          1   %(mean)i   2.2      %(mean)i      %(distinct)i
+"""
+
+def ab_output(requests=1000, concurrency=10, distinct=200, seed=0, started=None, seconds=None, failed=0):
+    """
+    Make up the output of the ab gun's command: ab's report followed by the
+    count of requests at each of distinct whole-millisecond latencies,
+    spread log-normally, in each second of the attack.
+
+    The attack starts at started (default now) and lasts as long as its
+    latencies and concurrency say, unless seconds is given. The failed
+    fraction of requests are reported as failed to be received.
+    """
+    generator = random.Random(seed)
+    median = 5 + generator.random() * 10
+
+    weights = [math.exp(-(math.log(ms / median) ** 2) / 2) / ms for ms in range(1, distinct + 1)]
+    scale = float(requests) / sum(weights)
+
+    counts = [int(weight * scale) for weight in weights]
+    counts[weights.index(max(weights))] += requests - sum(counts)
+    mean = sum([ms * count for ms, count in zip(range(1, distinct + 1), counts)]) / float(requests)
+    seconds = seconds or mean * requests / concurrency / 1000
+    started = int(started or time.time())
+    whole_seconds = int(math.ceil(seconds))
+
+    report = AB_REPORT % {
+        'host': '127.0.0.1',
+        'concurrency': concurrency,
+        'seconds': seconds,
+        'requests': requests,
+        'transferred': requests * 850,
+        'html': requests * 612,
+        'rate': requests / seconds,
+        'mean': mean,
+        'mean_across': seconds * 1000 / requests,
+        'kbps': requests * 850 / seconds / 1024,
+        'distinct': distinct,
+        'failed': int(requests * failed),
+        'breakdown': '   (Connect: 0, Receive: %i, Length: 0, Exceptions: 0)\n' % int(requests * failed) if int(requests * failed) else '',
+    }
+
+    lines = []
+
+    for second in range(whole_seconds):
+        for ms, count in zip(range(1, distinct + 1), counts):
+            share = count // whole_seconds + (1 if second < count % whole_seconds else 0)
+
+            if share:
+                lines.append('%7i %i\t%i' % (share, started + second, ms))
+
+    return '%s%s\n%s\n' % (report, ab.HISTOGRAM_MARKER, '\n'.join(lines))
+
+def telemetry_output(started, seconds, busy=0.4, bytes_per_second=1000000):
+    """
+    Make up what the telemetry sampler prints over an attack: a sample a
+    second, with the CPU busy and the network carrying bytes_per_second.
+    """
+    lines = []
+
+    for i in range(int(math.ceil(seconds)) + 1):
+        ticks = i * 100
+        received = i * bytes_per_second
+
+        lines.append('T %.9f' % (started + i))
+        lines.append('cpu  %i 0 %i %i 0 0 0 0 0 0' % (ticks * busy * 0.7, ticks * busy * 0.3, ticks * (1 - busy)))
+        lines.append('    lo: 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0')
+        lines.append('  eth0: %i %i 0 0 0 0 0 0 %i %i 0 0 0 0 0 0' % (received, i * 1000, received / 10, i * 1000))
+        lines.append('sockets: used 100')
+        lines.append('TCP: inuse 20 orphan 0 tw %i alloc 25 mem 3' % (i * 100))
+
+    return '%s\n%s\n' % (telemetry.MARKER, '\n'.join(lines))
+
+class _BeeInterface(paramiko.ServerInterface):
+    """
+    Let anyone in with any key, and answer every command they run.
+    """
+    def __init__(self, options, seed):
+        self.options = options
+        self.seed = seed
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=_answer, args=(channel, command, self.options, self.seed))
+        thread.daemon = True
+        thread.start()
+
+        return True
+
+def _respond(command, options, seed):
+    """
+    Make up what a bee would print for a command.
+    """
+    if command == 'date +%s.%N':
+        return '%.9f\n' % time.time()
+
+    if ab.HISTOGRAM_MARKER in command:
+        requests, concurrency = [int(value) for value in re.search('ab -r -n (\d+) -c (\d+)', command).groups()]
+
+        # As real ab does, which the bees take as losing sight of the target
+        if concurrency > requests:
+            return 'ab: Cannot use concurrency level greater than total number of requests\n'
+        start_at = re.search('max\(0, ([0-9.]+)', command)
+
+        if start_at:
+            time.sleep(max(0, float(start_at.group(1)) - time.time()))
+
+        started = time.time()
+        time.sleep(options['attack_seconds'])
+
+        output = ab_output(requests, max(concurrency, 1), options['distinct'], seed, started, options['attack_seconds'], options['failed'])
+
+        if telemetry.MARKER in command:
+            output += telemetry_output(started, options['attack_seconds'])
+
+        return output
+
+    return ''.join(['%s: line %i of some output\n' % (command, i) for i in range(options['shell_lines'])])
+
+def _answer(channel, command, options, seed):
+    try:
+        channel.sendall(_respond(command, options, seed))
+        channel.send_exit_status(0)
+
+        # Closing the channel could overtake paramiko's reply to the exec
+        # request, so only send EOF and leave the client to hang up.
+        channel.shutdown_write()
+    except (paramiko.SSHException, socket.error, EOFError):
+        pass
+
+def _serve_bee(sock, host_key, options, seed):
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(host_key)
+
+    try:
+        transport.start_server(server=_BeeInterface(options, seed))
+    except (paramiko.SSHException, socket.error, EOFError):
+        transport.close()
+
+class _TargetHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write('Bzzzz.\n')
+
+    def log_message(self, format, *args):
+        pass
+
+def _run(ports, options):
+    Random.atfork()
+
+    # Clients hanging up mid-handshake aren't worth reporting
+    logging.getLogger('paramiko').addHandler(logging.NullHandler())
+
+    host_key = paramiko.RSAKey.generate(1024)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+
+    target = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _TargetHandler)
+
+    thread = threading.Thread(target=target.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    ports.put((listener.getsockname()[1], target.server_address[1]))
+
+    seed = 0
+
+    while True:
+        sock, address = listener.accept()
+
+        thread = threading.Thread(target=_serve_bee, args=(sock, host_key, options, seed))
+        thread.daemon = True
+        thread.start()
+
+        seed += 1
+
+class FakeBeeServer(object):
+    """
+    A separate process playing every bee, on ssh_port, and the target, on
+    target_port.
+
+    Each ab attack takes attack_seconds and reports distinct latencies, with
+    the failed fraction of its requests failed; any other command prints
+    shell_lines lines.
+    """
+    def __init__(self, attack_seconds=0, distinct=200, shell_lines=10, failed=0):
+        self.options = {
+            'attack_seconds': attack_seconds,
+            'distinct': distinct,
+            'shell_lines': shell_lines,
+            'failed': failed,
+        }
+        self.process = None
+        self.ssh_port = None
+        self.target_port = None
+
+    def start(self):
+        ports = multiprocessing.Queue()
+
+        self.process = multiprocessing.Process(target=_run, args=(ports, self.options))
+        self.process.daemon = True
+        self.process.start()
+
+        self.ssh_port, self.target_port = ports.get(timeout=60)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
@@ -0,0 +1,282 @@
+#!/bin/env python
+
+"""
+The MIT License
+
+Copyright (c) 2010 The Chicago Tribune & Contributors
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+# Time the orchestrator's own work against fake EC2 and fake bees.
+#
+# Each step runs in a fresh process, so its wall time, CPU time and peak
+# resident memory are its own. Run it from a checkout:
+#
+#     python benchmarks/orchestrator.py --bees 10,100,1000 --json bench.jsonl
+#
+# With --json, every run is appended as one line, to track scaling over time.
+# Each step's time is also broken down by phase (see tracing.py), and with
+# --profile the breakdown is printed under each step.
+#
+# Attack steps also report first_shot_seconds: how long after the command
+# began the first bee fired.
+
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import StringIO
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+# Keep the real ~/.bees, ~/.bees.sock and ~/.bees-runs out of it
+HOME = tempfile.mkdtemp(prefix='bees-bench-')
+os.environ['HOME'] = HOME
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paramiko
+from Crypto import Random
+
+from beeswithmachineguns import archive, bees, tracing
+from beeswithmachineguns.guns import ab
+
+import fakes
+
+KEY_NAME = 'bench'
+STATE_FILE = os.path.join(HOME, '.bees')
+ARCHIVE_DIR = os.path.join(HOME, '.bees-runs')
+
+# Steps
+
+def _fleet(server):
+    """
+    Point bees at the fake bees, and at a fake EC2 that knows the roster.
+    """
+    bees.SSH_PORT = server.ssh_port
+
+    connection = fakes.FakeEC2Connection()
+    state = bees._read_server_list(STATE_FILE)
+
+    if state:
+        connection.adopt(state['instances'])
+
+    fakes.install(connection)
+
+    return connection
+
+def up(server, count):
+    connection = _fleet(server)
+
+    bees.up(count, 'bench', 'us-east-1a', 'ami-bench', 'bench', KEY_NAME, STATE_FILE, wait_for_ssh=True)
+
+    return {'ec2_calls': sum(connection.calls.values())}
+
+def attack(server, count):
+    _fleet(server)
+
+    with tracing.span('command'):
+        summary = bees.attack('http://127.0.0.1:%i/' % server.target_port, count * 1000, count * 10, STATE_FILE, archive_dir=ARCHIVE_DIR)
+
+    return {'complete_bees': summary['complete_bees']}
+
+def shell(server, count):
+    _fleet(server)
+
+    bees.shell('uptime', STATE_FILE)
+
+    return {}
+
+def down(server, count):
+    connection = _fleet(server)
+
+    bees.down(STATE_FILE)
+
+    return {'ec2_calls': sum(connection.calls.values())}
+
+def parse(server, lines, rounds):
+    output = fakes.ab_output(lines * 100, 100, lines, seconds=1)
+
+    started = time.time()
+
+    for i in range(rounds):
+        ab.parse(output)
+
+    elapsed = time.time() - started
+
+    return {
+        'bytes': len(output),
+        'mb_per_second': len(output) * rounds / elapsed / 1024 / 1024,
+        'parses_per_second': rounds / elapsed,
+    }
+
+def aggregate(server, count, rounds):
+    results = [ab.parse(fakes.ab_output(1000, 10, seed=i)) for i in range(count)]
+
+    started = time.time()
+
+    for i in range(rounds):
+        bees._print_results(results)
+
+    return {'ms_per_call': (time.time() - started) * 1000 / rounds}
+
+# Measurement
+
+def _measure(queue, step, args):
+    Random.atfork()
+
+    sys.stdout = open(os.devnull, 'w')
+
+    tracing.enable()
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = usage.ru_utime + usage.ru_stime
+    started = time.time()
+
+    try:
+        result = step(*args)
+    except Exception, e:
+        result = {'error': repr(e)}
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    phases = tracing.summarize()
+
+    result.update({
+        'wall_seconds': time.time() - started,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime - cpu,
+        # Kilobytes on Linux, bytes on OS X
+        'peak_rss_mb': usage.ru_maxrss / (1024.0 * 1024 if sys.platform == 'darwin' else 1024.0),
+        'phases': dict((phase['name'], phase['total']) for phase in phases),
+    })
+
+    # Time to first shot runs from the command, not the fake fleet set up before it
+    firsts = dict((phase['name'], phase['first']) for phase in phases)
+
+    if 'command' in firsts and 'bee.fire' in firsts:
+        result['first_shot_seconds'] = firsts['bee.fire'] - firsts['command']
+
+    profile = StringIO.StringIO()
+    tracing.report(profile)
+    result['profile'] = profile.getvalue()
+
+    queue.put(result)
+
+def measure(step, *args):
+    """
+    Run a step in a process of its own and return what it cost.
+    """
+    queue = multiprocessing.Queue()
+
+    process = multiprocessing.Process(target=_measure, args=(queue, step, args))
+    process.start()
+
+    result = queue.get()
+    process.join()
+
+    return result
+
+def _print_row(name, size, result, profile=False):
+    if 'error' in result:
+        print '%-10s %7i  failed: %s' % (name, size, result['error'])
+        return
+
+    extra = ', '.join(['%s=%s' % (key, round(value, 2) if isinstance(value, float) else value)
+        for key, value in sorted(result.items()) if key not in ('wall_seconds', 'cpu_seconds', 'peak_rss_mb', 'phases', 'profile')])
+
+    print '%-10s %7i %10.3f %10.3f %10.1f  %s' % (name, size, result['wall_seconds'], result['cpu_seconds'], result['peak_rss_mb'], extra)
+
+    if profile and result['phases']:
+        print result['profile']
+
+def main():
+    parser = OptionParser(usage="""
+python benchmarks/orchestrator.py [options]
+
+Time up, attack, shell and down against 10, 100 and 1000 fake bees, ab's
+report parser on large outputs, and summarizing results.""")
+
+    parser.add_option('-b', '--bees', metavar="COUNTS", nargs=1, action='store', dest='bees', type='string', default='10,100,1000',
+                        help="Comma-separated swarm sizes (default: 10,100,1000).")
+    parser.add_option('-l', '--lines', metavar="COUNTS", nargs=1, action='store', dest='lines', type='string', default='100,1000,10000',
+                        help="Comma-separated numbers of latency lines in the ab output to parse (default: 100,1000,10000).")
+    parser.add_option('-r', '--rounds', metavar="ROUNDS", nargs=1, action='store', dest='rounds', type='int', default=100,
+                        help="Times to repeat each parse and summary (default: 100).")
+    parser.add_option('-a', '--attack-seconds', metavar="SECONDS", nargs=1, action='store', dest='attack_seconds', type='float', default=0,
+                        help="How long each fake bee's ab takes (default: 0).")
+    parser.add_option('-j', '--json', metavar="FILE", nargs=1, action='store', dest='json_file', type='string', default=None,
+                        help="Append the results to FILE as one line of JSON.")
+    parser.add_option('-p', '--profile', action='store_true', dest='profile', default=False,
+                        help="Print where each step's time went, phase by phase.")
+
+    (options, args) = parser.parse_args()
+
+    counts = [int(count) for count in options.bees.split(',')]
+    sizes = [int(lines) for lines in options.lines.split(',')]
+
+    os.mkdir(os.path.join(HOME, '.ssh'))
+    paramiko.RSAKey.generate(1024).write_private_key_file(os.path.join(HOME, '.ssh', '%s.pem' % KEY_NAME))
+
+    server = fakes.FakeBeeServer(attack_seconds=options.attack_seconds)
+    server.start()
+
+    print '%-10s %7s %10s %10s %10s' % ('step', 'size', 'wall (s)', 'cpu (s)', 'rss (MB)')
+
+    results = []
+
+    try:
+        for count in counts:
+            for name, step in (('up', up), ('attack', attack), ('shell', shell), ('down', down)):
+                result = measure(step, server, count)
+                results.append(dict(result, step=name, size=count))
+                _print_row(name, count, result, options.profile)
+
+        for lines in sizes:
+            result = measure(parse, server, lines, options.rounds)
+            results.append(dict(result, step='parse', size=lines))
+            _print_row('parse', lines, result)
+
+        for count in counts:
+            result = measure(aggregate, server, count, options.rounds)
+            results.append(dict(result, step='aggregate', size=count))
+            _print_row('aggregate', count, result)
+    finally:
+        server.stop()
+        shutil.rmtree(HOME)
+
+    for result in results:
+        result.pop('profile', None)
+
+    if options.json_file:
+        run = {
+            'started_at': time.time(),
+            'python': sys.version.split()[0],
+            'max_handshakes': bees.MAX_HANDSHAKES,
+            'results': results,
+        }
+        run.update(archive._git_metadata())
+
+        with open(options.json_file, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,7 @@ setup(name='beeswithmachineguns',
       author_email='cgroskopf@tribune.com',
       url='http://github.com/newsapps/beeswithmachineguns',
       license='MIT',
-      packages=['beeswithmachineguns'],
+      packages=['beeswithmachineguns', 'beeswithmachineguns.guns'],
       scripts=['bees'],
       install_requires=[
           'boto==2.0',
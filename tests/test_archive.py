@@ -0,0 +1,123 @@
+import random
+import shutil
+import tempfile
+import unittest
+
+from beeswithmachineguns import archive
+from beeswithmachineguns import bees
+from beeswithmachineguns import histogram
+
+def bee_result(generator, latency, rate, failed=0, requests=2000):
+    latencies = {}
+
+    for i in range(requests):
+        histogram.record(latencies, generator.gauss(latency, latency / 10.0))
+
+    return {
+        'complete_requests': requests,
+        'failed_requests': failed,
+        'non_2xx_responses': 0,
+        'requests_per_second': generator.gauss(rate, rate / 50.0),
+        'ms_per_request': histogram.mean(latencies),
+        'concurrent_requests': 10,
+        'latency_histogram': latencies,
+    }
+
+class CompareTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.generator = random.Random(1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self, latency=20, rate=500, failed=0, bees=4):
+        """
+        Archive a run of synthetic bees with the given latency (in ms), rate
+        and failed requests per bee.
+        """
+        results = [bee_result(self.generator, latency, rate, failed) for i in range(bees)]
+        summary = {
+            'complete_requests': sum([r['complete_requests'] for r in results]),
+            'failed_requests': sum([r['failed_requests'] for r in results]),
+            'non_2xx_responses': 0,
+            'requests_per_second': sum([r['requests_per_second'] for r in results]),
+            'latency_histogram': histogram.merge([r['latency_histogram'] for r in results]),
+        }
+
+        return archive.save(results, {'url': 'http://example.com/'}, summary, directory=self.directory)
+
+    def test_round_trip(self):
+        path = self.save()
+        header, columns = archive.load(path, ('status', 'complete_requests'))
+
+        self.assertEqual(header['parameters']['url'], 'http://example.com/')
+        self.assertEqual(list(columns['status']), [0, 0, 0, 0])
+        self.assertEqual(list(columns['complete_requests']), [2000] * 4)
+        self.assertEqual(histogram.count(archive.latency_histogram(path)), 8000)
+
+    def test_same_runs_dont_regress(self):
+        rows, regressions, inconclusive = archive.compare(self.save(), self.save())
+
+        self.assertEqual(regressions, [])
+        self.assertEqual([row[0] for row in rows][0], 'Requests per second')
+
+    def test_slower_run_regresses(self):
+        baseline = self.save()
+        candidate = self.save(latency=30)
+
+        rows, regressions, inconclusive = archive.compare(candidate, baseline)
+
+        self.assertTrue([r for r in regressions if 'response time' in r])
+        self.assertFalse(archive.compare(baseline, candidate)[1])
+
+    def test_lower_throughput_regresses(self):
+        rows, regressions, inconclusive = archive.compare(self.save(rate=300), self.save())
+
+        self.assertTrue([r for r in regressions if 'Throughput' in r])
+
+    def test_lone_bees_are_inconclusive(self):
+        rows, regressions, inconclusive = archive.compare(self.save(rate=300, bees=1), self.save(bees=1))
+
+        self.assertFalse([r for r in regressions if 'Throughput' in r])
+        self.assertTrue([r for r in inconclusive if 'Throughput' in r])
+
+    def test_welch_uses_students_t(self):
+        statistic, freedom = archive._welch([1.0, 2.0, 3.0], [4.0, 5.0, 6.0])
+
+        self.assertAlmostEqual(statistic, -3 / (2 / 3.0) ** 0.5)
+        self.assertAlmostEqual(freedom, 4)
+        self.assertEqual(archive._t_critical(4.9), 4.604)
+        self.assertEqual(archive._t_critical(0.5), 63.657)
+        self.assertEqual(archive._t_critical(1000), 2.617)
+
+        # Significant by the normal approximation, but not with so few bees
+        statistic, freedom = archive._welch([95.0, 100.0, 105.0], [110.0, 115.0, 120.0])
+
+        self.assertTrue(statistic < -archive.Z_CRITICAL)
+        self.assertFalse(statistic < -archive._t_critical(freedom))
+
+    def test_more_errors_regress(self):
+        rows, regressions, inconclusive = archive.compare(self.save(failed=100), self.save(failed=2))
+
+        self.assertTrue([r for r in regressions if 'error rate' in r])
+
+    def test_small_changes_are_tolerated(self):
+        rows, regressions, inconclusive = archive.compare(self.save(latency=21, rate=490), self.save())
+
+        self.assertEqual(regressions, [])
+
+    def test_missing_runs_cant_pass(self):
+        self.assertEqual(bees.compare(archive_dir=self.directory), None)
+
+        self.save()
+
+        self.assertEqual(bees.compare(archive_dir=self.directory), None)
+        self.assertEqual(bees.compare('20000101-000000-0000', archive_dir=self.directory), None)
+
+        self.save()
+
+        self.assertEqual(bees.compare(archive_dir=self.directory), False)
+
+if __name__ == '__main__':
+    unittest.main()
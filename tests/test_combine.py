@@ -0,0 +1,44 @@
+import math
+import unittest
+
+from beeswithmachineguns import bees
+from beeswithmachineguns import hive
+from beeswithmachineguns import timeline
+
+def round_result(errors_by_second=None):
+    """
+    One round of a bee's gun: ten requests in second 100, three failed.
+    """
+    result = {
+        'complete_requests': 10,
+        'failed_requests': 3,
+        'non_2xx_responses': 0,
+        'requests_per_second': 10.0,
+        'ms_per_request': 5.0,
+        'latency_histogram': {100: 10},
+        'latency_by_second': {100: {100: 10}},
+    }
+
+    if errors_by_second is not None:
+        result['errors_by_second'] = errors_by_second
+
+    return result
+
+class CombineTest(unittest.TestCase):
+    def test_adds_up_rounds(self):
+        combined = bees._combine([round_result({100: 3}), round_result({100: 3})])
+
+        self.assertEqual(combined['complete_requests'], 20)
+        self.assertEqual(combined['failed_requests'], 6)
+        self.assertEqual(combined['latency_by_second'], {100: {100: 20}})
+        self.assertEqual(combined['errors_by_second'], {100: 6})
+
+    def test_errors_stay_unknown_for_guns_that_dont_time_them(self):
+        combined = bees._combine([round_result(), round_result()])
+
+        self.assertFalse('errors_by_second' in combined)
+        self.assertTrue(math.isnan(timeline.build([combined])['errors'][0]))
+        self.assertFalse('errors_by_second' in hive._decode(hive._encode(combined)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from beeswithmachineguns import histogram
+from beeswithmachineguns.guns import ab
+
+AB_REPORT = """Concurrency Level:      10
+Time taken for tests:   2.000 seconds
+Complete requests:      1000
+Failed requests:        %(failed)i
+%(breakdown)sWrite errors:           0
+Requests per second:    500.00 [#/sec] (mean)
+Time per request:       20.000 [ms] (mean)
+Time per request:       2.000 [ms] (mean, across all concurrent requests)
+""" + ab.HISTOGRAM_MARKER + """
+    600 1350000000 12
+    400 1350000001 30
+"""
+
+def report(connect=0, receive=0, length=0, exceptions=0):
+    failed = connect + receive + length + exceptions
+    breakdown = ''
+
+    if failed:
+        breakdown = '   (Connect: %i, Receive: %i, Length: %i, Exceptions: %i)\n' % (connect, receive, length, exceptions)
+
+    return AB_REPORT % {'failed': failed, 'breakdown': breakdown}
+
+class AbParseTest(unittest.TestCase):
+    def test_clean_run(self):
+        response = ab.parse(report())
+
+        self.assertEqual(response['complete_requests'], 1000)
+        self.assertEqual(response['failed_requests'], 0)
+        self.assertEqual(response['failed_by_kind'], {})
+        self.assertEqual(histogram.count(response['latency_histogram']), 1000)
+        self.assertEqual(sorted(response['latency_by_second']), [1350000000, 1350000001])
+
+    def test_length_mismatches_are_not_errors(self):
+        response = ab.parse(report(length=700))
+
+        self.assertEqual(response['failed_requests'], 0)
+        self.assertEqual(response['failed_by_kind'], {'length': 700})
+
+    def test_failures_are_classified(self):
+        response = ab.parse(report(connect=3, receive=5, length=20, exceptions=1))
+
+        self.assertEqual(response['failed_requests'], 9)
+        self.assertEqual(response['failed_by_kind'], {'connect': 3, 'receive': 5, 'length': 20, 'exceptions': 1})
+
+    def test_unfinished_report(self):
+        self.assertEqual(ab.parse('apr_socket_connect(): Connection refused (111)\n'), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import math
+import random
+import unittest
+
+from beeswithmachineguns import histogram
+
+def bee_latencies(seed, count=5000):
+    """
+    Synthetic latencies (in ms) for one bee: mostly quick, with a long tail.
+    """
+    generator = random.Random(seed)
+
+    return [generator.lognormvariate(3, 0.8) for i in range(count)]
+
+def exact_percentile(values, percent):
+    values = sorted(values)
+
+    return values[max(1, int(math.ceil(len(values) * percent / 100.0))) - 1]
+
+class HistogramTest(unittest.TestCase):
+    def test_bucket_value_within_relative_error(self):
+        for value in [0.002, 0.5, 1, 3.7, 42, 999.9, 12345.6, 600000]:
+            represented = histogram.bucket_value(histogram.bucket_index(value))
+
+            self.assertTrue(abs(represented - value) <= value * histogram.RELATIVE_ERROR,
+                '%f is represented as %f' % (value, represented))
+
+    def test_tiny_values_share_bucket_zero(self):
+        self.assertEqual(histogram.bucket_index(0), 0)
+        self.assertEqual(histogram.bucket_index(histogram.MIN_VALUE), 0)
+        self.assertEqual(histogram.bucket_value(0), 0.0)
+
+    def test_merge_adds_counts(self):
+        a, b = {}, {}
+        histogram.record(a, 10)
+        histogram.record(a, 20, 3)
+        histogram.record(b, 10, 2)
+
+        merged = histogram.merge([a, b])
+
+        self.assertEqual(histogram.count(merged), 6)
+        self.assertEqual(merged[histogram.bucket_index(10)], 3)
+        self.assertEqual(merged[histogram.bucket_index(20)], 3)
+        self.assertEqual(a, {histogram.bucket_index(10): 1, histogram.bucket_index(20): 3})
+
+    def test_merged_bees_percentiles_match_exact_ones(self):
+        bees = [bee_latencies(seed) for seed in range(8)]
+        histograms = []
+
+        for latencies in bees:
+            h = {}
+
+            for latency in latencies:
+                histogram.record(h, latency)
+
+            histograms.append(h)
+
+        merged = histogram.merge(histograms)
+        everything = sum(bees, [])
+
+        self.assertEqual(histogram.count(merged), len(everything))
+
+        for percent in histogram.PERCENTILES:
+            exact = exact_percentile(everything, percent)
+            estimate = histogram.percentile(merged, percent)
+
+            self.assertTrue(abs(estimate - exact) <= exact * histogram.RELATIVE_ERROR,
+                'p%s is %f, exactly %f' % (percent, estimate, exact))
+
+        self.assertTrue(abs(histogram.maximum(merged) - max(everything)) <= max(everything) * histogram.RELATIVE_ERROR)
+
+    def test_empty_histogram(self):
+        self.assertEqual(histogram.percentile({}, 99), None)
+        self.assertEqual(histogram.mean({}), None)
+        self.assertEqual(histogram.maximum({}), None)
+
+    def test_from_counts(self):
+        h = histogram.from_counts('      3 12.5\n      1 80\nnonsense\n')
+
+        self.assertEqual(histogram.count(h), 4)
+        self.assertEqual(h[histogram.bucket_index(12.5)], 3)
+
+    def test_from_timed_counts(self):
+        by_second = histogram.from_timed_counts('      3 100 12.5\n      2 101 7\n')
+
+        self.assertEqual(sorted(by_second), [100, 101])
+        self.assertEqual(histogram.count(by_second[100]), 3)
+        self.assertEqual(histogram.count(by_second[101]), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+from beeswithmachineguns import histogram
+from beeswithmachineguns import live
+
+def window(requests, errors=0, latency=10):
+    return {
+        'complete_requests': requests,
+        'failed_requests': errors,
+        'non_2xx_responses': 0,
+        'latency_histogram': {histogram.bucket_index(latency): requests},
+    }
+
+class SeriesTest(unittest.TestCase):
+    def test_one_row_per_interval(self):
+        monitor = live.Monitor()
+
+        for second in range(1, 11):
+            monitor._keep(window(100), second)
+
+        self.assertEqual(list(monitor.series['second']), range(1, 11))
+        self.assertEqual(list(monitor.series['complete_requests']), [100] * 10)
+
+    def test_long_attacks_stay_bounded(self):
+        monitor = live.Monitor()
+        monitor.MAX_ROWS = 100
+
+        for second in range(1, 1001):
+            monitor._keep(window(10, errors=1, latency=second % 7 + 1), second)
+
+        monitor.stop()
+
+        self.assertTrue(len(monitor.series['second']) < monitor.MAX_ROWS)
+        self.assertEqual(sum(monitor.series['complete_requests']), 10000)
+        self.assertEqual(sum(monitor.series['errors']), 1000)
+        self.assertEqual(monitor.series['second'][-1], 1000)
+        self.assertEqual(list(monitor.series['second']), sorted(monitor.series['second']))
+        self.assertTrue(max(monitor.series['p99']) >= 7 * (1 - histogram.RELATIVE_ERROR))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from beeswithmachineguns import bees
+from beeswithmachineguns import histogram
+from beeswithmachineguns import search
+
+def fake_summary(p99, requests=1000, errors=0):
+    latencies = {}
+    histogram.record(latencies, p99 / 2.0, requests - requests // 100)
+    histogram.record(latencies, p99, requests // 100)
+
+    return {
+        'complete_bees': 4,
+        'complete_requests': requests,
+        'failed_requests': errors,
+        'non_2xx_responses': 0,
+        'latency_histogram': latencies,
+    }
+
+def fake_target(capacity):
+    """
+    A measure() for a target that answers in 50 ms up to capacity, and in
+    half a second past it.
+    """
+    levels = []
+
+    def measure(level):
+        levels.append(level)
+
+        return fake_summary(50 if level <= capacity else 500)
+
+    return measure, levels
+
+class SearchTest(unittest.TestCase):
+    def test_finds_capacity_within_precision(self):
+        measure, levels = fake_target(230)
+
+        best, summary, curve = search.search(measure, 10, 10000, slo_p99=100)
+
+        self.assertTrue(230 * (1 - search.PRECISION) <= best <= 230)
+        self.assertTrue(search.meets_slo(summary, slo_p99=100))
+        self.assertEqual([level for level, s, ok in curve], levels)
+        self.assertEqual(levels[:6], [10, 20, 40, 80, 160, 320])
+
+    def test_integer_levels_stop_when_nothing_is_between(self):
+        measure, levels = fake_target(11)
+
+        best, summary, curve = search.search(measure, 10, 10000, slo_p99=100)
+
+        self.assertEqual(best, 11)
+        self.assertEqual(len(levels), len(set(levels)))
+
+    def test_rate_levels_can_be_fractional(self):
+        measure, levels = fake_target(37.5)
+
+        best, summary, curve = search.search(measure, 10, 10000, slo_p99=100, integer=False)
+
+        self.assertTrue(37.5 * (1 - search.PRECISION) <= best <= 37.5)
+
+    def test_stops_at_limit(self):
+        measure, levels = fake_target(1000000)
+
+        best, summary, curve = search.search(measure, 10, 100, slo_p99=100)
+
+        self.assertEqual(best, 100)
+        self.assertEqual(levels, [10, 20, 40, 80, 100])
+
+    def test_breached_from_the_start(self):
+        measure, levels = fake_target(1)
+
+        self.assertEqual(search.search(measure, 10, 100, slo_p99=100), (None, None, [(10, fake_summary(500), False)]))
+
+    def test_errors_breach_the_objective(self):
+        self.assertFalse(search.meets_slo(fake_summary(50, errors=20), max_error_rate=0.01))
+        self.assertTrue(search.meets_slo(fake_summary(50, errors=5), max_error_rate=0.01))
+        self.assertFalse(search.meets_slo(None))
+        self.assertEqual(search.error_rate(fake_summary(50, requests=0)), 1.0)
+
+class SearchRequestsTest(unittest.TestCase):
+    def test_requests_keep_up_with_concurrency(self):
+        self.assertEqual(bees._search_requests(1000, 10, 10), 1000)
+        self.assertEqual(bees._search_requests(1000, 10, 15), 1500)
+        self.assertEqual(bees._search_requests(1000, 10, 1280), 128000)
+
+    def test_levels_near_n_still_plan(self):
+        instances = [{'id': 'i-%08x' % i, 'public_dns_name': 'bee%i' % i} for i in range(2)]
+
+        for level in (75, 99, 100, 101, 160):
+            n = bees._search_requests(100, 10, level)
+            params = bees._plan(instances, 'http://example.com/', n, level, 'ab', None, None, None, None, None, 'even', 0.25, None)
+
+            self.assertEqual(sum([p['concurrent_requests'] for p in params]), level)
+
+            for p in params:
+                self.assertTrue(p['concurrent_requests'] <= p['num_requests'])
+
+if __name__ == '__main__':
+    unittest.main()
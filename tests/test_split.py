@@ -0,0 +1,75 @@
+import unittest
+
+from beeswithmachineguns import bees
+
+class SplitTest(unittest.TestCase):
+    def test_shares_add_up_exactly(self):
+        for total in (0, 1, 7, 1000, 1001, 99999):
+            for weights in ([1], [1] * 3, [1] * 7, [2, 1, 1], [0.5, 3.25, 1, 9]):
+                shares = bees._split(total, weights)
+
+                self.assertEqual(sum(shares), total)
+                self.assertEqual(len(shares), len(weights))
+
+    def test_shares_follow_weights(self):
+        self.assertEqual(bees._split(100, [1, 1, 2]), [25, 25, 50])
+        self.assertEqual(bees._split(7, [1, 0, 1]), [4, 0, 3])
+
+    def test_remainder_goes_to_largest_losses(self):
+        self.assertEqual(bees._split(10, [1, 1, 1]), [4, 3, 3])
+        self.assertEqual(bees._split(5, [1, 3]), [1, 4])
+
+    def test_no_share_is_off_by_more_than_one(self):
+        weights = [3, 5, 7, 11, 13]
+        shares = bees._split(1000, weights)
+
+        for share, weight in zip(shares, weights):
+            self.assertTrue(abs(share - 1000.0 * weight / sum(weights)) < 1)
+
+class PlanTest(unittest.TestCase):
+    def plan(self, bee_count, n, c, **kwargs):
+        instances = [{'id': 'i-%08x' % i, 'public_dns_name': 'bee%i' % i} for i in range(bee_count)]
+
+        return bees._plan(instances, 'http://example.com/', n, c, 'ab', kwargs.get('rate'), None, 60, None, None, 'even', kwargs.get('spare', 0), None)
+
+    def test_totals_are_exact(self):
+        params = self.plan(6, 1001, 100)
+
+        self.assertEqual(sum([p['num_requests'] for p in params]), 1001)
+        self.assertEqual(sum([p['concurrent_requests'] for p in params]), 100)
+
+    def test_fewer_connections_than_bees(self):
+        params = self.plan(6, 1000, 4, spare=0.25)
+
+        self.assertEqual(len(params), 4)
+        self.assertEqual([p['concurrent_requests'] for p in params], [1, 1, 1, 1])
+        self.assertEqual(sum([p['num_requests'] for p in params]) + params[0]['spare_requests'], 1000)
+
+    def test_no_bee_has_more_connections_than_requests(self):
+        for n, c in ((100, 100), (110, 100), (101, 100), (1000, 999), (50, 100)):
+            params = self.plan(3, n, c, spare=0.25)
+
+            for p in params:
+                self.assertTrue(p['concurrent_requests'] <= p['num_requests'])
+
+            self.assertEqual(sum([p['num_requests'] for p in params]) + params[0]['spare_requests'], n)
+
+    def test_spare_is_only_what_connections_leave_over(self):
+        params = self.plan(2, 100, 100, spare=0.25)
+
+        self.assertEqual(params[0]['spare_requests'], 0)
+        self.assertEqual([(p['num_requests'], p['concurrent_requests']) for p in params], [(50, 50), (50, 50)])
+
+        params = self.plan(2, 110, 100, spare=0.25)
+
+        self.assertEqual(params[0]['spare_requests'], 10)
+        self.assertEqual(sum([p['concurrent_requests'] for p in params]), 100)
+
+    def test_rate_is_shared_by_firing_bees(self):
+        params = self.plan(6, 0, 2, rate=100)
+
+        self.assertEqual(len(params), 2)
+        self.assertEqual(sum([p['rate'] for p in params]), 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import math
+import unittest
+
+from beeswithmachineguns import histogram
+from beeswithmachineguns import timeline
+
+def bee_result(seconds, latency, clock_offset=0, errors=None):
+    """
+    A bee's result with count requests at latency ms in each of seconds, by
+    its own clock, given as {second: count}.
+    """
+    result = {
+        'clock_offset': clock_offset,
+        'latency_by_second': {},
+    }
+
+    for second, count in seconds.items():
+        histogram.record(result['latency_by_second'].setdefault(second, {}), latency, count)
+
+    if errors is not None:
+        result['errors_by_second'] = errors
+
+    return result
+
+class BuildTest(unittest.TestCase):
+    def test_merges_bees_on_one_clock(self):
+        # The second bee's clock runs 6 seconds ahead of ours
+        results = [
+            bee_result({100: 10, 101: 20}, 5, errors={101: 2}),
+            bee_result({106: 30, 107: 40}, 50, clock_offset=6, errors={}),
+        ]
+
+        series = timeline.build(results)
+
+        self.assertEqual(list(series['second']), [0, 1])
+        self.assertEqual(list(series['time']), [100, 101])
+        self.assertEqual(list(series['requests']), [40, 60])
+        self.assertEqual(list(series['errors']), [0, 2])
+        self.assertTrue(abs(series['p99'][1] - 50) <= 50 * histogram.RELATIVE_ERROR)
+        self.assertTrue(abs(series['p50'][0] - 50) <= 50 * histogram.RELATIVE_ERROR)
+
+    def test_gaps_are_filled(self):
+        series = timeline.build([bee_result({10: 5, 13: 5}, 1, errors={})])
+
+        self.assertEqual(list(series['requests']), [5, 0, 0, 5])
+        self.assertEqual(list(series['p99'])[1:3], [0, 0])
+
+    def test_windows(self):
+        series = timeline.build([bee_result({10: 1, 11: 2, 12: 3, 13: 4}, 1, errors={})], window=2)
+
+        self.assertEqual(list(series['requests']), [3, 7])
+        self.assertEqual(list(series['requests_per_second']), [1.5, 3.5])
+
+    def test_errors_unknown_without_errors_by_second(self):
+        series = timeline.build([bee_result({10: 1, 11: 1}, 1)])
+
+        self.assertTrue(all([math.isnan(errors) for errors in series['errors']]))
+
+    def test_errors_unknown_where_any_bee_didnt_count_them(self):
+        results = [
+            bee_result({10: 1, 11: 1}, 1, errors={10: 1, 11: 1}),
+            bee_result({11: 1, 12: 1}, 1),
+        ]
+
+        series = timeline.build(results)
+
+        self.assertEqual(series['errors'][0], 1)
+        self.assertTrue(math.isnan(series['errors'][1]))
+        self.assertTrue(math.isnan(series['errors'][2]))
+
+    def test_skips_bees_without_timings(self):
+        self.assertEqual(timeline.build([None, IOError('gone'), {'complete_requests': 5}]), None)
+
+        series = timeline.build([None, bee_result({3: 7}, 1)])
+
+        self.assertEqual(list(series['requests']), [7])
+
+if __name__ == '__main__':
+    unittest.main()